@@ -101,6 +101,7 @@ def process_project_type(project_directory: Path, project_type: str) -> None:
 
     if project_type == "empty":
         remove_directory(app_dir)
+        remove_directory(project_directory / "benchmarks")
         app_dir.mkdir(exist_ok=True)
         if run_py.exists():
             shutil.move(str(run_py), str(app_dir / "run.py"))
@@ -1,6 +1,6 @@
+import asyncio
 from contextlib import asynccontextmanager
 
-import joblib
 from loguru import logger
 from fastapi import FastAPI
 
@@ -11,23 +11,129 @@ from app.config.config import settings
 async def lifespan(app: FastAPI):
     # Before the app starts == @on_startup
     logger.info("Application starting")
+    start_http_client()
     load_model()
+    start_model_executor()
+    if settings.model.prediction_cache_enabled:
+        await start_model_prediction_cache()
+    if settings.model.batching_enabled:
+        await start_model_batcher()
+    start_model_warm_up()
+    if settings.model.reload_interval_s > 0:
+        start_model_watcher()
     yield
+    await stop_model_watcher()
+    await stop_model_warm_up()
+    await stop_model_batcher()
+    stop_model_executor()
+    await stop_model_prediction_cache()
     unload_model()
+    await stop_http_client()
     # After the app stops == @on_shutdown
 
 
 # Singleton pattern------------------------------------------------------------
 def load_model():
-    from services.predict import MachineLearningModelInference
-    MachineLearningModelInference.load(joblib.load)
+    from services.predict import (
+        MachineLearningModelInference,
+        ModelVersion,
+        load_model_with_report,
+        model_registry,
+    )
+    path = MachineLearningModelInference.get_path()
+    model_registry.register(
+        ModelVersion(settings.model.model_name, load_model_with_report(), path))
 
 
 def unload_model():
-    from services.predict import MachineLearningModelInference
+    from services.predict import MachineLearningModelInference, model_registry
+    model_registry.clear()
     MachineLearningModelInference.model = None
 
 
+# Runs in the background so /healthz answers while /readyz waits for it
+warm_up_task = None
+
+
+def start_model_warm_up():
+    global warm_up_task
+    from services.predict import model_registry, warm_up
+
+    async def run_warm_up():
+        try:
+            await warm_up(model_registry.resolve(model_registry.active))
+        except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+            raise
+        except BaseException as e:
+            # PredictException is a BaseException, /readyz reports it
+            logger.exception(f"Model warm-up failed: {str(e)}")
+
+    warm_up_task = asyncio.create_task(run_warm_up())
+
+
+async def stop_model_warm_up():
+    global warm_up_task
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+        try:
+            await warm_up_task
+        except asyncio.CancelledError:
+            pass
+        warm_up_task = None
+
+
+def start_model_watcher():
+    from services.predict import MachineLearningModelInference, model_registry
+    model_registry.start_watcher(MachineLearningModelInference.get_path(),
+                                 settings.model.reload_interval_s)
+
+
+async def stop_model_watcher():
+    from services.predict import model_registry
+    await model_registry.stop_watcher()
+
+
+def start_model_executor():
+    from services.predict import start_inference_executor
+    start_inference_executor()
+
+
+def stop_model_executor():
+    from services.predict import stop_inference_executor
+    stop_inference_executor()
+
+
+async def start_model_prediction_cache():
+    from services.predict import start_prediction_cache
+    await start_prediction_cache()
+
+
+async def stop_model_prediction_cache():
+    from services.predict import stop_prediction_cache
+    await stop_prediction_cache()
+
+
+async def start_model_batcher():
+    from services.predict import predict_active, start_batcher
+    await start_batcher(predict_active)
+
+
+async def stop_model_batcher():
+    from services.predict import stop_batcher
+    await stop_batcher()
+
+
+# Shared HTTP client-----------------------------------------------------------
+def start_http_client():
+    from app.gateways.http_client import start_http_session
+    start_http_session()
+
+
+async def stop_http_client():
+    from app.gateways.http_client import close_http_session
+    await close_http_session()
+
+
 # Global variable--------------------------------------------------------------
 ml_model = None  # GLOBAL VARIABLE
 
@@ -38,8 +144,10 @@ def get_ml_model():
 
 def load_ml_model() -> None:
     global ml_model
+    from services.predict import get_load_wrapper
     try:
-        ml_model = joblib.load(settings.model.model_path)
+        # An empty MODEL_MMAP_MODE turns memory mapping off
+        ml_model = get_load_wrapper()(settings.model.model_path)
     except Exception as e:
         logger.error(f"Error loading ML model: {str(e)}")
         raise
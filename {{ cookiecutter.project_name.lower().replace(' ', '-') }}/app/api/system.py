@@ -1,6 +1,10 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
 
-from app.schemas.schemas import HealthResponse
+from app.core.cache import get_cache_stats
+from app.core.metrics import registry
+from app.schemas.schemas import CacheStatsResponse, HealthResponse
+from services.predict import model_not_ready_reason
 
 
 system_router = APIRouter(prefix='', tags=["system"])
@@ -16,8 +20,8 @@ async def healthz():
         # add your logic here
         is_health = True
         return HealthResponse(status=is_health)
-    except Exception:
-        raise HTTPException(status_code=404, detail="Unhealthy")
+    except Exception as err:
+        raise HTTPException(status_code=404, detail="Unhealthy") from err
 
 
 @system_router.get(
@@ -25,17 +29,30 @@ async def healthz():
     response_model=HealthResponse,
 )
 async def readyz():
-    is_ready = False
     try:
         # add your logic here
+        reason = model_not_ready_reason()
+    except Exception as err:
+        raise HTTPException(status_code=404, detail="Unready") from err
+    if reason is not None:
+        raise HTTPException(status_code=404, detail=reason)
+    return HealthResponse(status=True)
 
-        # from services.predict import MachineLearningModelInference as model
-        # test_input = MachineLearningDataInput(
-        #     **json.loads(open(settings.model.input_example, "r").read())
-        # )
-        # test_point = test_input.get_np_array()
-        # model.predict(data_point, load_wrapper=joblib.load, method="predict")
-        is_ready = True
-        return HealthResponse(status=is_ready)
-    except Exception:
-        raise HTTPException(status_code=404, detail="Unready")
+
+@system_router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+)
+async def metrics():
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@system_router.get(
+    "/cache/stats",
+    response_model=CacheStatsResponse,
+)
+async def cache_stats():
+    return CacheStatsResponse(**await get_cache_stats())
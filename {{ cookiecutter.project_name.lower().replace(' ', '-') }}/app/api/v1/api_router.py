@@ -1,10 +1,16 @@
 from fastapi import APIRouter
 
 from app.api.v1.example_router import example_router
+from app.config.config import settings
 
 
 api_router = APIRouter(prefix="/v1")
 api_router.include_router(example_router, tags=["example"])
+if settings.model.admin_api_enabled:
+    # Admin endpoints authenticate superusers, which needs the user database
+    from app.api.v1.model_router import model_router
+
+    api_router.include_router(model_router, tags=["models"])
 
 # Add more routers to /v1 here:
 # api_router.include_router(users_router, tags=["users"])
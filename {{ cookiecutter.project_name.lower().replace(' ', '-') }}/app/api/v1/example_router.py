@@ -1,10 +1,24 @@
-import joblib
-from fastapi import APIRouter, HTTPException
+from typing import Optional
 
-from services.predict import MachineLearningModelInference as model
+import numpy as np
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+
+from app.config.config import settings
+from app.core import binary_formats
+from app.core.errors import (
+    InvalidPayloadError,
+    PayloadTooLargeError,
+    UnsupportedMediaTypeError,
+)
+from services.predict import model_registry, run_inference
 from schemas.schemas import (
+    FEATURE_NAMES,
     MachineLearningResponse,
     MachineLearningDataInput,
+    MachineLearningBatchResponse,
+    MachineLearningBatchDataInput,
 )
 
 example_router = APIRouter()
@@ -14,16 +28,117 @@ example_router = APIRouter()
     "/predict",
     response_model=MachineLearningResponse,
 )
-async def predict(data_input: MachineLearningDataInput):
+async def predict(data_input: MachineLearningDataInput,
+                  x_model_version: Optional[str] = Header(None)):
     if not data_input:
         raise HTTPException(status_code=404,
                             detail="'data_input' argument invalid!")
     try:
+        version = model_registry.resolve(x_model_version)
         data_point = data_input.get_np_array()
-        prediction = model.predict(data_point, load_wrapper=joblib.load,
-                                   method="predict")
+        prediction = await run_inference(data_point, version=version,
+                                         use_cache=True)
+
+    except HTTPException:
+        raise
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=f"Exception: {err}") from err
+
+    return MachineLearningResponse(
+        prediction=float(np.asarray(prediction).ravel()[0]),
+        model_version=version.name)
+
+
+def _inline_schema(model) -> dict:
+    # Request bodies declared through openapi_extra are not registered as
+    # components, so nested model definitions are resolved in place
+    schema = model.schema()
+    definitions = schema.pop("definitions", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(definitions[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+
+    return resolve(schema)
+
+
+_BATCH_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            binary_formats.JSON: {
+                "schema": _inline_schema(MachineLearningBatchDataInput)},
+            **{
+                kind: {"schema": {"type": "string", "format": "binary"}}
+                for kind in binary_formats.BINARY_MEDIA_TYPES
+            },
+        },
+    },
+}
+
+
+async def _read_batch(request: Request) -> np.ndarray:
+    body = await request.body()
+    content_type = request.headers.get("content-type")
+    if binary_formats.is_binary(content_type):
+        return binary_formats.decode_matrix(body, content_type, FEATURE_NAMES)
+    if binary_formats.media_type(content_type) != binary_formats.JSON:
+        raise UnsupportedMediaTypeError(
+            f"Unsupported content type '{content_type}'")
+    try:
+        data_input = MachineLearningBatchDataInput.parse_raw(body)
+    except ValidationError as err:
+        raise RequestValidationError(err.errors()) from err
+    return data_input.get_np_array()
+
+
+@example_router.post(
+    "/predict/batch",
+    response_model=MachineLearningBatchResponse,
+    responses={
+        200: {"content": {kind: {} for kind in binary_formats.BINARY_MEDIA_TYPES}}
+    },
+    openapi_extra=_BATCH_REQUEST_BODY,
+)
+async def predict_batch(request: Request,
+                        x_model_version: Optional[str] = Header(None)):
+    """Score many rows at once.
+
+    The body is JSON (``MachineLearningBatchDataInput``), an Arrow IPC
+    stream, a ``.npy`` array or raw little-endian float32 values, chosen by
+    Content-Type. Predictions are returned as JSON unless the Accept header
+    asks for one of the binary formats. ``X-Model-Version`` pins a model
+    version, otherwise the active (or canary) version is used.
+    """
+    try:
+        data_points = await _read_batch(request)
+        if not len(data_points):
+            raise InvalidPayloadError("Batch must contain at least one row")
+        max_size = settings.model.max_request_batch_size
+        if len(data_points) > max_size:
+            raise PayloadTooLargeError(
+                f"Batch of {len(data_points)} rows exceeds the limit of {max_size}")
+        version = model_registry.resolve(x_model_version)
+        predictions = await run_inference(data_points, allow_batching=False,
+                                          version=version)
 
+    except (HTTPException, RequestValidationError):
+        raise
     except Exception as err:
-        raise HTTPException(status_code=500, detail=f"Exception: {err}")
+        raise HTTPException(status_code=500, detail=f"Exception: {err}") from err
 
-    return MachineLearningResponse(prediction=prediction)
+    response_type = binary_formats.negotiate(request.headers.get("accept"))
+    if response_type != binary_formats.JSON:
+        return Response(
+            content=binary_formats.encode_predictions(predictions, response_type),
+            media_type=response_type,
+            headers={"X-Model-Version": version.name},
+        )
+    return MachineLearningBatchResponse(
+        predictions=np.asarray(predictions).ravel().tolist(),
+        model_version=version.name)
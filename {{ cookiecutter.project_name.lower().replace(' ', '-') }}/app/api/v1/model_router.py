@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.core.dependencies import get_current_active_superuser
+from services.predict import model_registry, resolve_model_path
+from schemas.schemas import (
+    ModelCanaryInput,
+    ModelRegistryResponse,
+    ModelVersionLoadInput,
+)
+
+model_router = APIRouter(
+    prefix="/models",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+
+
+@model_router.get(
+    "",
+    response_model=ModelRegistryResponse,
+)
+async def list_models():
+    return model_registry.describe()
+
+
+@model_router.post(
+    "/{name}",
+    response_model=ModelRegistryResponse,
+)
+async def load_model_version(name: str, data_input: ModelVersionLoadInput):
+    path = resolve_model_path(data_input.path)
+    try:
+        await model_registry.load(name, path, activate=data_input.activate)
+    except FileNotFoundError as err:
+        raise HTTPException(status_code=404, detail=str(err)) from err
+    except HTTPException:
+        raise
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=f"Exception: {err}") from err
+    return model_registry.describe()
+
+
+@model_router.post(
+    "/{name}/activate",
+    response_model=ModelRegistryResponse,
+)
+async def activate_model_version(name: str):
+    model_registry.activate(name)
+    return model_registry.describe()
+
+
+@model_router.put(
+    "/canary",
+    response_model=ModelRegistryResponse,
+)
+async def set_canary(data_input: ModelCanaryInput):
+    try:
+        model_registry.set_canary(data_input.name, data_input.weight)
+    except ValueError as err:
+        raise HTTPException(status_code=422, detail=str(err)) from err
+    return model_registry.describe()
+
+
+@model_router.delete(
+    "/{name}",
+    response_model=ModelRegistryResponse,
+)
+async def unload_model_version(name: str):
+    if name not in model_registry.versions:
+        raise HTTPException(status_code=404,
+                            detail=f"Model version '{name}' not found")
+    try:
+        model_registry.unload(name)
+    except ValueError as err:
+        raise HTTPException(status_code=409, detail=str(err)) from err
+    return model_registry.describe()
@@ -1,6 +1,6 @@
 import os
 from pydantic import BaseSettings, Field
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import yaml
 from pathlib import Path
 
@@ -58,6 +58,94 @@ class ModelSettings(BaseSettings):
     model_name: str = Field(..., env="MODEL_NAME")
     input_example: str = Field(..., env="INPUT_EXAMPLE")
 
+    # joblib mmap_mode ("r" shares NumPy arrays of uncompressed dumps
+    # between workers through the page cache), empty to load into memory
+    mmap_mode: Optional[str] = Field(default=None, env="MODEL_MMAP_MODE")
+
+    # Cache of predictions keyed on the input features and model version
+    prediction_cache_enabled: bool = Field(default=False,
+                                           env="MODEL_PREDICTION_CACHE_ENABLED")
+    prediction_cache_ttl: int = Field(default=300, env="MODEL_PREDICTION_CACHE_TTL")
+    prediction_cache_max_size: int = Field(default=10000,
+                                           env="MODEL_PREDICTION_CACHE_MAX_SIZE")
+
+    # Warm-up predictions run with input_example before /readyz turns ready
+    warmup_iterations: int = Field(default=3, env="MODEL_WARMUP_ITERATIONS")
+    warmup_batch_sizes: List[int] = Field(default=[1, 8, 32],
+                                          env="MODEL_WARMUP_BATCH_SIZES")
+
+    # Hot reload: poll the model file every N seconds (0 disables), keep a
+    # replaced version until its in-flight predictions drain
+    reload_interval_s: float = Field(default=0, env="MODEL_RELOAD_INTERVAL_S")
+    drain_timeout_s: float = Field(default=30, env="MODEL_DRAIN_TIMEOUT_S")
+    admin_api_enabled: bool = Field(default=False, env="MODEL_ADMIN_API_ENABLED")
+
+    # Dynamic micro-batching of concurrent /predict requests
+    batching_enabled: bool = Field(default=False, env="MODEL_BATCHING_ENABLED")
+    max_batch_size: int = Field(default=32, env="MODEL_MAX_BATCH_SIZE")
+    max_batch_wait_ms: float = Field(default=5.0, env="MODEL_MAX_BATCH_WAIT_MS")
+    max_queue_size: int = Field(default=1024, env="MODEL_MAX_QUEUE_SIZE")
+
+    # Upper bound on rows accepted by /predict/batch
+    max_request_batch_size: int = Field(default=10000,
+                                        env="MODEL_MAX_REQUEST_BATCH_SIZE")
+
+    # Where predict runs: "thread" for GIL-releasing models, "process" for
+    # pure-Python models, "inline" to run on the event loop
+    executor_type: str = Field(default="thread", env="MODEL_EXECUTOR_TYPE")
+    executor_workers: int = Field(default=1, env="MODEL_EXECUTOR_WORKERS")
+
+
+class CacheSettings(BaseSettings):
+    backend: str = Field(default="memory", env="CACHE_BACKEND")
+    namespace: str = Field(default="main", env="CACHE_NAMESPACE")
+    redis_host: str = Field(default="localhost", env="CACHE_REDIS_HOST")
+    redis_port: int = Field(default=6379, env="CACHE_REDIS_PORT")
+    memcached_host: str = Field(default="localhost", env="CACHE_MEMCACHED_HOST")
+    memcached_port: int = Field(default=11211, env="CACHE_MEMCACHED_PORT")
+
+    # In-process LRU tier in front of Redis/Memcached
+    local_tier_enabled: bool = Field(default=False, env="CACHE_LOCAL_TIER_ENABLED")
+    local_max_items: int = Field(default=10000, env="CACHE_LOCAL_MAX_ITEMS")
+    local_max_bytes: int = Field(default=64 * 1024 * 1024,
+                                 env="CACHE_LOCAL_MAX_BYTES")
+    local_ttl: int = Field(default=60, env="CACHE_LOCAL_TTL")
+
+    # Wire format for Redis/Memcached: pickle, orjson or msgpack
+    serializer: str = Field(default="pickle", env="CACHE_SERIALIZER")
+    # none, zstd or lz4, applied to payloads above the threshold
+    compression: str = Field(default="none", env="CACHE_COMPRESSION")
+    compression_threshold: int = Field(default=1024,
+                                       env="CACHE_COMPRESSION_THRESHOLD")
+
+
+class GatewaySettings(BaseSettings):
+    # Connection pool of the aiohttp session shared by all AsyncGateways
+    pool_limit: int = Field(default=100, env="GATEWAY_POOL_LIMIT")
+    # 0 means no per-host limit
+    pool_limit_per_host: int = Field(default=0, env="GATEWAY_POOL_LIMIT_PER_HOST")
+    keepalive_timeout: float = Field(default=15.0, env="GATEWAY_KEEPALIVE_TIMEOUT")
+    ttl_dns_cache: int = Field(default=300, env="GATEWAY_TTL_DNS_CACHE")
+
+    # Connections per host and worker threads of SyncGateway
+    sync_pool_size: int = Field(default=10, env="GATEWAY_SYNC_POOL_SIZE")
+    sync_max_workers: int = Field(default=8, env="GATEWAY_SYNC_MAX_WORKERS")
+
+    # Per-attempt timeouts in seconds
+    timeout: float = Field(default=10.0, env="GATEWAY_TIMEOUT")
+    connect_timeout: float = Field(default=3.0, env="GATEWAY_CONNECT_TIMEOUT")
+    # Attempts of idempotent requests, 1 disables retries
+    retry_attempts: int = Field(default=3, env="GATEWAY_RETRY_ATTEMPTS")
+    retry_backoff_base: float = Field(default=0.1, env="GATEWAY_RETRY_BACKOFF_BASE")
+    retry_backoff_max: float = Field(default=2.0, env="GATEWAY_RETRY_BACKOFF_MAX")
+    # Consecutive failures that open the circuit, and seconds until a trial call
+    circuit_failure_threshold: int = Field(default=5,
+                                           env="GATEWAY_CIRCUIT_FAILURE_THRESHOLD")
+    circuit_recovery_timeout: float = Field(default=30.0,
+                                            env="GATEWAY_CIRCUIT_RECOVERY_TIMEOUT")
+    # Send a second GET when the first is slower than this, 0 disables hedging
+    hedge_after_ms: float = Field(default=0, env="GATEWAY_HEDGE_AFTER_MS")
+
 
 class Settings(BaseSettings):
     environment: str = Field(default="development", env="ENVIRONMENT")
@@ -68,6 +156,8 @@ class Settings(BaseSettings):
     api: APISettings = APISettings()
     security: SecuritySettings = SecuritySettings()
     model: ModelSettings = ModelSettings()
+    cache: CacheSettings = CacheSettings()
+    gateway: GatewaySettings = GatewaySettings()
 
     class Config:
         env_file = "dotenv/.env"
@@ -0,0 +1,138 @@
+import io
+from typing import Optional, Sequence
+
+import numpy as np
+
+from app.core.errors import InvalidPayloadError, UnsupportedMediaTypeError
+
+
+JSON = "application/json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+NPY = "application/x-npy"
+# Raw little-endian float32 values, row-major
+FLOAT32 = "application/octet-stream"
+
+BINARY_MEDIA_TYPES = (ARROW_STREAM, NPY, FLOAT32)
+
+
+def media_type(header: Optional[str]) -> str:
+    """Strip parameters from a Content-Type header: 'a/b; q=1' -> 'a/b'."""
+    if not header:
+        return JSON
+    return header.split(";", 1)[0].strip().lower()
+
+
+def is_binary(header: Optional[str]) -> bool:
+    return media_type(header) in BINARY_MEDIA_TYPES
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Pick the response media type from an Accept header.
+
+    Binary encodings are only used when the client asks for them
+    explicitly, everything else falls back to JSON.
+    """
+    if not accept:
+        return JSON
+    for candidate in accept.split(","):
+        candidate = media_type(candidate)
+        if candidate in BINARY_MEDIA_TYPES:
+            return candidate
+    return JSON
+
+
+def _decode_npy(body: bytes) -> np.ndarray:
+    stream = io.BytesIO(body)
+    try:
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    except ValueError as err:
+        raise InvalidPayloadError(f"Invalid .npy payload: {err}") from err
+    # Only plain numbers, no objects, strings, datetimes or structs
+    if dtype.kind not in "biuf":
+        raise InvalidPayloadError(
+            f"Only boolean, integer and float arrays are accepted, got {dtype}")
+    count = int(np.prod(shape))
+    if len(body) - stream.tell() != count * dtype.itemsize:
+        raise InvalidPayloadError(
+            f"Invalid .npy payload: {shape} {dtype} array needs "
+            f"{count * dtype.itemsize} bytes, got {len(body) - stream.tell()}")
+    # View into the request body instead of copying it
+    array = np.frombuffer(body, dtype=dtype, count=count, offset=stream.tell())
+    return array.reshape(shape, order="F" if fortran_order else "C")
+
+
+def _decode_float32(body: bytes, n_features: int) -> np.ndarray:
+    row_size = 4 * n_features
+    if len(body) % row_size:
+        raise InvalidPayloadError(
+            f"Raw float32 payload must be a multiple of {row_size} bytes")
+    return np.frombuffer(body, dtype="<f4").reshape(-1, n_features)
+
+
+def _decode_arrow(body: bytes, feature_names: Sequence[str]) -> np.ndarray:
+    try:
+        import pyarrow as pa
+    except ImportError as err:
+        raise UnsupportedMediaTypeError(
+            f"{ARROW_STREAM} requires the 'pyarrow' package") from err
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except pa.ArrowInvalid as err:
+        raise InvalidPayloadError(f"Invalid Arrow stream: {err}") from err
+    if set(feature_names).issubset(table.column_names):
+        columns = [table.column(name) for name in feature_names]
+    elif table.num_columns == len(feature_names):
+        columns = table.columns
+    else:
+        raise InvalidPayloadError(
+            f"Arrow stream must contain the columns {list(feature_names)}")
+    if any(column.null_count for column in columns):
+        raise InvalidPayloadError("Arrow columns must not contain nulls")
+    return np.column_stack([column.to_numpy() for column in columns])
+
+
+def decode_matrix(body: bytes, content_type: Optional[str],
+                  feature_names: Sequence[str]) -> np.ndarray:
+    """Decode a binary request body into a 2-D feature matrix."""
+    kind = media_type(content_type)
+    if kind == NPY:
+        matrix = _decode_npy(body)
+    elif kind == FLOAT32:
+        matrix = _decode_float32(body, len(feature_names))
+    elif kind == ARROW_STREAM:
+        matrix = _decode_arrow(body, feature_names)
+    else:
+        raise UnsupportedMediaTypeError(f"Unsupported content type '{kind}'")
+    if matrix.ndim == 1 and matrix.size == len(feature_names):
+        matrix = matrix.reshape(1, -1)
+    if matrix.ndim != 2 or matrix.shape[1] != len(feature_names):
+        raise InvalidPayloadError(
+            f"Expected a (n, {len(feature_names)}) matrix, got {matrix.shape}")
+    return matrix
+
+
+def encode_predictions(predictions, kind: str) -> bytes:
+    """Encode a vector of predictions in one of ``BINARY_MEDIA_TYPES``."""
+    predictions = np.asarray(predictions).ravel()
+    if kind == NPY:
+        buffer = io.BytesIO()
+        np.lib.format.write_array(buffer, predictions, allow_pickle=False)
+        return buffer.getvalue()
+    if kind == FLOAT32:
+        return predictions.astype("<f4", copy=False).tobytes()
+    if kind == ARROW_STREAM:
+        try:
+            import pyarrow as pa
+        except ImportError as err:
+            raise UnsupportedMediaTypeError(
+                f"{ARROW_STREAM} requires the 'pyarrow' package") from err
+        table = pa.table({"prediction": predictions})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    raise UnsupportedMediaTypeError(f"Unsupported response type '{kind}'")
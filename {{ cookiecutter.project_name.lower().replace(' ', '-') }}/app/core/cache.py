@@ -1,22 +1,384 @@
+import asyncio
+import math
+import random
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
 from aiocache import Cache
-from aiocache.serializers import PickleSerializer
 from functools import wraps
+from loguru import logger
+from app.core.metrics import registry
+from app.core.serializers import get_serializer
 from config.config import settings
 
 
-cache = Cache(Cache.MEMORY)
+_MISSING = object()
+
+CACHE_REQUESTS_TOTAL = registry.counter(
+    "cache_requests_total", "Cache lookups by result",
+    labelnames=("namespace", "result"))
+CACHE_ERRORS_TOTAL = registry.counter(
+    "cache_errors_total", "Failed cache operations",
+    labelnames=("namespace", "operation"))
+CACHE_OPERATION_SECONDS = registry.histogram(
+    "cache_operation_seconds", "Latency of cache operations",
+    labelnames=("namespace", "operation"),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+             0.05, 0.1, 0.25, 1.0))
+CACHE_PAYLOAD_BYTES = registry.histogram(
+    "cache_payload_bytes", "Approximate size of values written to the cache",
+    labelnames=("namespace",),
+    buckets=(64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+CACHED_FUNCTION_CALLS_TOTAL = registry.counter(
+    "cache_function_calls_total", "Calls of cached functions by result",
+    labelnames=("function", "result"))
+
+LOCAL_TIER_ITEMS = registry.gauge(
+    "cache_local_items", "Entries in the in-process cache tier")
+LOCAL_TIER_BYTES = registry.gauge(
+    "cache_local_bytes", "Approximate size of the in-process cache tier")
+LOCAL_TIER_EVICTIONS_TOTAL = registry.counter(
+    "cache_local_evictions_total", "Entries evicted from the in-process tier",
+    labelnames=("reason",))
+
+
+# Примерный размер значения: numpy-массивы и байты считаются точно,
+# контейнеры - по элементам, остальное - через sys.getsizeof
+def _estimate_size(value):
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, (tuple, list, set)):
+        return sys.getsizeof(value) + sum(_estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            _estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class LocalLRUCache:
+    """In-process LRU cache bounded by entry count, bytes and TTL."""
+
+    def __init__(self, max_items=10000, max_bytes=64 * 1024 * 1024, ttl=60):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        LOCAL_TIER_ITEMS.set_function(lambda: len(self._data))
+        LOCAL_TIER_BYTES.set_function(lambda: self.current_bytes)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._pop(key)
+            LOCAL_TIER_EVICTIONS_TOTAL.inc(reason="expired")
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        size = _estimate_size(value)
+        self._pop(key)
+        if size > self.max_bytes:
+            return
+        self._data[key] = (value, time.monotonic() + ttl, size)
+        self.current_bytes += size
+        while len(self._data) > self.max_items or self.current_bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._pop(oldest)
+            LOCAL_TIER_EVICTIONS_TOTAL.inc(reason="capacity")
+
+    def delete(self, key):
+        return self._pop(key) is not None
+
+    def clear(self):
+        self._data.clear()
+        self.current_bytes = 0
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+        return entry
+
+
+class RedisInvalidator:
+    """Broadcast evictions of the local tier to every worker over pub/sub."""
+
+    CLEAR_ALL = "*"
+
+    def __init__(self, local, host, port, channel, reconnect_base=0.1, reconnect_max=5.0):
+        self.local = local
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self.reconnect_base = reconnect_base
+        self.reconnect_max = reconnect_max
+        self._host, self._port = host, port
+        self._client = None
+        self._listener: Optional["asyncio.Task[None]"] = None
+
+    async def start(self):
+        from redis import asyncio as aioredis
+
+        self._client = aioredis.Redis(host=self._host, port=self._port)
+        pubsub = await self._subscribe()
+        self._listener = asyncio.get_running_loop().create_task(self._run(pubsub))
+
+    async def _subscribe(self):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel)
+        except BaseException:
+            await pubsub.close()
+            raise
+        return pubsub
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    # Несколько ключей отправляются одним сообщением, по одному на строку
+    async def publish(self, *keys):
+        if self._client is not None and keys:
+            await self._client.publish(self.channel, f"{self.origin}:" + "\n".join(keys))
+
+    # Слушатель переподключается с экспоненциальной задержкой. Пока подписки
+    # не было, сообщения об инвалидации могли потеряться, поэтому после
+    # переподключения локальный уровень очищается целиком
+    async def _run(self, pubsub):
+        attempt = 0
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = await self._subscribe()
+                    self.local.clear()
+                    logger.info(f"Cache invalidation listener reconnected to {self.channel}")
+                attempt = 0
+                await self._listen(pubsub)
+                logger.warning(f"Cache invalidation subscription to {self.channel} ended")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener failed: {e}")
+            pubsub = None
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.reconnect_max, self.reconnect_base * 2 ** attempt))
+
+    async def _listen(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                data = message["data"]
+                origin, _, keys = (data.decode() if isinstance(data, bytes) else data).partition(":")
+                if origin == self.origin:
+                    continue
+                for key in keys.split("\n"):
+                    if key == self.CLEAR_ALL:
+                        self.local.clear()
+                    else:
+                        self.local.delete(key)
+        finally:
+            await pubsub.close()
+
+
+class TieredCache:
+    """Local LRU tier in front of a remote aiocache backend.
+
+    Reads are served from the local tier when possible. Writes and deletes
+    go to both tiers and are broadcast so other workers drop their local
+    copies; without an invalidator the local TTL bounds staleness.
+    """
+
+    def __init__(self, remote, local, invalidator=None):
+        self.remote = remote
+        self.local = local
+        self.invalidator = invalidator
+
+    async def get(self, key, default=None, **kwargs):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = await self.remote.get(key, **kwargs)
+        if value is None:
+            return default
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key, value, ttl=None, **kwargs):
+        result = await self.remote.set(key, value, ttl=ttl, **kwargs)
+        self.local.set(key, value, ttl=ttl)
+        await self._invalidate(key)
+        return result
+
+    async def multi_get(self, keys, **kwargs):
+        values = [self.local.get(key, _MISSING) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is _MISSING]
+        if missing:
+            remote_values = await self.remote.multi_get([keys[i] for i in missing], **kwargs)
+            for index, value in zip(missing, remote_values):
+                values[index] = value
+                if value is not None:
+                    self.local.set(keys[index], value)
+        return values
+
+    async def multi_set(self, pairs, ttl=None, **kwargs):
+        pairs = list(pairs)
+        result = await self.remote.multi_set(pairs, ttl=ttl, **kwargs)
+        for key, value in pairs:
+            self.local.set(key, value, ttl=ttl)
+        await self._invalidate(*(key for key, _ in pairs))
+        return result
+
+    async def delete(self, key, **kwargs):
+        self.local.delete(key)
+        result = await self.remote.delete(key, **kwargs)
+        await self._invalidate(key)
+        return result
+
+    async def delete_many(self, keys):
+        keys = list(keys)
+        for key in keys:
+            self.local.delete(key)
+        result = await _multi_delete(self.remote, keys)
+        await self._invalidate(*keys)
+        return result
+
+    async def clear(self, **kwargs):
+        self.local.clear()
+        result = await self.remote.clear(**kwargs)
+        await self._invalidate(RedisInvalidator.CLEAR_ALL)
+        return result
+
+    async def close(self):
+        if self.invalidator is not None:
+            await self.invalidator.close()
+        await self.remote.close()
+
+    async def _invalidate(self, *keys):
+        if self.invalidator is None:
+            return
+        try:
+            await self.invalidator.publish(*keys)
+        except Exception as e:
+            logger.warning(f"Cache invalidation of {', '.join(keys)} failed: {e}")
+
+
+# Удаление нескольких ключей: в Redis - одной командой DEL,
+# у остальных бэкендов aiocache мульти-удаления нет
+async def _multi_delete(backend, keys):
+    if not keys:
+        return 0
+    if getattr(backend, "NAME", None) == "redis":
+        return await backend.raw("delete", *(backend.build_key(key) for key in keys))
+    return sum(await asyncio.gather(*(backend.delete(key) for key in keys)))
+
+
+class InstrumentedCache:
+    """Record hit/miss/error counts, latency and payload sizes of a cache."""
+
+    def __init__(self, inner, namespace):
+        self.inner = inner
+        self.namespace = namespace
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    async def _call(self, operation, coroutine):
+        start_time = time.perf_counter()
+        try:
+            return await coroutine
+        except Exception:
+            CACHE_ERRORS_TOTAL.inc(namespace=self.namespace, operation=operation)
+            raise
+        finally:
+            CACHE_OPERATION_SECONDS.observe(time.perf_counter() - start_time,
+                                            namespace=self.namespace,
+                                            operation=operation)
+
+    def _count(self, hits, misses):
+        if hits:
+            CACHE_REQUESTS_TOTAL.inc(hits, namespace=self.namespace, result="hit")
+        if misses:
+            CACHE_REQUESTS_TOTAL.inc(misses, namespace=self.namespace, result="miss")
+
+    async def get(self, key, default=None, **kwargs):
+        value = await self._call("get", self.inner.get(key, **kwargs))
+        self._count(value is not None, value is None)
+        return default if value is None else value
+
+    async def multi_get(self, keys, **kwargs):
+        values = await self._call("multi_get", self.inner.multi_get(keys, **kwargs))
+        misses = sum(value is None for value in values)
+        self._count(len(values) - misses, misses)
+        return values
+
+    async def set(self, key, value, ttl=None, **kwargs):
+        CACHE_PAYLOAD_BYTES.observe(_estimate_size(value), namespace=self.namespace)
+        return await self._call("set", self.inner.set(key, value, ttl=ttl, **kwargs))
+
+    async def multi_set(self, pairs, ttl=None, **kwargs):
+        pairs = list(pairs)
+        for _, value in pairs:
+            CACHE_PAYLOAD_BYTES.observe(_estimate_size(value), namespace=self.namespace)
+        return await self._call("multi_set",
+                                self.inner.multi_set(pairs, ttl=ttl, **kwargs))
+
+    async def delete(self, key, **kwargs):
+        return await self._call("delete", self.inner.delete(key, **kwargs))
+
+    async def delete_many(self, keys):
+        keys = list(keys)
+        if isinstance(self.inner, TieredCache):
+            return await self._call("delete_many", self.inner.delete_many(keys))
+        return await self._call("delete_many", _multi_delete(self.inner, keys))
+
+    async def clear(self, **kwargs):
+        return await self._call("clear", self.inner.clear(**kwargs))
+
+    async def close(self):
+        await self.inner.close()
+
+
+cache = InstrumentedCache(Cache(Cache.MEMORY), settings.cache.namespace)
 
 
 # Функция для создания кэша в зависимости от настроек
 async def setup_cache():
     global cache
+    serializer = get_serializer(
+        settings.cache.serializer,
+        compression=settings.cache.compression,
+        threshold=settings.cache.compression_threshold,
+    )
     if settings.cache.backend == "redis":
         from aiocache import RedisCache
         cache = RedisCache(
             endpoint=settings.cache.redis_host,
             port=settings.cache.redis_port,
             namespace=settings.cache.namespace,
-            serializer=PickleSerializer()
+            serializer=serializer
         )
     elif settings.cache.backend == "memcached":
         from aiocache import MemcachedCache
@@ -24,28 +386,196 @@ async def setup_cache():
             endpoint=settings.cache.memcached_host,
             port=settings.cache.memcached_port,
             namespace=settings.cache.namespace,
-            serializer=PickleSerializer()
+            serializer=serializer
         )
     else:
         # По умолчанию используем in-memory кэш
-        cache = Cache(Cache.MEMORY, namespace=settings.cache.namespace)
+        cache = InstrumentedCache(Cache(Cache.MEMORY, namespace=settings.cache.namespace),
+                                  settings.cache.namespace)
+        return
+
+    # Локальный уровень перед Redis/Memcached
+    if settings.cache.local_tier_enabled:
+        local = LocalLRUCache(
+            max_items=settings.cache.local_max_items,
+            max_bytes=settings.cache.local_max_bytes,
+            ttl=settings.cache.local_ttl,
+        )
+        invalidator = None
+        if settings.cache.backend == "redis":
+            invalidator = RedisInvalidator(
+                local,
+                host=settings.cache.redis_host,
+                port=settings.cache.redis_port,
+                channel=f"{settings.cache.namespace}:invalidate",
+            )
+            await invalidator.start()
+        else:
+            logger.warning("Memcached has no pub/sub: local cache entries of other "
+                           f"workers expire after {local.ttl}s")
+        cache = TieredCache(cache, local, invalidator)
+    cache = InstrumentedCache(cache, settings.cache.namespace)
+
+
+# Функция для закрытия соединений кэша
+async def close_cache():
+    await cache.close()
+
+
+# Вычисления, которые сейчас выполняются, по ключу кэша (single-flight)
+_in_flight: Dict[str, "asyncio.Future[Any]"] = {}
+_background_refreshes: Set["asyncio.Task[Any]"] = set()
+
+
+def _function_name(func):
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+# Ключ по умолчанию: имя функции и её аргументы
+def _default_key(func, args, kwargs):
+    return f"{_function_name(func)}:{args}:{sorted(kwargs.items())}"
+
+
+# Конкурентные вызовы с одним ключом ждут одно вычисление. Оно идет в
+# отдельной задаче: отмена одного из ожидающих (в том числе первого) не
+# отменяет вычисление для остальных
+async def single_flight(key, compute):
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(compute())
+        _in_flight[key] = task
+        task.add_done_callback(lambda t: _finish_flight(key, t))
+    return await asyncio.shield(task)
+
+
+def _finish_flight(key, task):
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+    # Ошибку получат ожидающие, если они есть
+    if not task.cancelled():
+        task.exception()
+
+
+# Фоновое обновление значения, не более одного на ключ
+def _refresh_in_background(key, compute):
+    if key in _in_flight:
+        return
+    task = asyncio.get_running_loop().create_task(single_flight(key, compute))
+    _background_refreshes.add(task)
+    task.add_done_callback(_background_refreshes.discard)
+    task.add_done_callback(
+        lambda t: t.cancelled() or t.exception() is None
+        or logger.warning(f"Cache refresh of {key} failed: {t.exception()}"))
 
 
 # Декоратор для кэширования результатов функций
-def cached(ttl=300, key_builder=None):
+#
+# Значение хранится вместе со временем истечения и длительностью вычисления:
+# (value, expires_at, delta). Конкурентные промахи по одному ключу вызывают
+# функцию один раз. stale_ttl - сколько секунд после истечения отдавать
+# устаревшее значение, обновляя его в фоне (stale-while-revalidate).
+# early_expiration_beta > 0 включает вероятностное раннее обновление
+# (XFetch): чем дольше вычисление и ближе истечение, тем вероятнее
+# обновление до истечения, что разносит обновления популярных ключей.
+def cached(ttl=300, key_builder=None, stale_ttl=0, early_expiration_beta=0.0):
     def wrapper(func):
+        name = _function_name(func)
+
         @wraps(func)
         async def wrapped(*args, **kwargs):
-            key = key_builder(*args, **kwargs) if key_builder else Cache.KEY_BUILDER(*args, **kwargs)
-            result = await cache.get(key)
-            if result is None:
-                result = await func(*args, **kwargs)
-                await cache.set(key, result, ttl=ttl)
+            key = key_builder(*args, **kwargs) if key_builder else _default_key(func, args, kwargs)
+
+            async def compute():
+                start_time = time.monotonic()
+                try:
+                    value = await func(*args, **kwargs)
+                except Exception:
+                    CACHED_FUNCTION_CALLS_TOTAL.inc(function=name, result="error")
+                    raise
+                delta = time.monotonic() - start_time
+                await cache.set(key, (value, time.time() + ttl, delta),
+                                ttl=ttl + stale_ttl)
+                return value
+
+            entry = await cache.get(key)
+            if entry is None:
+                CACHED_FUNCTION_CALLS_TOTAL.inc(function=name, result="miss")
+                return await single_flight(key, compute)
+            result, expires_at, delta = entry
+            now = time.time()
+            if now >= expires_at + stale_ttl:
+                CACHED_FUNCTION_CALLS_TOTAL.inc(function=name, result="miss")
+                return await single_flight(key, compute)
+            if now >= expires_at:
+                CACHED_FUNCTION_CALLS_TOTAL.inc(function=name, result="stale")
+                _refresh_in_background(key, compute)
+                return result
+            CACHED_FUNCTION_CALLS_TOTAL.inc(function=name, result="hit")
+            if early_expiration_beta and (
+                now - delta * early_expiration_beta * math.log(1 - random.random())
+                >= expires_at
+            ):
+                _refresh_in_background(key, compute)
             return result
         return wrapped
     return wrapper
 
 
+# Декоратор для кэширования функций, принимающих список элементов
+#
+# Первый аргумент функции - список элементов, результат - список значений
+# в том же порядке. Ключи всех элементов читаются одним multi_get, функция
+# вызывается один раз только для промахов, результаты записываются одним
+# multi_set. key_builder получает элемент и остальные аргументы.
+def cached_batch(ttl=300, key_builder=None):
+    def wrapper(func):
+        name = _function_name(func)
+
+        @wraps(func)
+        async def wrapped(items, *args, **kwargs):
+            items = list(items)
+            if not items:
+                return []
+            keys = [
+                key_builder(item, *args, **kwargs) if key_builder
+                else _default_key(func, (item,) + args, kwargs)
+                for item in items
+            ]
+            results: List[Any] = [None] * len(items)
+            # Индексы элементов с промахом по ключу, повторы считаются один раз
+            missing: Dict[str, List[int]] = {}
+            for index, (key, entry) in enumerate(zip(keys, await get_many(keys))):
+                if entry is None:
+                    missing.setdefault(key, []).append(index)
+                else:
+                    # Значение хранится в кортеже, чтобы кэшировать и None
+                    results[index] = entry[0]
+            misses = sum(len(indexes) for indexes in missing.values())
+            if misses < len(items):
+                CACHED_FUNCTION_CALLS_TOTAL.inc(len(items) - misses, function=name,
+                                                result="hit")
+            if not missing:
+                return results
+
+            CACHED_FUNCTION_CALLS_TOTAL.inc(misses, function=name, result="miss")
+            try:
+                values = list(await func([items[indexes[0]] for indexes in missing.values()],
+                                         *args, **kwargs))
+            except Exception:
+                CACHED_FUNCTION_CALLS_TOTAL.inc(function=name, result="error")
+                raise
+            if len(values) != len(missing):
+                raise ValueError(f"{func.__qualname__} returned {len(values)} results "
+                                 f"for {len(missing)} items")
+            for indexes, value in zip(missing.values(), values):
+                for index in indexes:
+                    results[index] = value
+            await set_many({key: (value,) for key, value in zip(missing, values)}, ttl=ttl)
+            return results
+        return wrapped
+    return wrapper
+
+
 # Функция для очистки кэша
 async def clear_cache():
     await cache.clear()
@@ -66,6 +596,83 @@ async def delete_cached(key):
     await cache.delete(key)
 
 
+# Функция для получения нескольких значений за один запрос
+async def get_many(keys):
+    keys = list(keys)
+    if not keys:
+        return []
+    return await cache.multi_get(keys)
+
+
+# Функция для установки нескольких значений за один запрос
+async def set_many(items, ttl=None):
+    pairs = list(items.items() if isinstance(items, dict) else items)
+    if pairs:
+        await cache.multi_set(pairs, ttl=ttl)
+
+
+# Функция для удаления нескольких значений
+async def delete_many(keys):
+    keys = list(keys)
+    if keys:
+        await cache.delete_many(keys)
+
+
+def _ratio(hits, misses):
+    total = hits + misses
+    return hits / total if total else None
+
+
+# Статистика сервера: попадания, промахи и вытеснения по данным Redis/Memcached
+async def _server_stats(backend):
+    try:
+        if settings.cache.backend == "redis":
+            info = await backend.raw("info", "stats")
+            fields = ("keyspace_hits", "keyspace_misses", "evicted_keys", "expired_keys")
+        elif settings.cache.backend == "memcached":
+            info = {k.decode(): v.decode() for k, v in (await backend.raw("stats")).items()}
+            fields = ("get_hits", "get_misses", "evictions", "curr_items", "bytes")
+        else:
+            return None
+    except Exception as e:
+        logger.warning(f"Failed to read cache server stats: {e}")
+        return None
+    return {field: int(info[field]) for field in fields if field in info}
+
+
 # Функция для получения статистики кэша
 async def get_cache_stats():
-    return await cache.get_stats()
+    requests = {labels["result"]: value for labels, value in CACHE_REQUESTS_TOTAL.collect()
+                if labels["namespace"] == cache.namespace}
+    errors = sum(value for labels, value in CACHE_ERRORS_TOTAL.collect()
+                 if labels["namespace"] == cache.namespace)
+    functions: Dict[str, Dict[str, Any]] = {}
+    for labels, value in CACHED_FUNCTION_CALLS_TOTAL.collect():
+        functions.setdefault(labels["function"], {})[labels["result"]] = int(value)
+    for counts in functions.values():
+        counts["hit_ratio"] = _ratio(counts.get("hit", 0) + counts.get("stale", 0),
+                                     counts.get("miss", 0))
+
+    backend = cache.inner
+    local_tier = None
+    if isinstance(backend, TieredCache):
+        local_tier = {
+            "items": len(backend.local),
+            "bytes": backend.local.current_bytes,
+            "evictions": {labels["reason"]: int(value)
+                          for labels, value in LOCAL_TIER_EVICTIONS_TOTAL.collect()},
+        }
+        backend = backend.remote
+
+    hits, misses = int(requests.get("hit", 0)), int(requests.get("miss", 0))
+    return {
+        "backend": settings.cache.backend,
+        "namespace": cache.namespace,
+        "hits": hits,
+        "misses": misses,
+        "errors": int(errors),
+        "hit_ratio": _ratio(hits, misses),
+        "functions": functions,
+        "local_tier": local_tier,
+        "server": await _server_stats(backend),
+    }
@@ -0,0 +1,216 @@
+"""Run a MessageProcessor in several worker processes.
+
+    python -m app.core.consumer_runner app.workers:build_processor orders --processes 4
+
+``app.workers:build_processor`` is any importable callable returning a
+``MessageProcessor`` with a fresh ``MessageQueue``. Every process opens its
+own connection and joins the same Kafka consumer group or consumes the same
+RabbitMQ queues as a competing consumer.
+"""
+import argparse
+import asyncio
+import importlib
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+from typing import Callable, List, Optional, Sequence, Union
+
+from loguru import logger
+
+from app.core.message_queue import MessageProcessor
+
+
+ProcessorFactory = Union[str, Callable[[], MessageProcessor]]
+
+
+def load_factory(factory: ProcessorFactory) -> Callable[[], MessageProcessor]:
+    """Resolve a ``module:attribute`` path, callables are returned as is."""
+    if callable(factory):
+        return factory
+    module_name, _, attribute = factory.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Expected 'module:attribute', got '{factory}'")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+async def run_processor(processor: MessageProcessor, topics: List[str],
+                        shutdown_timeout: float = 30.0) -> None:
+    """Consume until SIGTERM or SIGINT, then drain and close the queue.
+
+    On a signal the processor stops taking messages, finishes and commits
+    the ones in flight within ``shutdown_timeout`` seconds and closes its
+    connection. Errors of the consume loop are raised.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    consuming = asyncio.ensure_future(processor.process_messages(topics))
+    stopping = asyncio.ensure_future(stop.wait())
+    try:
+        await asyncio.wait({consuming, stopping},
+                           return_when=asyncio.FIRST_COMPLETED)
+        if consuming.done():
+            consuming.result()
+            # RabbitMQ consumers only register callbacks and return
+            await stopping
+
+        async def drain():
+            await processor.stop()
+            await consuming
+
+        try:
+            await asyncio.wait_for(drain(), shutdown_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Messages still in flight after {shutdown_timeout}s, "
+                           f"stopping without them")
+    finally:
+        stopping.cancel()
+        consuming.cancel()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+        await processor.queue.close()
+
+
+def _worker_main(factory: ProcessorFactory, topics: List[str],
+                 shutdown_timeout: float) -> None:
+    try:
+        processor = load_factory(factory)()
+        asyncio.run(run_processor(processor, topics, shutdown_timeout))
+    except Exception as e:
+        logger.exception(f"Consumer failed: {str(e)}")
+        sys.exit(1)
+
+
+class ConsumerRunner:
+    """Supervise ``processes`` consumer processes.
+
+    A worker that exits while the runner is running is restarted after an
+    exponential backoff, reset once the worker stayed up for
+    ``max_restart_backoff`` seconds. SIGTERM or SIGINT is forwarded to the
+    workers, which drain their in-flight messages; workers still running
+    ``shutdown_timeout`` seconds later are killed.
+    """
+
+    # Time workers get on top of their own drain timeout before being killed
+    KILL_GRACE = 5.0
+
+    def __init__(self, factory: ProcessorFactory, topics: Sequence[str],
+                 processes: Optional[int] = None, shutdown_timeout: float = 30.0,
+                 restart_backoff: float = 1.0, max_restart_backoff: float = 30.0):
+        self.factory = factory
+        self.topics = list(topics)
+        self.processes = processes or os.cpu_count() or 1
+        self.shutdown_timeout = shutdown_timeout
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.restarts = 0
+        # Workers start a fresh interpreter, forking a process that already
+        # runs an event loop or holds broker connections is unsafe
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[Optional[BaseProcess]] = [None] * self.processes
+        self._started_at = [0.0] * self.processes
+        self._restart_at = [0.0] * self.processes
+        self._failures = [0] * self.processes
+        self._stopping = threading.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _on_signal(self, signum, frame) -> None:
+        logger.info(f"Received signal {signum}, stopping consumers")
+        self.stop()
+
+    def run(self) -> int:
+        """Run until stopped, return 0 if every worker exited cleanly."""
+        handlers = {signum: signal.signal(signum, self._on_signal)
+                    for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for index in range(self.processes):
+                self._start(index)
+            while not self._stopping.is_set():
+                self._supervise()
+            return self._shutdown()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def _start(self, index: int) -> None:
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.factory, self.topics, self.shutdown_timeout),
+            name=f"consumer-{index}",
+        )
+        process.start()
+        self._workers[index] = process
+        self._started_at[index] = time.monotonic()
+        logger.info(f"Started {process.name} (pid {process.pid})")
+
+    def _supervise(self) -> None:
+        sentinels = [process.sentinel for process in self._workers
+                     if process is not None]
+        if sentinels:
+            wait(sentinels, timeout=0.5)
+        else:
+            self._stopping.wait(0.5)
+
+        now = time.monotonic()
+        for index, process in enumerate(self._workers):
+            if self._stopping.is_set():
+                return
+            if process is not None:
+                if process.exitcode is None:
+                    continue
+                if now - self._started_at[index] >= self.max_restart_backoff:
+                    self._failures[index] = 0
+                self._failures[index] += 1
+                delay = min(self.restart_backoff * 2 ** (self._failures[index] - 1),
+                            self.max_restart_backoff)
+                logger.warning(f"{process.name} exited with code {process.exitcode}, "
+                               f"restarting in {delay:.1f}s")
+                process.close()
+                self._workers[index] = None
+                self._restart_at[index] = now + delay
+            elif now >= self._restart_at[index]:
+                self.restarts += 1
+                self._start(index)
+
+    def _shutdown(self) -> int:
+        workers = [process for process in self._workers if process is not None]
+        for process in workers:
+            if process.exitcode is None:
+                process.terminate()
+        deadline = time.monotonic() + self.shutdown_timeout + self.KILL_GRACE
+        for process in workers:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.exitcode is None:
+                logger.warning(f"{process.name} did not stop in time, killing it")
+                process.kill()
+                process.join()
+        self._workers = [None] * self.processes
+        return 0 if all(process.exitcode == 0 for process in workers) else 1
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("factory", help="module:attribute returning a MessageProcessor")
+    parser.add_argument("topics", nargs="+", help="Topics or queues to consume")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Worker processes, defaults to the number of CPUs")
+    parser.add_argument("--shutdown-timeout", type=float, default=30.0,
+                        help="Seconds workers get to drain in-flight messages")
+    args = parser.parse_args(argv)
+
+    runner = ConsumerRunner(args.factory, args.topics, processes=args.processes,
+                            shutdown_timeout=args.shutdown_timeout)
+    return runner.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Type, Union
+
+from pydantic import BaseModel
+
+from app.core.serializers import MsgpackSerializer, _to_builtin
+from app.core.validation import validate_many
+
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+class MessageCodec(ABC):
+    """Turns message payloads into bytes and back.
+
+    ``content_type`` travels with every message, so consumers pick the
+    decoder from the message itself rather than from their own settings.
+    """
+
+    name: str
+    content_type: str
+
+    @abstractmethod
+    def encode(self, message: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, body: bytes) -> Any:
+        pass
+
+    def decode_many(self, bodies: Sequence[bytes]) -> List[Any]:
+        return [self.decode(body) for body in bodies]
+
+
+class MessageDecodeError(ValueError):
+    """A message body that could not be decoded or validated."""
+
+
+class JsonCodec(MessageCodec):
+    name = "json"
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, message: Any) -> bytes:
+        return json.dumps(message, default=_to_builtin).encode()
+
+    def decode(self, body: bytes) -> Any:
+        return json.loads(body)
+
+
+class OrjsonCodec(MessageCodec):
+    name = "orjson"
+    content_type = JSON_CONTENT_TYPE
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        self._option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def encode(self, message: Any) -> bytes:
+        return self._orjson.dumps(message, default=_to_builtin, option=self._option)
+
+    def decode(self, body: bytes) -> Any:
+        return self._orjson.loads(body)
+
+
+class MsgpackCodec(MessageCodec):
+    name = "msgpack"
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def __init__(self):
+        self._serializer = MsgpackSerializer()
+
+    def encode(self, message: Any) -> bytes:
+        return self._serializer.dumps(message)
+
+    def decode(self, body: bytes) -> Any:
+        return self._serializer.loads(body)
+
+
+CODECS = {
+    "json": JsonCodec,
+    "orjson": OrjsonCodec,
+    "msgpack": MsgpackCodec,
+}
+
+_decoders: Dict[str, MessageCodec] = {}
+
+
+def get_codec(codec: Union[str, MessageCodec] = "json") -> MessageCodec:
+    if isinstance(codec, MessageCodec):
+        return codec
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec '{codec}', expected one of {tuple(CODECS)}")
+    return CODECS[codec]()
+
+
+def get_decoder(content_type: Optional[str]) -> MessageCodec:
+    """Codec for a message's content type, the fastest one installed.
+
+    Messages without a content type come from producers predating codecs
+    and are JSON.
+    """
+    content_type = (content_type or JSON_CONTENT_TYPE).split(";")[0].strip().lower()
+    if content_type not in _decoders:
+        if content_type == JSON_CONTENT_TYPE:
+            try:
+                _decoders[content_type] = OrjsonCodec()
+            except ImportError:
+                _decoders[content_type] = JsonCodec()
+        elif content_type == MSGPACK_CONTENT_TYPE:
+            _decoders[content_type] = MsgpackCodec()
+        else:
+            raise ValueError(f"Unsupported message content type '{content_type}'")
+    return _decoders[content_type]
+
+
+def decode_many(bodies: Sequence[bytes], content_type: Optional[str] = None,
+                model: Optional[Type[BaseModel]] = None) -> List[Any]:
+    """Decode message bodies sharing a content type, then validate them."""
+    messages = get_decoder(content_type).decode_many(bodies)
+    if model is not None:
+        return validate_many(model, messages)
+    return messages
+
+
+def decode_each(bodies: Sequence[bytes], content_type: Optional[str] = None,
+                model: Optional[Type[BaseModel]] = None
+                ) -> List[Union[Any, MessageDecodeError]]:
+    """Like ``decode_many`` but a bad body never fails the others.
+
+    Every body is decoded on its own and a ``MessageDecodeError`` takes the
+    place of the ones that can not be decoded or validated. Valid messages
+    are still validated in one call, one by one only if that call fails.
+    """
+    try:
+        decoder = get_decoder(content_type)
+    except ValueError as err:
+        return [MessageDecodeError(str(err)) for _ in bodies]
+    messages: List[Any] = []
+    for body in bodies:
+        try:
+            messages.append(decoder.decode(body))
+        except Exception as err:
+            messages.append(MessageDecodeError(f"Invalid {decoder.content_type} body: {err}"))
+    if model is None:
+        return messages
+
+    valid = [index for index, message in enumerate(messages)
+             if not isinstance(message, MessageDecodeError)]
+    try:
+        validated = validate_many(model, [messages[index] for index in valid])
+    except Exception:
+        for index in valid:
+            try:
+                messages[index] = validate_many(model, [messages[index]])[0]
+            except Exception as err:
+                messages[index] = MessageDecodeError(
+                    f"Message does not match {model.__name__}: {err}")
+    else:
+        for index, message in zip(valid, validated):
+            messages[index] = message
+    return messages
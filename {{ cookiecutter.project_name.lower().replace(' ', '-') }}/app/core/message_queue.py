@@ -1,15 +1,118 @@
-import json
+import asyncio
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Dict, List
+from typing import (Any, Awaitable, Callable, Dict, Iterable, List, Optional,
+                    Sequence, Set, Tuple, Type, Union)
 
 import aio_pika
 from aio_pika import Message, connect_robust
 from aio_pika.abc import AbstractIncomingMessage
 
-from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRebalanceListener
+from loguru import logger
+from pydantic import BaseModel
+
+from app.core.message_codecs import (MessageCodec, MessageDecodeError,
+                                     decode_each, get_codec)
+from app.core.metrics import registry
+
+
+MESSAGES_PUBLISHED_TOTAL = registry.counter(
+    "message_queue_published_total", "Messages published by buffered publishers",
+    labelnames=("topic",))
+MESSAGES_PUBLISH_FAILED_TOTAL = registry.counter(
+    "message_queue_publish_failed_total",
+    "Buffered messages dropped because publishing failed",
+    labelnames=("topic",))
+PUBLISH_BUFFER_SIZE = registry.gauge(
+    "message_queue_publish_buffer_size", "Messages waiting in publish buffers")
+MESSAGES_CONSUMED_TOTAL = registry.counter(
+    "message_queue_consumed_total", "Consumed messages by processing result",
+    labelnames=("topic", "result"))
+MESSAGE_PROCESSING_SECONDS = registry.histogram(
+    "message_queue_processing_seconds", "Time spent processing a consumed message",
+    labelnames=("topic",))
+KAFKA_CONSUMER_LAG = registry.gauge(
+    "kafka_consumer_lag", "Messages of an assigned partition not processed yet",
+    labelnames=("group", "topic", "partition"))
 
 
 class MessageQueue(ABC):
+    # Codec messages are published with, per topic overrides of it and
+    # pydantic models consumed messages of a topic are validated against
+    codec: MessageCodec
+    topic_codecs: Dict[str, MessageCodec]
+    schemas: Dict[str, Type[BaseModel]]
+    # Set by stop_consuming, consume loops exit once it is true
+    stopping: bool = False
+
+    def __init__(self, codec: Union[str, MessageCodec] = "json",
+                 topic_codecs: Optional[Dict[str, Union[str, MessageCodec]]] = None,
+                 schemas: Optional[Dict[str, Type[BaseModel]]] = None):
+        self.configure_codecs(codec, topic_codecs, schemas)
+
+    def configure_codecs(self, codec: Union[str, MessageCodec] = "json",
+                         topic_codecs: Optional[Dict[str, Union[str, MessageCodec]]] = None,
+                         schemas: Optional[Dict[str, Type[BaseModel]]] = None) -> None:
+        self.codec = get_codec(codec)
+        self.topic_codecs = {topic: get_codec(topic_codec)
+                             for topic, topic_codec in (topic_codecs or {}).items()}
+        self.schemas = dict(schemas or {})
+
+    def encode(self, topic: str, message: Any) -> Tuple[bytes, str]:
+        """Body and content type of a message published to ``topic``."""
+        codec = self.topic_codecs.get(topic, self.codec)
+        return codec.encode(message), codec.content_type
+
+    def decode_messages(self, envelopes: Sequence[Tuple[str, bytes, Optional[str]]]
+                        ) -> List[Any]:
+        """Decode ``(topic, body, content_type)`` triples in bulk.
+
+        The decoder follows each message's content type, not this queue's
+        codec, so producers and consumers can switch codecs independently.
+        Messages sharing a topic and content type are validated in one
+        call. A message that can not be decoded or validated is returned
+        as a ``MessageDecodeError`` and does not affect the others.
+        """
+        groups: Dict[Tuple[str, Optional[str]], List[int]] = {}
+        for index, (topic, _, content_type) in enumerate(envelopes):
+            groups.setdefault((topic, content_type), []).append(index)
+        messages: List[Any] = [None] * len(envelopes)
+        for (topic, content_type), indices in groups.items():
+            decoded = decode_each([envelopes[index][1] for index in indices],
+                                  content_type, self.schemas.get(topic))
+            for index, message in zip(indices, decoded):
+                messages[index] = message
+        return messages
+
+    @staticmethod
+    async def _call_batch(callback: Callable, messages: List[Any]
+                          ) -> List[Optional[Exception]]:
+        """Run a batch callback, the error of every message or None.
+
+        When the batch fails its messages are retried one by one, so a
+        single bad message does not fail the others. Messages may thus be
+        processed twice, as with any redelivery.
+        """
+        if not messages:
+            return []
+        try:
+            await callback(messages)
+            return [None] * len(messages)
+        except Exception as e:
+            if len(messages) == 1:
+                return [e]
+            logger.warning(f"Batch of {len(messages)} messages failed, "
+                           f"retrying them one by one: {str(e)}")
+        errors: List[Optional[Exception]] = []
+        for message in messages:
+            try:
+                await callback([message])
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
     @abstractmethod
     async def connect(self) -> None:
         pass
@@ -22,20 +125,195 @@ class MessageQueue(ABC):
     async def publish(self, topic: str, message: Dict[str, Any]) -> None:
         pass
 
+    async def publish_many(self, topic: str,
+                           messages: Iterable[Dict[str, Any]]) -> None:
+        """Publish several messages, backends override it to batch them."""
+        for message in messages:
+            await self.publish(topic, message)
+
+    def buffered(self, **kwargs) -> "BufferedPublisher":
+        """Fire-and-forget publisher batching messages in the background."""
+        return BufferedPublisher(self, **kwargs)
+
+    @abstractmethod
+    async def consume(self, topics: List[str], callback: Callable,
+                      concurrency: int = 1) -> None:
+        """Call ``callback`` for every message, at most ``concurrency`` at once."""
+        pass
+
     @abstractmethod
-    async def consume(self, topics: List[str], callback: Callable) -> None:
+    async def consume_batches(self, topics: List[str], callback: Callable,
+                              batch_size: int = 100,
+                              batch_timeout: float = 1.0) -> None:
+        """Call ``callback`` with lists of up to ``batch_size`` messages.
+
+        A batch is delivered when it is full or ``batch_timeout`` seconds
+        after its first message, and acknowledged once the callback
+        returns. How messages that can not be decoded or fail the callback
+        are handled depends on the backend.
+        """
         pass
 
+    async def stop_consuming(self) -> None:
+        """Stop taking new messages, in-flight ones are still processed.
+
+        Consume loops finish the messages they already received, commit
+        them and return.
+        """
+        self.stopping = True
+
+
+class BatchBuffer:
+    """Collects items and flushes them by count or after a time window."""
+
+    def __init__(self, flush: Callable[[List[Any]], Awaitable[None]],
+                 batch_size: int, batch_timeout: float):
+        self._flush = flush
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.items: List[Any] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+
+    async def add(self, item: Any) -> None:
+        self.items.append(item)
+        if len(self.items) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        self._timer = asyncio.get_running_loop().call_later(
+            self.batch_timeout, lambda: asyncio.ensure_future(self._flush_on_timer()))
+
+    async def _flush_on_timer(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.exception(f"Failed to process a batch: {str(e)}")
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Batches are handed over one at a time, in arrival order
+        async with self._lock:
+            items, self.items = self.items[:self.batch_size], self.items[self.batch_size:]
+            if items:
+                await self._flush(items)
+        if self.items and self._timer is None:
+            self._schedule()
+
+
+class BufferedPublisher:
+    """Publish in the background, in batches, with a bounded buffer.
+
+    ``publish`` returns as soon as the message is buffered and waits only
+    while ``max_buffer`` messages are pending, pushing back on producers
+    faster than the broker. A background task groups up to ``batch_size``
+    buffered messages per topic, waiting at most ``linger`` seconds for a
+    batch to fill, and sends them with ``publish_many``. Failed batches
+    are logged and counted, not retried.
+    """
+
+    def __init__(self, queue: MessageQueue, max_buffer: int = 10000,
+                 batch_size: int = 500, linger: float = 0.005):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.linger = linger
+        self._buffer: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = \
+            asyncio.Queue(maxsize=max_buffer)
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> "BufferedPublisher":
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self) -> None:
+        """Send everything still buffered, then stop the background task."""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def __aenter__(self) -> "BufferedPublisher":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def publish(self, topic: str, message: Dict[str, Any]) -> None:
+        await self._buffer.put((topic, message))
+        PUBLISH_BUFFER_SIZE.inc()
+
+    async def flush(self) -> None:
+        await self._buffer.join()
+
+    async def _collect(self) -> List[Tuple[str, Dict[str, Any]]]:
+        batch = [await self._buffer.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.linger
+        while len(batch) < self.batch_size:
+            if self._buffer.empty():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._buffer.get(),
+                                                        remaining))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self._buffer.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            by_topic: Dict[str, List[Dict[str, Any]]] = {}
+            for topic, message in batch:
+                by_topic.setdefault(topic, []).append(message)
+            for topic, messages in by_topic.items():
+                try:
+                    await self.queue.publish_many(topic, messages)
+                    MESSAGES_PUBLISHED_TOTAL.inc(len(messages), topic=topic)
+                except Exception as e:
+                    MESSAGES_PUBLISH_FAILED_TOTAL.inc(len(messages), topic=topic)
+                    logger.exception(
+                        f"Failed to publish {len(messages)} messages to {topic}: {str(e)}")
+            PUBLISH_BUFFER_SIZE.dec(len(batch))
+            for _ in batch:
+                self._buffer.task_done()
+
 
 class RabbitMQQueue(MessageQueue):
-    def __init__(self, url: str):
+    def __init__(self, url: str, prefetch_count: int = 100,
+                 confirm_batch_size: int = 100,
+                 codec: Union[str, MessageCodec] = "json",
+                 topic_codecs: Optional[Dict[str, Union[str, MessageCodec]]] = None,
+                 schemas: Optional[Dict[str, Type[BaseModel]]] = None):
         self.url = url
+        super().__init__(codec, topic_codecs, schemas)
+        # Unacknowledged messages the broker pushes to this channel
+        self.prefetch_count = prefetch_count
+        # Publishes awaiting a broker confirm at once in publish_many
+        self.confirm_batch_size = confirm_batch_size
         self.connection = None
         self.channel = None
+        self._consumers: List[Tuple[Any, str]] = []
+        self._in_flight: Set["asyncio.Task[Any]"] = set()
+        self._buffers: List[BatchBuffer] = []
 
     async def connect(self) -> None:
         self.connection = await connect_robust(self.url)
         self.channel = await self.connection.channel()
+        await self.channel.set_qos(prefetch_count=self.prefetch_count)
 
     async def close(self) -> None:
         if self.connection:
@@ -46,35 +324,232 @@ class RabbitMQQueue(MessageQueue):
             await self.connect()
 
         await self.channel.default_exchange.publish(
-            Message(body=json.dumps(message).encode()),
+            self._message(routing_key, message),
             routing_key=routing_key
         )
 
-    async def consume(self, queue_names: List[str],
-                      callback: Callable) -> None:
+    def _message(self, routing_key: str, message: Dict[str, Any]) -> Message:
+        body, content_type = self.encode(routing_key, message)
+        return Message(body=body, content_type=content_type)
+
+    async def publish_many(self, routing_key: str,
+                           messages: Iterable[Dict[str, Any]]) -> None:
+        if not self.channel:
+            await self.connect()
+
+        # The channel uses publisher confirms: publishing a chunk
+        # concurrently waits for all its confirms in one round trip
+        messages = list(messages)
+        exchange = self.channel.default_exchange
+        for start in range(0, len(messages), self.confirm_batch_size):
+            await asyncio.gather(*(
+                exchange.publish(self._message(routing_key, message),
+                                 routing_key=routing_key)
+                for message in messages[start:start + self.confirm_batch_size]
+            ))
+
+    async def consume(self, queue_names: List[str], callback: Callable,
+                      concurrency: int = 1) -> None:
         if not self.channel:
             await self.connect()
+        # Every delivery runs in its own task, prefetch bounds them
+        await self.channel.set_qos(
+            prefetch_count=max(self.prefetch_count, concurrency))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        def consumer(queue_name: str):
+            async def process_message(message: AbstractIncomingMessage):
+                async with semaphore:
+                    # A failed message is rejected without requeueing, to
+                    # the queue's dead letter exchange if it has one
+                    async with message.process():
+                        body, = self.decode_messages(
+                            [(queue_name, message.body, message.content_type)])
+                        if isinstance(body, MessageDecodeError):
+                            raise body
+                        await callback(body)
+            return self._tracked(process_message)
 
         for queue_name in queue_names:
             queue = await self.channel.declare_queue(queue_name, durable=True)
+            self._consumers.append((queue, await queue.consume(consumer(queue_name))))
 
-            async def process_message(message: AbstractIncomingMessage):
-                async with message.process():
-                    body = json.loads(message.body.decode())
-                    await callback(body)
+    async def consume_batches(self, queue_names: List[str], callback: Callable,
+                              batch_size: int = 100,
+                              batch_timeout: float = 1.0) -> None:
+        if not self.channel:
+            await self.connect()
+        # A smaller prefetch would never let a batch fill up
+        await self.channel.set_qos(
+            prefetch_count=max(self.prefetch_count, batch_size))
+
+        async def process_batch(deliveries: List[Tuple[str, AbstractIncomingMessage]]):
+            # Only the messages that can not be decoded or processed are
+            # rejected, to the queue's dead letter exchange if it has one
+            decoded = self.decode_messages(
+                [(queue_name, message.body, message.content_type)
+                 for queue_name, message in deliveries])
+            valid = []
+            rejected = []
+            for (queue_name, message), body in zip(deliveries, decoded):
+                if isinstance(body, MessageDecodeError):
+                    logger.error(f"Rejecting a message from {queue_name}: {str(body)}")
+                    rejected.append(message)
+                else:
+                    valid.append((message, body))
+            errors = await self._call_batch(callback, [body for _, body in valid])
+            acked = []
+            for (message, _), error in zip(valid, errors):
+                if error is None:
+                    acked.append(message)
+                else:
+                    logger.error(f"Rejecting a message that failed: {str(error)}")
+                    rejected.append(message)
+            await asyncio.gather(*(message.ack() for message in acked),
+                                 *(message.reject() for message in rejected))
+
+        buffer = BatchBuffer(process_batch, batch_size, batch_timeout)
+        self._buffers.append(buffer)
+
+        def consumer(queue_name: str):
+            async def add(message: AbstractIncomingMessage):
+                await buffer.add((queue_name, message))
+            return self._tracked(add)
 
-            await queue.consume(process_message)
+        for queue_name in queue_names:
+            queue = await self.channel.declare_queue(queue_name, durable=True)
+            self._consumers.append((queue, await queue.consume(consumer(queue_name))))
+
+    def _tracked(self, callback: Callable) -> Callable:
+        # aio-pika runs every delivery in its own task, remember them to
+        # wait for in-flight messages on stop
+        async def run(message: AbstractIncomingMessage):
+            task = asyncio.current_task()
+            self._in_flight.add(task)
+            try:
+                await callback(message)
+            finally:
+                self._in_flight.discard(task)
+        return run
+
+    async def stop_consuming(self) -> None:
+        self.stopping = True
+        consumers, self._consumers = self._consumers, []
+        for queue, consumer_tag in consumers:
+            await queue.cancel(consumer_tag)
+        # Let deliveries received before the cancel start their tasks
+        await asyncio.sleep(0)
+        if self._in_flight:
+            await asyncio.wait(list(self._in_flight))
+        buffers, self._buffers = self._buffers, []
+        for buffer in buffers:
+            while buffer.items:
+                try:
+                    await buffer.flush()
+                except Exception as e:
+                    logger.exception(f"Failed to process a batch: {str(e)}")
+
+
+CONTENT_TYPE_HEADER = "content-type"
+
+
+class _PartitionWorker:
+    """Processes the records of one partition in order.
+
+    ``position`` is the offset after the last processed record, the one to
+    commit, and ``committed`` the last offset committed for the partition.
+    A failed record stops the worker and is kept in ``error``.
+    """
+
+    def __init__(self, partition: Any, offset: int,
+                 process: Callable[[Any, Any], Awaitable[None]]):
+        self.partition = partition
+        self.position = self.committed = offset
+        self.records: "asyncio.Queue[Tuple[Any, Any]]" = asyncio.Queue()
+        self.error: Optional[Exception] = None
+        self.task = asyncio.ensure_future(self._run(process))
+
+    async def _run(self, process: Callable[[Any, Any], Awaitable[None]]) -> None:
+        while True:
+            record, message = await self.records.get()
+            try:
+                await process(record, message)
+            except Exception as e:
+                self.error = e
+                return
+            finally:
+                self.records.task_done()
+            self.position = record.offset + 1
+
+    async def drain(self) -> None:
+        """Wait until the queued records are processed or one failed."""
+        idle = asyncio.ensure_future(self.records.join())
+        await asyncio.wait({idle, self.task}, return_when=asyncio.FIRST_COMPLETED)
+        idle.cancel()
+
+    async def stop(self) -> None:
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+
+class _RebalanceListener(ConsumerRebalanceListener):
+    def __init__(self, queue: "KafkaQueue"):
+        self.queue = queue
+
+    async def on_partitions_revoked(self, revoked) -> None:
+        # Finish and commit what was received before another member
+        # takes the partitions over
+        await self.queue._release(revoked)
+
+    async def on_partitions_assigned(self, assigned) -> None:
+        logger.info(f"Assigned partitions: {sorted(str(tp) for tp in assigned)}")
 
 
 class KafkaQueue(MessageQueue):
-    def __init__(self, bootstrap_servers: str):
+    """Kafka producer and consumer group member.
+
+    ``consume`` processes partitions concurrently, each strictly in offset
+    order, and commits processed offsets every ``commit_interval`` seconds,
+    on rebalances and on shutdown. A partition holding more than
+    ``max_poll_records`` unprocessed records is paused until it catches up.
+
+    Records that can not be decoded are skipped. With a
+    ``dead_letter_topic`` they, and records whose callback fails, are
+    published there with the original topic, partition, offset and error in
+    their headers and consumption goes on. Without one a failed callback
+    stops consumption so the record is delivered again.
+    """
+
+    def __init__(self, bootstrap_servers: str, max_poll_records: int = 500,
+                 linger_ms: int = 5, max_batch_size: int = 64 * 1024,
+                 compression_type: Optional[str] = None,
+                 codec: Union[str, MessageCodec] = "json",
+                 topic_codecs: Optional[Dict[str, Union[str, MessageCodec]]] = None,
+                 schemas: Optional[Dict[str, Type[BaseModel]]] = None,
+                 group_id: str = "my-group", commit_interval: float = 1.0,
+                 dead_letter_topic: Optional[str] = None):
         self.bootstrap_servers = bootstrap_servers
+        super().__init__(codec, topic_codecs, schemas)
+        self.max_poll_records = max_poll_records
+        self.group_id = group_id
+        self.commit_interval = commit_interval
+        self.dead_letter_topic = dead_letter_topic
+        # Producer batching: wait up to linger_ms for a partition batch of
+        # up to max_batch_size bytes, compressed with gzip/snappy/lz4/zstd
+        self.linger_ms = linger_ms
+        self.max_batch_size = max_batch_size
+        self.compression_type = compression_type
         self.producer = None
         self.consumer = None
+        self._workers: Dict[Any, _PartitionWorker] = {}
 
     async def connect(self) -> None:
         self.producer = AIOKafkaProducer(
-            bootstrap_servers=self.bootstrap_servers)
+            bootstrap_servers=self.bootstrap_servers,
+            linger_ms=self.linger_ms,
+            max_batch_size=self.max_batch_size,
+            compression_type=self.compression_type,
+        )
         await self.producer.start()
 
     async def close(self) -> None:
@@ -87,35 +562,393 @@ class KafkaQueue(MessageQueue):
         if not self.producer:
             await self.connect()
 
-        await self.producer.send_and_wait(topic, json.dumps(message).encode())
+        body, headers = self._record(topic, message)
+        await self.producer.send_and_wait(topic, body, headers=headers)
+
+    def _record(self, topic: str, message: Dict[str, Any]
+                ) -> Tuple[bytes, List[Tuple[str, bytes]]]:
+        body, content_type = self.encode(topic, message)
+        return body, [(CONTENT_TYPE_HEADER, content_type.encode())]
+
+    def _decode(self, records: List[Any]) -> List[Any]:
+        envelopes = []
+        for record in records:
+            content_type = next((value.decode() for key, value in record.headers or ()
+                                 if key == CONTENT_TYPE_HEADER), None)
+            envelopes.append((record.topic, record.value, content_type))
+        return self.decode_messages(envelopes)
+
+    async def _reject(self, record: Any, error: Exception, result: str) -> None:
+        """Skip a record, publishing it to the dead letter topic if any."""
+        MESSAGES_CONSUMED_TOTAL.inc(topic=record.topic, result=result)
+        location = f"{record.topic}[{record.partition}]@{record.offset}"
+        if self.dead_letter_topic is None:
+            logger.error(f"Skipping record {location}: {str(error)}")
+            return
+        logger.error(f"Dead-lettering record {location}: {str(error)}")
+        if not self.producer:
+            await self.connect()
+        headers = list(record.headers or ()) + [
+            ("x-original-topic", record.topic.encode()),
+            ("x-original-partition", str(record.partition).encode()),
+            ("x-original-offset", str(record.offset).encode()),
+            ("x-error", str(error).encode()),
+        ]
+        await self.producer.send_and_wait(
+            self.dead_letter_topic, record.value,
+            key=getattr(record, "key", None), headers=headers)
+
+    async def publish_many(self, topic: str,
+                           messages: Iterable[Dict[str, Any]]) -> None:
+        if not self.producer:
+            await self.connect()
+
+        # send() only appends to the producer's batch (waiting when its
+        # buffer is full), the deliveries are awaited together
+        deliveries = []
+        for message in messages:
+            body, headers = self._record(topic, message)
+            deliveries.append(await self.producer.send(topic, body, headers=headers))
+        await asyncio.gather(*deliveries)
 
-    async def consume(self, topics: List[str], callback: Callable) -> None:
+    async def _start_consumer(self, topics: List[str]) -> None:
+        # Offsets are committed only after the callback succeeded
         self.consumer = AIOKafkaConsumer(
-            *topics,
             bootstrap_servers=self.bootstrap_servers,
-            group_id="my-group"
+            group_id=self.group_id,
+            enable_auto_commit=False,
         )
+        self.consumer.subscribe(topics, listener=_RebalanceListener(self))
         await self.consumer.start()
 
+    async def _poll(self, max_records: int, timeout: float) -> List[Any]:
+        records: List[Any] = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while len(records) < max_records:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            batches = await self.consumer.getmany(
+                timeout_ms=int(remaining * 1000),
+                max_records=max_records - len(records))
+            for partition_records in batches.values():
+                records.extend(partition_records)
+        return records
+
+    def _lag(self, worker: _PartitionWorker) -> float:
+        highwater = self.consumer.highwater(worker.partition)
+        return max(highwater - worker.position, 0) if highwater is not None else 0
+
+    def _lag_labels(self, partition: Any) -> Dict[str, str]:
+        return {"group": self.group_id, "topic": partition.topic,
+                "partition": str(partition.partition)}
+
+    def _worker(self, partition: Any, offset: int,
+                process: Callable[[Any, Any], Awaitable[None]]) -> _PartitionWorker:
+        worker = self._workers.get(partition)
+        if worker is None:
+            worker = self._workers[partition] = _PartitionWorker(partition, offset, process)
+            KAFKA_CONSUMER_LAG.set_function(lambda: self._lag(worker),
+                                            **self._lag_labels(partition))
+        return worker
+
+    async def _commit(self, workers: Optional[List[_PartitionWorker]] = None) -> None:
+        if workers is None:
+            workers = list(self._workers.values())
+        offsets = {worker.partition: worker.position for worker in workers
+                   if worker.position != worker.committed}
+        if not offsets:
+            return
+        await self.consumer.commit(offsets)
+        for worker in workers:
+            worker.committed = offsets.get(worker.partition, worker.committed)
+
+    async def _release(self, partitions: Iterable[Any], drain: bool = True) -> None:
+        workers = [self._workers.pop(partition) for partition in list(partitions)
+                   if partition in self._workers]
+        if drain:
+            await asyncio.gather(*(worker.drain() for worker in workers))
+        await asyncio.gather(*(worker.stop() for worker in workers))
+        for worker in workers:
+            KAFKA_CONSUMER_LAG.remove(**self._lag_labels(worker.partition))
+        try:
+            await self._commit(workers)
+        except Exception as e:
+            logger.exception(f"Failed to commit offsets: {str(e)}")
+
+    async def consume(self, topics: List[str], callback: Callable,
+                      concurrency: int = 1) -> None:
+        await self._start_consumer(topics)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def process(record, message):
+            if isinstance(message, MessageDecodeError):
+                await self._reject(record, message, "invalid")
+                return
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await callback(message)
+                except Exception as e:
+                    if self.dead_letter_topic is None:
+                        MESSAGES_CONSUMED_TOTAL.inc(topic=record.topic, result="error")
+                        raise
+                    await self._reject(record, e, "dead_lettered")
+                    return
+                MESSAGE_PROCESSING_SECONDS.observe(time.perf_counter() - started,
+                                                   topic=record.topic)
+                MESSAGES_CONSUMED_TOTAL.inc(topic=record.topic, result="success")
+
+        loop = asyncio.get_running_loop()
+        next_commit = loop.time() + self.commit_interval
+        paused = set()
+        drain = True
+        try:
+            while not self.stopping:
+                batches = await self.consumer.getmany(
+                    timeout_ms=int(self.commit_interval * 1000),
+                    max_records=self.max_poll_records)
+                for partition, records in batches.items():
+                    worker = self._worker(partition, records[0].offset, process)
+                    for record, message in zip(records, self._decode(records)):
+                        worker.records.put_nowait((record, message))
+                    if worker.records.qsize() >= self.max_poll_records:
+                        self.consumer.pause(partition)
+                        paused.add(partition)
+
+                for worker in list(self._workers.values()):
+                    if worker.error is not None:
+                        raise worker.error
+                for partition in list(paused):
+                    worker = self._workers.get(partition)
+                    if worker is None or worker.records.qsize() < self.max_poll_records // 2:
+                        paused.discard(partition)
+                        if worker is not None:
+                            self.consumer.resume(partition)
+
+                if loop.time() >= next_commit:
+                    await self._commit()
+                    next_commit = loop.time() + self.commit_interval
+        except BaseException:
+            # After a failure or cancellation only the offsets processed so
+            # far are committed, the rest is delivered again
+            drain = False
+            raise
+        finally:
+            # On shutdown the received records are processed first
+            await self._release(list(self._workers), drain=drain)
+            await self.consumer.stop()
+
+    async def consume_batches(self, topics: List[str], callback: Callable,
+                              batch_size: int = 100,
+                              batch_timeout: float = 1.0) -> None:
+        await self._start_consumer(topics)
         try:
-            async for msg in self.consumer:
-                body = json.loads(msg.value.decode())
-                await callback(body)
+            while not self.stopping:
+                records = await self._poll(batch_size, batch_timeout)
+                if not records:
+                    continue
+                valid = []
+                for record, message in zip(records, self._decode(records)):
+                    if isinstance(message, MessageDecodeError):
+                        await self._reject(record, message, "invalid")
+                    else:
+                        valid.append((record, message))
+                messages = [message for _, message in valid]
+                if self.dead_letter_topic is None:
+                    if messages:
+                        await callback(messages)
+                    errors: List[Optional[Exception]] = [None] * len(valid)
+                else:
+                    errors = await self._call_batch(callback, messages)
+                counts: Dict[str, int] = {}
+                for (record, _), error in zip(valid, errors):
+                    if error is None:
+                        counts[record.topic] = counts.get(record.topic, 0) + 1
+                    else:
+                        await self._reject(record, error, "dead_lettered")
+                for topic, count in counts.items():
+                    MESSAGES_CONSUMED_TOTAL.inc(count, topic=topic, result="success")
+                await self.consumer.commit()
         finally:
             await self.consumer.stop()
 
 
+class InMemoryQueue(MessageQueue):
+    """Process-local broker on asyncio queues, for tests and benchmarks.
+
+    Messages are encoded and decoded with the configured codecs like on a
+    real broker. Each topic is one queue shared by all its consumers, as
+    with competing RabbitMQ consumers, holding at most ``maxsize`` messages
+    (unbounded by default) so publishers wait for slow consumers. Messages
+    that can not be decoded or whose callback fails are logged and dropped.
+    """
+
+    def __init__(self, maxsize: int = 0, codec: Union[str, MessageCodec] = "json",
+                 topic_codecs: Optional[Dict[str, Union[str, MessageCodec]]] = None,
+                 schemas: Optional[Dict[str, Type[BaseModel]]] = None):
+        self.maxsize = maxsize
+        super().__init__(codec, topic_codecs, schemas)
+        self.topics: Dict[str, "asyncio.Queue[Tuple[bytes, str]]"] = {}
+        self._readers: Set["asyncio.Task[None]"] = set()
+
+    def _queue(self, topic: str) -> "asyncio.Queue[Tuple[bytes, str]]":
+        if topic not in self.topics:
+            self.topics[topic] = asyncio.Queue(maxsize=self.maxsize)
+        return self.topics[topic]
+
+    async def connect(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def publish(self, topic: str, message: Dict[str, Any]) -> None:
+        await self._queue(topic).put(self.encode(topic, message))
+
+    async def publish_many(self, topic: str,
+                           messages: Iterable[Dict[str, Any]]) -> None:
+        queue = self._queue(topic)
+        for message in messages:
+            await queue.put(self.encode(topic, message))
+
+    async def _read(self, topics: List[str],
+                    deliver: Callable[[str, bytes, str], Awaitable[None]],
+                    ready: Optional[Callable[[], Awaitable[Any]]] = None) -> None:
+        # stop_consuming cancels the readers while they wait in ready() or
+        # get(), deliver() must hand the message over without suspending
+        async def read(topic: str):
+            queue = self._queue(topic)
+            while True:
+                if ready is not None:
+                    await ready()
+                body, content_type = await queue.get()
+                await deliver(topic, body, content_type)
+
+        if self.stopping:
+            return
+        readers = [asyncio.ensure_future(read(topic)) for topic in topics]
+        self._readers.update(readers)
+        try:
+            await asyncio.gather(*readers)
+        except asyncio.CancelledError:
+            if not self.stopping:
+                raise
+        finally:
+            for reader in readers:
+                reader.cancel()
+                self._readers.discard(reader)
+
+    async def consume(self, topics: List[str], callback: Callable,
+                      concurrency: int = 1) -> None:
+        semaphore = asyncio.Semaphore(concurrency)
+        in_flight: Set["asyncio.Task[None]"] = set()
+
+        async def process(topic: str, body: bytes, content_type: str):
+            try:
+                message, = self.decode_messages([(topic, body, content_type)])
+                if isinstance(message, MessageDecodeError):
+                    raise message
+                await callback(message)
+            except Exception as e:
+                logger.exception(f"Failed to process a message from {topic}: {str(e)}")
+            finally:
+                semaphore.release()
+
+        async def deliver(topic: str, body: bytes, content_type: str):
+            task = asyncio.ensure_future(process(topic, body, content_type))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        try:
+            await self._read(topics, deliver, semaphore.acquire)
+        finally:
+            if in_flight:
+                await asyncio.wait(list(in_flight))
+
+    async def consume_batches(self, topics: List[str], callback: Callable,
+                              batch_size: int = 100,
+                              batch_timeout: float = 1.0) -> None:
+        async def process_batch(envelopes: List[Tuple[str, bytes, str]]):
+            messages = []
+            for (topic, _, _), message in zip(envelopes, self.decode_messages(envelopes)):
+                if isinstance(message, MessageDecodeError):
+                    logger.error(f"Dropping a message from {topic}: {str(message)}")
+                else:
+                    messages.append(message)
+            for error in await self._call_batch(callback, messages):
+                if error is not None:
+                    logger.error(f"Failed to process a message: {str(error)}")
+
+        buffer = BatchBuffer(process_batch, batch_size, batch_timeout)
+        adding: Set["asyncio.Future[None]"] = set()
+
+        async def deliver(topic: str, body: bytes, content_type: str):
+            # A full buffer is processed right away, stopping must not
+            # interrupt it
+            add = asyncio.ensure_future(buffer.add((topic, body, content_type)))
+            adding.add(add)
+            add.add_done_callback(adding.discard)
+            await asyncio.shield(add)
+
+        try:
+            await self._read(topics, deliver)
+        finally:
+            if adding:
+                await asyncio.wait(list(adding))
+            # The first flush also waits for one started by the timer
+            await buffer.flush()
+            while buffer.items:
+                await buffer.flush()
+
+    async def stop_consuming(self) -> None:
+        self.stopping = True
+        for reader in list(self._readers):
+            reader.cancel()
+
+
 class MessageProcessor:
-    def __init__(self, queue: MessageQueue):
+    """Consume messages one by one or, with ``batch_size``, in batches.
+
+    ``concurrency`` bounds the handlers running at once in both modes.
+    """
+
+    def __init__(self, queue: MessageQueue, concurrency: int = 1,
+                 batch_size: Optional[int] = None,
+                 batch_timeout: float = 1.0):
         self.queue = queue
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
 
     async def process_messages(self, topics: List[str]):
-        await self.queue.consume(topics, self.handle_message)
+        if self.batch_size:
+            await self.queue.consume_batches(topics, self.handle_batch,
+                                             self.batch_size, self.batch_timeout)
+        else:
+            await self.queue.consume(topics, self.handle_message,
+                                     concurrency=self.concurrency)
+
+    async def stop(self):
+        """Stop consuming once the messages in flight are processed."""
+        await self.queue.stop_consuming()
 
     async def handle_message(self, message: Dict[str, Any]):
         # Implement your message processing logic here
         print(f"Received message: {message}")
 
+    async def handle_batch(self, messages: List[Dict[str, Any]]):
+        # Override to process a whole batch at once (bulk inserts, batched
+        # inference); by default messages are handled concurrently
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def handle(message: Dict[str, Any]):
+            async with semaphore:
+                await self.handle_message(message)
+
+        await asyncio.gather(*(handle(message) for message in messages))
+
 
 # Example usage
 async def main():
@@ -147,4 +980,4 @@ async def main():
 if __name__ == "__main__":
     import asyncio
 
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+from typing import Any, Optional
+
+from aiocache.serializers import BaseSerializer, PickleSerializer
+
+
+# NumPy arrays are packed as msgpack extension type 1: [dtype, shape, data]
+_NUMPY_EXT_TYPE = 1
+
+_UNCOMPRESSED = b"\x00"
+_ZSTD = b"\x01"
+_LZ4 = b"\x02"
+
+
+def _to_builtin(value: Any) -> Any:
+    # pydantic models and NumPy scalars are not natively serializable
+    if hasattr(value, "dict") and callable(value.dict):
+        return value.dict()
+    if hasattr(value, "item") and callable(value.item):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+class OrjsonSerializer(BaseSerializer):
+    """Fast JSON for JSON-able values, NumPy arrays are decoded as lists."""
+
+    DEFAULT_ENCODING = None
+
+    def __init__(self, *args, **kwargs):
+        import orjson
+
+        super().__init__(*args, **kwargs)
+        self._orjson = orjson
+        self._option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, value: Any) -> bytes:
+        return self._orjson.dumps(value, default=_to_builtin, option=self._option)
+
+    def loads(self, value: Optional[bytes]) -> Any:
+        if value is None:
+            return None
+        return self._orjson.loads(value)
+
+
+class MsgpackSerializer(BaseSerializer):
+    """msgpack with NumPy arrays round-tripped as raw buffers."""
+
+    DEFAULT_ENCODING = None
+
+    def __init__(self, *args, **kwargs):
+        import msgpack
+
+        super().__init__(*args, **kwargs)
+        self._msgpack = msgpack
+
+    def _default(self, value: Any) -> Any:
+        import numpy as np
+
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            payload = self._msgpack.packb(
+                [value.dtype.str, list(value.shape),
+                 np.ascontiguousarray(value).tobytes()],
+                use_bin_type=True,
+            )
+            return self._msgpack.ExtType(_NUMPY_EXT_TYPE, payload)
+        return _to_builtin(value)
+
+    @staticmethod
+    def _ext_hook(code: int, data: bytes) -> Any:
+        import msgpack
+        import numpy as np
+
+        if code != _NUMPY_EXT_TYPE:
+            return msgpack.ExtType(code, data)
+        dtype, shape, buffer = msgpack.unpackb(data, raw=False)
+        return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+
+    def dumps(self, value: Any) -> bytes:
+        return self._msgpack.packb(value, default=self._default, use_bin_type=True)
+
+    def loads(self, value: Optional[bytes]) -> Any:
+        if value is None:
+            return None
+        return self._msgpack.unpackb(value, ext_hook=self._ext_hook, raw=False,
+                                     strict_map_key=False)
+
+
+class CompressedSerializer(BaseSerializer):
+    """Compress payloads of another serializer above a size threshold.
+
+    Every payload is prefixed with one byte naming the codec, so values
+    written before compression was enabled (or below the threshold) are
+    still readable.
+    """
+
+    DEFAULT_ENCODING = None
+
+    def __init__(self, serializer: BaseSerializer, algorithm: str = "zstd",
+                 threshold: int = 1024, level: Optional[int] = None,
+                 *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.serializer = serializer
+        self.algorithm = algorithm
+        self.threshold = threshold
+        if algorithm == "zstd":
+            import zstandard
+
+            self._prefix = _ZSTD
+            self._compress = zstandard.ZstdCompressor(level=level or 3).compress
+        elif algorithm == "lz4":
+            import lz4.frame
+
+            self._prefix = _LZ4
+            self._compress = lambda data: lz4.frame.compress(
+                data, compression_level=level or 0)
+        else:
+            raise ValueError(f"Unknown compression algorithm '{algorithm}'")
+
+    def dumps(self, value: Any) -> bytes:
+        data = self.serializer.dumps(value)
+        if isinstance(data, str):
+            data = data.encode()
+        if len(data) < self.threshold:
+            return _UNCOMPRESSED + data
+        return self._prefix + self._compress(data)
+
+    def loads(self, value: Optional[bytes]) -> Any:
+        if value is None:
+            return None
+        prefix, data = value[:1], value[1:]
+        if prefix == _ZSTD:
+            import zstandard
+
+            data = zstandard.ZstdDecompressor().decompress(data)
+        elif prefix == _LZ4:
+            import lz4.frame
+
+            data = lz4.frame.decompress(data)
+        elif prefix != _UNCOMPRESSED:
+            raise ValueError("Unknown compression prefix")
+        return self.serializer.loads(data)
+
+
+SERIALIZERS = {
+    "pickle": PickleSerializer,
+    "orjson": OrjsonSerializer,
+    "msgpack": MsgpackSerializer,
+}
+
+
+def get_serializer(name: str = "pickle", compression: str = "none",
+                   threshold: int = 1024) -> BaseSerializer:
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown serializer '{name}', "
+                         f"expected one of {tuple(SERIALIZERS)}")
+    serializer = SERIALIZERS[name]()
+    if compression and compression != "none":
+        serializer = CompressedSerializer(serializer, algorithm=compression,
+                                          threshold=threshold)
+    return serializer
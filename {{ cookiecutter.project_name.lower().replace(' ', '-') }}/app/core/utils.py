@@ -1,2 +1,43 @@
+import resource
+import sys
+from pathlib import Path
+from typing import Dict
+
+
 def example_function():
     print("I'm util")
+
+
+_PROC_FIELDS = {
+    "VmRSS": "rss",
+    "RssAnon": "anon",
+    "RssFile": "file",
+    "RssShmem": "shmem",
+}
+
+
+def _read_proc_kb(path: Path, fields: Dict[str, str]) -> Dict[str, int]:
+    result = {}
+    for line in path.read_text().splitlines():
+        name, _, value = line.partition(":")
+        if name in fields:
+            result[fields[name]] = int(value.split()[0]) * 1024
+    return result
+
+
+def get_process_memory() -> Dict[str, int]:
+    """Memory of the current process in bytes.
+
+    ``rss`` counts shared pages in full for every process, ``pss`` splits
+    them between the processes mapping them, so summing ``pss`` over all
+    workers gives the real footprint of a memory-mapped model.
+    """
+    proc = Path("/proc/self")
+    if (proc / "status").exists():
+        memory = _read_proc_kb(proc / "status", _PROC_FIELDS)
+        if (proc / "smaps_rollup").exists():
+            memory.update(_read_proc_kb(proc / "smaps_rollup", {"Pss": "pss"}))
+        return memory
+    # ru_maxrss is the peak, reported in bytes on macOS and KiB elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"max_rss": max_rss if sys.platform == "darwin" else max_rss * 1024}
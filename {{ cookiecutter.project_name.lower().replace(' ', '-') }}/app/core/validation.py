@@ -0,0 +1,35 @@
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+try:
+    from pydantic import TypeAdapter
+except ImportError:  # pydantic 1
+    from pydantic import parse_obj_as
+    TypeAdapter = None
+
+
+_list_adapters: Dict[Type[BaseModel], Any] = {}
+
+
+def list_adapter(model: Type[BaseModel]) -> Optional[Any]:
+    """Cached ``TypeAdapter`` for ``List[model]``, ``None`` on pydantic 1."""
+    if TypeAdapter is None:
+        return None
+    if model not in _list_adapters:
+        _list_adapters[model] = TypeAdapter(List[model])
+    return _list_adapters[model]
+
+
+def validate_many(model: Type[BaseModel], items: List[Any]) -> List[BaseModel]:
+    """Validate a list of items in a single call."""
+    adapter = list_adapter(model)
+    if adapter is None:
+        return parse_obj_as(List[model], items)
+    return adapter.validate_python(items)
+
+
+def validate_one(model: Type[BaseModel], item: Any) -> BaseModel:
+    if TypeAdapter is None:
+        return model.parse_obj(item)
+    return model.model_validate(item)
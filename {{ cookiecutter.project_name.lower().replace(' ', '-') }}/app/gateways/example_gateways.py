@@ -1,8 +1,34 @@
+import asyncio
+import hashlib
+import math
+import threading
+import time
+import weakref
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Union, Type
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (Any, AsyncIterator, Awaitable, Callable, Deque, Dict,
+                    Iterable, List, Mapping, Optional, Tuple, Union, Type)
 import aiohttp
 import requests
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from yarl import URL
+
+from app.config.config import settings
+from app.core.cache import single_flight
+from app.core.validation import list_adapter, validate_many, validate_one
+from app.gateways.http_client import get_http_session
+from app.gateways.json_stream import iter_json_array, json_loads
+from app.gateways.resilience import (
+    GATEWAY_HEDGES_TOTAL,
+    GATEWAY_RETRIES_TOTAL,
+    IDEMPOTENT_METHODS,
+    CircuitBreaker,
+    RetryPolicy,
+    get_circuit_breaker,
+)
 
 
 class RequestError(Exception):
@@ -31,14 +57,140 @@ class BaseGateway(ABC):
 
 
 class AsyncGateway(BaseGateway):
+    """Gateway over the shared aiohttp session.
+
+    Every attempt is bounded by ``timeout``. Idempotent requests failing
+    with a connection error, a timeout or one of ``retry.retry_statuses``
+    are retried with jittered exponential backoff. Upstream failures feed
+    a circuit breaker shared by gateways with the same ``name`` (pass
+    ``circuit_breaker=False`` to disable it). With ``hedge_after`` set a
+    GET still running after that many seconds is sent a second time and
+    the first response wins.
+    """
+
+    def __init__(self, base_url: str,
+                 session: Optional[aiohttp.ClientSession] = None,
+                 name: Optional[str] = None,
+                 timeout: Union[aiohttp.ClientTimeout, float, None] = None,
+                 retry: Optional[RetryPolicy] = None,
+                 circuit_breaker: Union[CircuitBreaker, bool] = True,
+                 hedge_after: Optional[float] = None):
+        super().__init__(base_url)
+        self._session = session
+        self.name = name or base_url
+        if timeout is None:
+            timeout = aiohttp.ClientTimeout(
+                total=settings.gateway.timeout,
+                connect=settings.gateway.connect_timeout)
+        elif not isinstance(timeout, aiohttp.ClientTimeout):
+            timeout = aiohttp.ClientTimeout(total=timeout)
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        if circuit_breaker is True:
+            circuit_breaker = get_circuit_breaker(self.name)
+        self.circuit_breaker = circuit_breaker or None
+        self.hedge_after = (hedge_after if hedge_after is not None
+                            else settings.gateway.hedge_after_ms / 1000)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Pooled session shared by all gateways unless one was passed in
+        return self._session or get_http_session()
+
     async def request(self, method: str, endpoint: str, **kwargs) -> Any:
         url = f"{self.base_url}{endpoint}"
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method, url, **kwargs) as response:
-                try:
-                    return await self.handle_response(response)
-                except Exception as e:
-                    self.handle_error(e)
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            return await self._request_with_retries(method, url, **kwargs)
+        except Exception as e:
+            self.handle_error(e)
+
+    async def _request_with_retries(self, method: str, url: str,
+                                     send: Optional[Callable[..., Awaitable[Any]]] = None,
+                                     **kwargs) -> Any:
+        send = send or self._send
+        attempts = self.retry.attempts_for(method)
+        hedged = bool(self.hedge_after) and method.upper() == "GET"
+        for attempt in range(1, attempts + 1):
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_call()
+            try:
+                if hedged:
+                    result = await self._send_hedged(send, method, url, **kwargs)
+                else:
+                    result = await send(method, url, **kwargs)
+            except Exception as e:
+                if self.circuit_breaker is not None:
+                    if self.is_upstream_failure(e):
+                        self.circuit_breaker.record_failure()
+                    else:
+                        self.circuit_breaker.record_success()
+                if attempt == attempts or not self.is_retryable(e):
+                    raise
+                GATEWAY_RETRIES_TOTAL.inc(gateway=self.name,
+                                          reason=self._retry_reason(e))
+                await asyncio.sleep(self.retry.backoff(attempt))
+            else:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_success()
+                return result
+
+    async def _send(self, method: str, url: str, **kwargs) -> Any:
+        async with self.session.request(method, url, **kwargs) as response:
+            return await self.handle_response(response)
+
+    async def _send_hedged(self, send: Callable[..., Awaitable[Any]],
+                           method: str, url: str, **kwargs) -> Any:
+        first = asyncio.ensure_future(send(method, url, **kwargs))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+            if done:
+                return first.result()
+            GATEWAY_HEDGES_TOTAL.inc(gateway=self.name, outcome="fired")
+            second = asyncio.ensure_future(send(method, url, **kwargs))
+            tasks.append(second)
+            pending = {first, second}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            GATEWAY_HEDGES_TOTAL.inc(gateway=self.name,
+                                                     outcome="won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Also when the caller is cancelled: no request outlives it
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, RequestError):
+            return error.status_code in self.retry.retry_statuses
+        return isinstance(error, (aiohttp.ClientConnectionError,
+                                  aiohttp.ClientPayloadError,
+                                  asyncio.TimeoutError))
+
+    def is_upstream_failure(self, error: Exception) -> bool:
+        """Errors counted by the circuit breaker, 4xx answers are not."""
+        if isinstance(error, RequestError):
+            return error.status_code >= 500 or error.status_code == 429
+        return isinstance(error, (aiohttp.ClientConnectionError,
+                                  aiohttp.ClientPayloadError,
+                                  asyncio.TimeoutError))
+
+    @staticmethod
+    def _retry_reason(error: Exception) -> str:
+        if isinstance(error, RequestError):
+            return f"status_{error.status_code}"
+        if isinstance(error, asyncio.TimeoutError):
+            return "timeout"
+        return "connection"
 
     async def handle_response(self, response: aiohttp.ClientResponse) -> Any:
         if response.status >= 400:
@@ -51,14 +203,101 @@ class AsyncGateway(BaseGateway):
 
 
 class SyncGateway(BaseGateway):
+    """Blocking gateway for workers and scripts, safe to share across threads.
+
+    One ``HTTPAdapter`` (a urllib3 pool of ``pool_size`` connections per
+    host, retrying idempotent requests on connection errors and
+    429/502/503/504 with exponential backoff) is mounted on a
+    ``requests.Session`` per thread, since sessions are not thread-safe,
+    and released with its thread. ``map`` runs many requests on a pool of ``max_workers`` threads.
+    """
+
+    def __init__(self, base_url: str, pool_size: Optional[int] = None,
+                 max_retries: Optional[int] = None,
+                 timeout: Union[float, Tuple[float, float], None] = None,
+                 max_workers: Optional[int] = None):
+        super().__init__(base_url)
+        self.max_workers = max_workers or settings.gateway.sync_max_workers
+        self.timeout = timeout or (settings.gateway.connect_timeout,
+                                   settings.gateway.timeout)
+        retries = Retry(
+            total=(max_retries if max_retries is not None
+                   else settings.gateway.retry_attempts - 1),
+            backoff_factor=settings.gateway.retry_backoff_base,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        pool_size = max(pool_size or settings.gateway.sync_pool_size,
+                        self.max_workers)
+        self.adapter = HTTPAdapter(pool_connections=pool_size,
+                                   pool_maxsize=pool_size, max_retries=retries)
+        self._local = threading.local()
+        # Only referenced by the thread-local, a thread's session goes away
+        # with the thread
+        self._sessions: "weakref.WeakSet[requests.Session]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.add(session)
+        return session
+
     def request(self, method: str, endpoint: str, **kwargs) -> Any:
         url = f"{self.base_url}{endpoint}"
-        response = requests.request(method, url, **kwargs)
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, url, **kwargs)
         try:
             return self.handle_response(response)
         except Exception as e:
             self.handle_error(e)
 
+    def map(self, method: str, endpoints: Iterable[str],
+            return_exceptions: bool = False, **kwargs) -> List[Any]:
+        """Request every endpoint concurrently, results in input order.
+
+        With ``return_exceptions`` failed requests give their exception
+        instead of aborting the whole call.
+        """
+        def call(endpoint: str) -> Any:
+            try:
+                return self.request(method, endpoint, **kwargs)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="sync-gateway")
+        return list(self._executor.map(call, endpoints))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            for session in list(self._sessions):
+                session.close()
+            self._sessions.clear()
+        self.adapter.close()
+
+    def __enter__(self) -> "SyncGateway":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
     def handle_response(self, response: requests.Response) -> Any:
         response.raise_for_status()
         return response.json()
@@ -69,58 +308,270 @@ class SyncGateway(BaseGateway):
 
 
 class PaginatedGateway(AsyncGateway):
+    """Gateway for page/limit paginated endpoints.
+
+    Pages are either plain lists or objects holding the page under
+    ``items_field`` and the item count under ``total_field``. Up to
+    ``concurrency`` pages are requested at once: when the first page
+    reports a total only the existing pages are fetched, otherwise pages
+    are fetched ahead until one comes back empty.
+    """
+
+    def __init__(self, base_url: str, page_size: int = 100,
+                 concurrency: int = 1, items_field: str = "items",
+                 total_field: str = "total", **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.page_size = page_size
+        self.concurrency = max(1, concurrency)
+        self.items_field = items_field
+        self.total_field = total_field
+
+    def page_items(self, response: Any) -> List:
+        if isinstance(response, dict):
+            return response.get(self.items_field) or []
+        return response or []
+
+    def total_pages(self, response: Any) -> Optional[int]:
+        total = response.get(self.total_field) if isinstance(response, dict) else None
+        if not isinstance(total, int):
+            return None
+        return math.ceil(total / self.page_size)
+
+    async def fetch_page(self, method: str, endpoint: str, page: int,
+                         page_param: str = "page", limit_param: str = "limit",
+                         **kwargs) -> Any:
+        # Every page gets its own params, the caller's dict is not modified
+        params = dict(kwargs.pop("params", None) or {})
+        params.update({page_param: page, limit_param: self.page_size})
+        return await self.request(method, endpoint, params=params, **kwargs)
+
+    async def iter_pages(self, method: str, endpoint: str,
+                         page_param: str = "page", limit_param: str = "limit",
+                         **kwargs) -> AsyncIterator[List]:
+        """Yield pages in order while keeping at most ``concurrency`` in flight."""
+        first = await self.fetch_page(method, endpoint, 1, page_param,
+                                      limit_param, **kwargs)
+        items = self.page_items(first)
+        if not items:
+            return
+        yield items
+
+        last_page = self.total_pages(first)
+        next_page = 2
+        pending: Deque["asyncio.Future[Any]"] = deque()
+        try:
+            while True:
+                while len(pending) < self.concurrency and (
+                        last_page is None or next_page <= last_page):
+                    pending.append(asyncio.ensure_future(self.fetch_page(
+                        method, endpoint, next_page, page_param, limit_param,
+                        **kwargs)))
+                    next_page += 1
+                if not pending:
+                    return
+                items = self.page_items(await pending.popleft())
+                if not items:
+                    return
+                yield items
+        finally:
+            # Pages fetched ahead of the end or of an early exit
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def iter_items(self, method: str, endpoint: str,
+                         page_param: str = "page", limit_param: str = "limit",
+                         **kwargs) -> AsyncIterator[Any]:
+        """Yield items as pages arrive, holding only the pages in flight."""
+        pages = self.iter_pages(method, endpoint, page_param, limit_param,
+                                **kwargs)
+        try:
+            async for page in pages:
+                for item in page:
+                    yield item
+        finally:
+            await pages.aclose()
+
     async def paginated_request(self, method: str, endpoint: str,
                                 page_param: str = "page",
                                 limit_param: str = "limit", **kwargs) -> List[
         Dict]:
-        all_results = []
-        page = 1
-        while True:
-            params = kwargs.get("params", {})
-            params.update({page_param: page, limit_param: 100})
-            kwargs["params"] = params
+        return [item async for item in self.iter_items(
+            method, endpoint, page_param, limit_param, **kwargs)]
 
-            results = await self.request(method, endpoint, **kwargs)
-            if not results:
-                break
 
-            all_results.extend(results)
-            page += 1
-
-        return all_results
+class ModelGateway(AsyncGateway):
+    """Gateway decoding responses into ``model`` instances.
 
+    Lists are validated in one call (``TypeAdapter`` on pydantic 2,
+    ``parse_obj_as`` on pydantic 1). ``stream`` parses a JSON array
+    incrementally and yields validated models in chunks.
+    """
 
-class ModelGateway(AsyncGateway):
-    def __init__(self, base_url: str, model: Type[BaseModel]):
-        super().__init__(base_url)
+    def __init__(self, base_url: str, model: Type[BaseModel], **kwargs):
+        super().__init__(base_url, **kwargs)
         self.model = model
+        self._list_adapter = list_adapter(model)
+
+    def validate_many(self, items: List[Any]) -> List[BaseModel]:
+        return validate_many(self.model, items)
+
+    def validate_one(self, item: Any) -> BaseModel:
+        return validate_one(self.model, item)
 
     async def handle_response(self, response: aiohttp.ClientResponse) -> Union[
         BaseModel, List[BaseModel]]:
         if response.status >= 400:
             raise RequestError(response.status, await response.text())
 
-        data = await response.json()
+        body = await response.read()
+        if self._list_adapter is not None and body.lstrip()[:1] == b"[":
+            # Parse and validate in a single pass
+            return self._list_adapter.validate_json(body)
+        data = json_loads(body)
         if isinstance(data, list):
-            return [self.model(**item) for item in data]
-        return self.model(**data)
+            return self.validate_many(data)
+        return self.validate_one(data)
+
+    async def stream(self, method: str, endpoint: str, chunk_size: int = 1000,
+                     **kwargs) -> AsyncIterator[List[BaseModel]]:
+        """Yield lists of up to ``chunk_size`` models from a JSON array.
+
+        The response is not retried and the per-attempt timeout applies to
+        each socket read instead of the whole download.
+        """
+        url = f"{self.base_url}{endpoint}"
+        kwargs.setdefault("timeout", aiohttp.ClientTimeout(
+            total=None, connect=self.timeout.connect,
+            sock_read=self.timeout.total))
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_call()
+        try:
+            async with self.session.request(method, url, **kwargs) as response:
+                if response.status >= 400:
+                    raise RequestError(response.status, await response.text())
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_success()
+                chunk: List[Any] = []
+                async for item in iter_json_array(response.content):
+                    chunk.append(item)
+                    if len(chunk) >= chunk_size:
+                        yield self.validate_many(chunk)
+                        chunk = []
+                if chunk:
+                    yield self.validate_many(chunk)
+        except Exception as e:
+            if self.circuit_breaker is not None and self.is_upstream_failure(e):
+                self.circuit_breaker.record_failure()
+            self.handle_error(e)
+
+
+def parse_cache_control(header: Optional[str]) -> Dict[str, Optional[str]]:
+    """'public, max-age=60' -> {'public': None, 'max-age': '60'}"""
+    directives: Dict[str, Optional[str]] = {}
+    for directive in (header or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
 
 
 class CachedGateway(AsyncGateway):
-    def __init__(self, base_url: str, cache_backend: Any):
-        super().__init__(base_url)
+    """Caches GET responses following the upstream's caching headers.
+
+    Freshness comes from ``s-maxage``/``max-age`` (``cache_ttl`` when the
+    upstream sends neither), ``no-store`` responses are not cached and
+    ``no-cache`` ones are revalidated on every use. Stale entries with an
+    ETag are kept for ``revalidate_ttl`` more seconds and revalidated with
+    ``If-None-Match``; a 304 refreshes them without a body. 404 and 410
+    answers are cached for ``negative_ttl`` seconds. Identical concurrent
+    misses share one upstream request.
+    """
+
+    NEGATIVE_STATUSES = (404, 410)
+
+    def __init__(self, base_url: str, cache_backend: Any,
+                 negative_ttl: int = 30, revalidate_ttl: int = 3600,
+                 vary_headers: Tuple[str, ...] = ("Accept", "Authorization"),
+                 **kwargs):
+        super().__init__(base_url, **kwargs)
         self.cache = cache_backend
+        self.negative_ttl = negative_ttl
+        self.revalidate_ttl = revalidate_ttl
+        self.vary_headers = vary_headers
+
+    def cache_key(self, method: str, endpoint: str,
+                  params: Optional[Any] = None,
+                  headers: Optional[Dict[str, str]] = None, **kwargs) -> str:
+        """Key independent of parameter order and of headers not in ``vary_headers``."""
+        url = URL(f"{self.base_url}{endpoint}")
+        if params:
+            url = url.update_query(params)
+        query = sorted(url.query.items())
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        vary = [(name.lower(), headers.get(name.lower(), ""))
+                for name in self.vary_headers]
+        canonical = f"{method.upper()} {url.with_query(None)} {query} {vary}"
+        digest = hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+        return f"gateway:{self.name}:{digest}"
 
     async def request(self, method: str, endpoint: str, use_cache: bool = True,
                       cache_ttl: int = 3600, **kwargs) -> Any:
-        if use_cache and method.lower() == "get":
-            cache_key = f"{method}:{endpoint}:{kwargs}"
-            cached_response = await self.cache.get(cache_key)
-            if cached_response:
-                return cached_response
+        if not use_cache or method.upper() != "GET":
+            return await super().request(method, endpoint, **kwargs)
+
+        key = self.cache_key(method, endpoint, **kwargs)
+        try:
+            entry = await self.cache.get(key)
+            if entry is None or entry["expires_at"] <= time.time():
+                entry = await single_flight(key, lambda: self._revalidate(
+                    key, endpoint, entry, cache_ttl, **kwargs))
+            return self._entry_result(entry)
+        except Exception as e:
+            self.handle_error(e)
+
+    def _entry_result(self, entry: Dict[str, Any]) -> Any:
+        if entry["status"] in self.NEGATIVE_STATUSES:
+            raise RequestError(entry["status"], entry["body"])
+        return entry["body"]
+
+    async def _send_cacheable(self, method: str, url: str,
+                              **kwargs) -> Tuple[int, Any, Mapping[str, str]]:
+        async with self.session.request(method, url, **kwargs) as response:
+            headers = response.headers
+            if response.status == 304:
+                return 304, None, headers
+            if response.status in self.NEGATIVE_STATUSES:
+                return response.status, await response.text(), headers
+            return response.status, await self.handle_response(response), headers
+
+    async def _revalidate(self, key: str, endpoint: str,
+                          entry: Optional[Dict[str, Any]], cache_ttl: int,
+                          **kwargs) -> Dict[str, Any]:
+        kwargs.setdefault("timeout", self.timeout)
+        if entry is not None and entry.get("etag"):
+            headers = dict(kwargs.get("headers") or {})
+            headers["If-None-Match"] = entry["etag"]
+            kwargs["headers"] = headers
+        status, body, headers = await self._request_with_retries(
+            "GET", f"{self.base_url}{endpoint}", send=self._send_cacheable,
+            **kwargs)
+        etag = headers.get("ETag")
+        if status == 304 and entry is not None:
+            status, body, etag = entry["status"], entry["body"], etag or entry["etag"]
 
-        response = await super().request(method, endpoint, **kwargs)
+        directives = parse_cache_control(headers.get("Cache-Control"))
+        if status in self.NEGATIVE_STATUSES:
+            ttl = self.negative_ttl
+        elif "no-cache" in directives:
+            ttl = 0
+        else:
+            max_age = directives.get("s-maxage") or directives.get("max-age")
+            ttl = int(max_age) if max_age and max_age.isdigit() else cache_ttl
 
-        if use_cache and method.lower() == "get":
-            await self.cache.set(cache_key, response, expire=cache_ttl)
-        return response
+        new_entry = {"status": status, "body": body, "etag": etag,
+                     "expires_at": time.time() + ttl}
+        store_ttl = ttl + (self.revalidate_ttl if etag else 0)
+        if "no-store" not in directives and store_ttl > 0:
+            await self.cache.set(key, new_entry, ttl=store_ttl)
+        return new_entry
@@ -0,0 +1,161 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Optional
+
+import aiohttp
+from loguru import logger
+
+from app.config.config import settings
+from app.core.metrics import registry
+
+
+HTTP_POOL_CONNECTIONS = registry.gauge(
+    "http_client_pool_connections",
+    "Connections of the shared HTTP client pool", labelnames=("state",))
+HTTP_POOL_LIMIT = registry.gauge(
+    "http_client_pool_limit", "Connection limit of the shared HTTP client pool")
+HTTP_CONNECTIONS_TOTAL = registry.counter(
+    "http_client_connections_total",
+    "Connections handed out by the pool, newly created or reused",
+    labelnames=("event",))
+HTTP_CONNECTION_WAIT_SECONDS = registry.histogram(
+    "http_client_connection_wait_seconds",
+    "Time requests spent waiting for a free pooled connection")
+
+
+async def _on_queued_start(session, context: SimpleNamespace, params) -> None:
+    context.queued_at = session.loop.time()
+
+
+async def _on_queued_end(session, context: SimpleNamespace, params) -> None:
+    HTTP_CONNECTION_WAIT_SECONDS.observe(session.loop.time() - context.queued_at)
+
+
+async def _on_connection_created(session, context: SimpleNamespace,
+                                 params) -> None:
+    HTTP_CONNECTIONS_TOTAL.inc(event="created")
+
+
+async def _on_connection_reused(session, context: SimpleNamespace,
+                                params) -> None:
+    HTTP_CONNECTIONS_TOTAL.inc(event="reused")
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_queued_start.append(_on_queued_start)
+    trace_config.on_connection_queued_end.append(_on_queued_end)
+    trace_config.on_connection_create_end.append(_on_connection_created)
+    trace_config.on_connection_reuseconn.append(_on_connection_reused)
+    return trace_config
+
+
+# aiohttp has no public accessors for pool usage, the private attributes
+# read below may change in any release: the gauges then read 0 instead of
+# failing the metrics endpoint
+def _connections_in_use(connector: aiohttp.BaseConnector) -> int:
+    try:
+        return len(getattr(connector, "_acquired", ()))
+    except TypeError:
+        return 0
+
+
+def _idle_connections(connector: aiohttp.BaseConnector) -> int:
+    conns = getattr(connector, "_conns", None)
+    try:
+        return sum(len(host_conns) for host_conns in conns.values())
+    except (AttributeError, TypeError):
+        return 0
+
+
+def create_session(**kwargs) -> aiohttp.ClientSession:
+    """Create a pooled session configured from ``settings.gateway``.
+
+    Must be called with a running event loop.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=settings.gateway.pool_limit,
+        limit_per_host=settings.gateway.pool_limit_per_host,
+        keepalive_timeout=settings.gateway.keepalive_timeout,
+        ttl_dns_cache=settings.gateway.ttl_dns_cache,
+    )
+    HTTP_POOL_CONNECTIONS.set_function(lambda: _connections_in_use(connector),
+                                       state="in_use")
+    HTTP_POOL_CONNECTIONS.set_function(lambda: _idle_connections(connector),
+                                       state="idle")
+    HTTP_POOL_LIMIT.set(connector.limit)
+    return aiohttp.ClientSession(connector=connector,
+                                 trace_configs=[_trace_config()], **kwargs)
+
+
+# Session shared by all gateways, opened and closed by the app lifespan
+http_session: Optional[aiohttp.ClientSession] = None
+# Event loop the shared session belongs to and the task closing it there
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+_session_closer: Optional["asyncio.Task[None]"] = None
+
+
+async def _close_on_shutdown(session: aiohttp.ClientSession) -> None:
+    # Waits until cancelled: by close_http_session or, for scripts that
+    # never call it, by asyncio.run cancelling the remaining tasks before
+    # it closes the loop, so the session is closed on its own loop
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        if not session.closed:
+            await session.close()
+
+
+def _release(session: aiohttp.ClientSession,
+             loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Close a session of another event loop on that loop."""
+    if session.closed:
+        return
+    if loop is not None and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(session.close(), loop)
+    else:
+        logger.warning("Shared HTTP session outlived its event loop unclosed")
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Shared session of the running event loop.
+
+    Created on first use outside of the app lifespan. Scripts and Celery
+    tasks calling ``asyncio.run`` repeatedly get a new session for every
+    loop, a session can not be used outside of the loop it was created in.
+    A session left open is closed when its loop shuts down.
+    """
+    global http_session, _session_loop, _session_closer
+    loop = asyncio.get_running_loop()
+    if http_session is not None and _session_loop is not loop:
+        logger.debug("Event loop changed, replacing the shared HTTP session")
+        _release(http_session, _session_loop)
+        http_session = None
+    if http_session is None or http_session.closed:
+        http_session = create_session()
+        _session_loop = loop
+        _session_closer = loop.create_task(_close_on_shutdown(http_session))
+    return http_session
+
+
+def start_http_session() -> aiohttp.ClientSession:
+    session = get_http_session()
+    logger.info(
+        f"HTTP client pool: limit={settings.gateway.pool_limit}, "
+        f"limit_per_host={settings.gateway.pool_limit_per_host}, "
+        f"keepalive_timeout={settings.gateway.keepalive_timeout}s")
+    return session
+
+
+async def close_http_session() -> None:
+    global http_session, _session_loop, _session_closer
+    session, loop, closer = http_session, _session_loop, _session_closer
+    http_session = _session_loop = _session_closer = None
+    if session is None:
+        return
+    if loop is asyncio.get_running_loop():
+        await session.close()
+        if closer is not None:
+            closer.cancel()
+    else:
+        _release(session, loop)
@@ -0,0 +1,87 @@
+import codecs
+import json
+from typing import Any, AsyncIterator, Callable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - optional speedup
+    ijson = None
+
+
+READ_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+
+def json_loads(data: bytes) -> Any:
+    """Decode JSON with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+async def iter_json_array(stream: Any, read_size: int = READ_SIZE,
+                          use_ijson: bool = True) -> AsyncIterator[Any]:
+    """Yield the items of a top-level JSON array read from ``stream``.
+
+    ``stream`` is any object with an async ``read(n)`` such as
+    ``aiohttp.StreamReader``. Only the item being decoded and one read
+    are held in memory. ijson is used when installed, otherwise items are
+    split with ``json.JSONDecoder.raw_decode``.
+    """
+    if use_ijson and ijson is not None:
+        async for item in ijson.items(stream, "item", use_float=True):
+            yield item
+        return
+
+    async for item in _iter_with_raw_decode(stream.read, read_size):
+        yield item
+
+
+async def _iter_with_raw_decode(read: Callable, read_size: int) -> AsyncIterator[Any]:
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, position = "", 0
+    started = finished = eof = False
+    while not finished:
+        if not eof:
+            chunk = await read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + text_decoder.decode(chunk, final=eof)
+            position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position == len(buffer):
+                break
+            char = buffer[position]
+            if not started:
+                if char != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if char == "]":
+                finished = True
+                break
+            if char == ",":
+                position += 1
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                break
+            # A number at the end of the buffer may continue in the next read
+            if end == len(buffer) and not eof:
+                break
+            position = end
+            yield item
+        if eof and not finished:
+            raise ValueError("Unexpected end of JSON array")
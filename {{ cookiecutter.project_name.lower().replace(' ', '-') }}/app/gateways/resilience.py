@@ -0,0 +1,149 @@
+import random
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from app.config.config import settings
+from app.core.metrics import registry
+
+
+IDEMPOTENT_METHODS = frozenset(
+    {"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+
+GATEWAY_RETRIES_TOTAL = registry.counter(
+    "gateway_retries_total", "Upstream requests retried",
+    labelnames=("gateway", "reason"))
+GATEWAY_HEDGES_TOTAL = registry.counter(
+    "gateway_hedges_total", "Hedged requests fired and won",
+    labelnames=("gateway", "outcome"))
+GATEWAY_CIRCUIT_STATE = registry.gauge(
+    "gateway_circuit_state",
+    "Circuit breaker state: 0 closed, 1 half-open, 2 open",
+    labelnames=("gateway",))
+GATEWAY_CIRCUIT_OPENED_TOTAL = registry.counter(
+    "gateway_circuit_opened_total", "Times a circuit breaker opened",
+    labelnames=("gateway",))
+GATEWAY_CIRCUIT_REJECTED_TOTAL = registry.counter(
+    "gateway_circuit_rejected_total",
+    "Requests failed fast by an open circuit breaker",
+    labelnames=("gateway",))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_in: float):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(
+            f"Circuit for {name} is open, retry in {retry_in:.1f}s")
+
+
+class RetryPolicy:
+    """Retries of idempotent requests with full-jitter exponential backoff."""
+
+    def __init__(self, max_attempts: Optional[int] = None,
+                 backoff_base: Optional[float] = None,
+                 backoff_max: Optional[float] = None,
+                 retry_statuses: Iterable[int] = (429, 502, 503, 504),
+                 methods: Iterable[str] = IDEMPOTENT_METHODS):
+        self.max_attempts = max(1, max_attempts if max_attempts is not None
+                                else settings.gateway.retry_attempts)
+        self.backoff_base = (backoff_base if backoff_base is not None
+                             else settings.gateway.retry_backoff_base)
+        self.backoff_max = (backoff_max if backoff_max is not None
+                            else settings.gateway.retry_backoff_max)
+        self.retry_statuses: FrozenSet[int] = frozenset(retry_statuses)
+        self.methods: FrozenSet[str] = frozenset(m.upper() for m in methods)
+
+    def attempts_for(self, method: str) -> int:
+        return self.max_attempts if method.upper() in self.methods else 1
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number ``attempt`` (1-based)."""
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Fail fast while an upstream keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls are rejected for ``recovery_timeout`` seconds. Then up to
+    ``half_open_max_calls`` trial calls are let through: a success closes
+    the circuit, a failure opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None,
+                 recovery_timeout: Optional[float] = None,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = (
+            failure_threshold if failure_threshold is not None
+            else settings.gateway.circuit_failure_threshold)
+        self.recovery_timeout = (
+            recovery_timeout if recovery_timeout is not None
+            else settings.gateway.circuit_recovery_timeout)
+        self.half_open_max_calls = half_open_max_calls
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_calls = 0
+        self._state = self.CLOSED
+        self._lock = threading.Lock()
+        GATEWAY_CIRCUIT_STATE.set(self.CLOSED, gateway=name)
+
+    @property
+    def state(self) -> int:
+        if (self._state == self.OPEN
+                and time.monotonic() - self.opened_at >= self.recovery_timeout):
+            return self.HALF_OPEN
+        return self._state
+
+    def _set_state(self, state: int) -> None:
+        self._state = state
+        GATEWAY_CIRCUIT_STATE.set(state, gateway=self.name)
+
+    def before_call(self) -> None:
+        """Raise ``CircuitOpenError`` unless a call may go through."""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN:
+                if self._state == self.OPEN:
+                    self._set_state(self.HALF_OPEN)
+                    self._trial_calls = 0
+                if self._trial_calls < self.half_open_max_calls:
+                    self._trial_calls += 1
+                    return
+            GATEWAY_CIRCUIT_REJECTED_TOTAL.inc(gateway=self.name)
+            retry_in = max(0.0, self.opened_at + self.recovery_timeout
+                           - time.monotonic())
+            raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            if self._state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or (
+                    self._state == self.CLOSED
+                    and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+                GATEWAY_CIRCUIT_OPENED_TOTAL.inc(gateway=self.name)
+
+
+# Breakers are shared by all gateways talking to the same upstream
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    breaker = _circuit_breakers.get(name)
+    if breaker is None:
+        breaker = _circuit_breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
@@ -1,14 +1,64 @@
+from typing import Any, Dict, List, Optional
+
 import numpy as np
 
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator
+
+
+FEATURE_NAMES = ("feature1", "feature2", "feature3", "feature4", "feature5")
 
 
 class HealthResponse(BaseModel):
     status: bool
 
 
+class CacheStatsResponse(BaseModel):
+    backend: str
+    namespace: str
+    hits: int
+    misses: int
+    errors: int
+    hit_ratio: Optional[float]
+    functions: Dict[str, Dict[str, Any]]
+    local_tier: Optional[Dict[str, Any]]
+    server: Optional[Dict[str, int]]
+
+
 class MachineLearningResponse(BaseModel):
     prediction: float
+    model_version: Optional[str] = None
+
+
+class MachineLearningBatchResponse(BaseModel):
+    predictions: List[float]
+    model_version: Optional[str] = None
+
+
+class ModelVersionResponse(BaseModel):
+    name: str
+    path: str
+    loaded_at: float
+    in_flight: int
+    warmed_up: bool
+    warmup_error: Optional[str] = None
+
+
+class ModelRegistryResponse(BaseModel):
+    active: Optional[str]
+    canary: Optional[str]
+    canary_weight: float
+    versions: List[ModelVersionResponse]
+
+
+class ModelVersionLoadInput(BaseModel):
+    # Relative to MODEL_PATH, paths outside of it are rejected
+    path: str
+    activate: bool = False
+
+
+class ModelCanaryInput(BaseModel):
+    name: Optional[str] = None
+    weight: float = 0.0
 
 
 class MachineLearningDataInput(BaseModel):
@@ -30,3 +80,48 @@ class MachineLearningDataInput(BaseModel):
                 ]
             ]
         )
+
+
+class MachineLearningColumnarInput(BaseModel):
+    feature1: List[float]
+    feature2: List[float]
+    feature3: List[float]
+    feature4: List[float]
+    feature5: List[float]
+
+
+class MachineLearningBatchDataInput(BaseModel):
+    """Many rows either as ``rows`` (row-major, features ordered as
+    ``FEATURE_NAMES``) or as ``columns`` (one array per feature)."""
+
+    rows: Optional[List[List[float]]] = None
+    columns: Optional[MachineLearningColumnarInput] = None
+
+    @root_validator(skip_on_failure=True)
+    def check_batch_shape(cls, values):
+        rows, columns = values.get("rows"), values.get("columns")
+        if (rows is None) == (columns is None):
+            raise ValueError("Exactly one of 'rows' or 'columns' is required")
+        if rows is not None:
+            if any(len(row) != len(FEATURE_NAMES) for row in rows):
+                raise ValueError(
+                    f"Every row must contain {len(FEATURE_NAMES)} features")
+        else:
+            lengths = {len(getattr(columns, name)) for name in FEATURE_NAMES}
+            if len(lengths) > 1:
+                raise ValueError("All feature columns must have the same length")
+        return values
+
+    def __len__(self):
+        if self.rows is not None:
+            return len(self.rows)
+        return len(self.columns.feature1)
+
+    def get_np_array(self):
+        if self.rows is not None:
+            return np.array(self.rows, dtype=np.float64).reshape(
+                -1, len(FEATURE_NAMES))
+        return np.column_stack(
+            [np.asarray(getattr(self.columns, name), dtype=np.float64)
+             for name in FEATURE_NAMES]
+        ).reshape(-1, len(FEATURE_NAMES))
@@ -1,9 +1,32 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
 import os
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import joblib
+import numpy as np
 from loguru import logger
 
-from app.core.errors import PredictException, ModelLoadException
+from app.core.errors import (
+    PredictException,
+    ModelLoadException,
+    ModelNotFoundError,
+    ModelNotLoadedError,
+    InferenceOverloadedError,
+    InvalidPayloadError,
+)
+from app.core.metrics import registry
+from app.core.utils import get_process_memory
 from app.config.config import settings
+from app.schemas.schemas import MachineLearningDataInput
 
 
 class MachineLearningModelInference(object):
@@ -23,13 +46,16 @@ class MachineLearningModelInference(object):
         return cls.model
 
     @staticmethod
-    def load(load_wrapper):
+    def get_path():
         model_path = settings.model.model_path
         model_name = settings.model.model_name
         if settings.model.model_path.endswith("/"):
-            path = f"{model_path}{model_name}"
-        else:
-            path = f"{model_path}/{model_name}"
+            return f"{model_path}{model_name}"
+        return f"{model_path}/{model_name}"
+
+    @staticmethod
+    def load(load_wrapper, path=None):
+        path = path or MachineLearningModelInference.get_path()
         if not os.path.exists(path):
             message = f"Machine learning model at {path} not exists!"
             logger.error(message)
@@ -40,3 +66,767 @@ class MachineLearningModelInference(object):
             logger.error(message)
             raise ModelLoadException(message)
         return model
+
+
+# Model loading----------------------------------------------------------------
+PROCESS_MEMORY_BYTES = registry.gauge(
+    "process_memory_bytes", "Memory of this worker process by kind",
+    labelnames=("kind",))
+
+
+def get_load_wrapper():
+    """``joblib.load`` configured with ``settings.model.mmap_mode``.
+
+    With ``mmap_mode="r"`` the NumPy arrays of an uncompressed dump are
+    mapped read-only from the page cache instead of being copied into each
+    worker, so N workers share one copy of the weights. Compressed dumps
+    can not be mapped and are loaded into memory as usual.
+    """
+    if settings.model.mmap_mode:
+        return functools.partial(joblib.load, mmap_mode=settings.model.mmap_mode)
+    return joblib.load
+
+
+def load_model_with_report(path=None):
+    before = get_process_memory()
+    start_time = time.perf_counter()
+    model = MachineLearningModelInference.load(get_load_wrapper(), path)
+    elapsed = time.perf_counter() - start_time
+    after = get_process_memory()
+    for kind in after:
+        PROCESS_MEMORY_BYTES.set_function(
+            lambda kind=kind: get_process_memory().get(kind, 0), kind=kind)
+    delta = {kind: after[kind] - before.get(kind, 0) for kind in after}
+    logger.info(
+        f"Model {path or MachineLearningModelInference.get_path()} "
+        f"loaded in {elapsed:.2f}s "
+        f"(pid={os.getpid()}, mmap_mode={settings.model.mmap_mode}), "
+        f"memory={after}, delta={delta}")
+    return model
+
+
+# Micro-batching---------------------------------------------------------------
+BATCHES_TOTAL = registry.counter(
+    "model_batches_total", "Number of batched predict calls")
+BATCH_ITEMS_TOTAL = registry.counter(
+    "model_batch_items_total", "Number of requests served through batches")
+BATCH_SIZE = registry.histogram(
+    "model_batch_size", "Rows per batched predict call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+BATCH_WAIT_SECONDS = registry.histogram(
+    "model_batch_wait_seconds", "Time a request spent queued before predict")
+BATCH_QUEUE_DEPTH = registry.gauge(
+    "model_batch_queue_depth", "Requests waiting to be batched")
+BATCH_REJECTED_TOTAL = registry.counter(
+    "model_batch_rejected_total", "Requests rejected because the queue is full")
+
+_QueueItem = Tuple[np.ndarray, "asyncio.Future[Any]", float]
+
+# PredictException and ModelLoadException derive from BaseException: a model
+# failure is caught with BaseException, everything but these is reported
+_NOT_MODEL_ERRORS = (asyncio.CancelledError, KeyboardInterrupt, SystemExit)
+
+
+class MicroBatcher:
+    """Collect concurrent predictions and run them as one ``predict`` call.
+
+    Requests are queued until either ``max_batch_size`` rows are collected
+    or ``max_wait_ms`` has passed since the first queued request, then the
+    inputs are stacked into a single matrix and the results are sliced back
+    to the awaiting coroutines.
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], Any],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 max_queue_size: int = 1024):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.queue: Optional["asyncio.Queue[_QueueItem]"] = None
+        self._worker: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        BATCH_QUEUE_DEPTH.set_function(self.queue.qsize)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        while self.queue is not None and not self.queue.empty():
+            _, future, _ = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(
+                    InferenceOverloadedError("Batcher is shutting down"))
+
+    async def submit(self, data_point: np.ndarray) -> Any:
+        if not self.running:
+            raise InferenceOverloadedError("Batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((data_point, future, time.monotonic()))
+        except asyncio.QueueFull as err:
+            BATCH_REJECTED_TOTAL.inc()
+            raise InferenceOverloadedError("Prediction queue is full") from err
+        return await future
+
+    async def _collect(self) -> List[_QueueItem]:
+        loop = asyncio.get_running_loop()
+        item = await self.queue.get()
+        batch = [item]
+        rows = len(item[0])
+        deadline = loop.time() + self.max_wait
+        while rows < self.max_batch_size:
+            if self.queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self.queue.get_nowait()
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    async def _process(self, batch: List[_QueueItem]) -> None:
+        # Skip requests whose clients have already gone away
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+        now = time.monotonic()
+        for _, _, enqueued_at in batch:
+            BATCH_WAIT_SECONDS.observe(now - enqueued_at)
+        inputs = np.vstack([data_point for data_point, _, _ in batch])
+        BATCHES_TOTAL.inc()
+        BATCH_ITEMS_TOTAL.inc(len(batch))
+        BATCH_SIZE.observe(len(inputs))
+        try:
+            predictions = self.predict_fn(inputs)
+            if inspect.isawaitable(predictions):
+                predictions = await predictions
+        except _NOT_MODEL_ERRORS:
+            raise
+        except BaseException as err:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(err)
+            return
+        offset = 0
+        for data_point, future, _ in batch:
+            rows = len(data_point)
+            if not future.done():
+                future.set_result(predictions[offset:offset + rows])
+            offset += rows
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._process(batch)
+            except asyncio.CancelledError:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(
+                            InferenceOverloadedError("Batcher is shutting down"))
+                raise
+            except _NOT_MODEL_ERRORS:
+                raise
+            except BaseException as err:
+                logger.exception(f"Micro-batch failed: {err}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(err)
+
+
+batcher: Optional[MicroBatcher] = None
+
+
+def get_batcher() -> Optional[MicroBatcher]:
+    return batcher
+
+
+async def start_batcher(predict_fn: Callable[[np.ndarray], Any]) -> None:
+    global batcher
+    batcher = MicroBatcher(
+        predict_fn,
+        max_batch_size=settings.model.max_batch_size,
+        max_wait_ms=settings.model.max_batch_wait_ms,
+        max_queue_size=settings.model.max_queue_size,
+    )
+    await batcher.start()
+    logger.info(
+        f"Micro-batching enabled: max_batch_size={batcher.max_batch_size}, "
+        f"max_wait_ms={settings.model.max_batch_wait_ms}")
+
+
+async def stop_batcher() -> None:
+    global batcher
+    if batcher is not None:
+        await batcher.stop()
+        batcher = None
+
+
+# Inference executor-----------------------------------------------------------
+INFERENCE_SECONDS = registry.histogram(
+    "model_inference_seconds", "Wall time of a predict call in the executor",
+    labelnames=("executor",))
+INFERENCE_IN_FLIGHT = registry.gauge(
+    "model_inference_in_flight", "Predict calls submitted to the executor",
+    labelnames=("executor",))
+
+
+# Models loaded inside a pool process, by version name and generation
+_worker_models: "OrderedDict[Tuple[str, int], Any]" = OrderedDict()
+_MAX_WORKER_MODELS = 4
+
+
+def _load_worker_model():
+    # Runs once in every process of the pool so predictions never pay the
+    # model loading cost
+    MachineLearningModelInference.model = load_model_with_report()
+    _worker_models[(settings.model.model_name, 0)] = MachineLearningModelInference.model
+
+
+def _predict_in_worker(data_point, method="predict", version_name=None,
+                       model_path=None, generation=0):
+    if version_name is None:
+        return MachineLearningModelInference.predict(
+            data_point, load_wrapper=get_load_wrapper(), method=method)
+    # A version reloaded under the same name has a new generation, so the
+    # worker never serves the model it replaced
+    key = (version_name, generation)
+    model = _worker_models.get(key)
+    if model is None:
+        model = MachineLearningModelInference.load(get_load_wrapper(),
+                                                   model_path)
+        _worker_models[key] = model
+        while len(_worker_models) > _MAX_WORKER_MODELS:
+            _worker_models.popitem(last=False)
+    _worker_models.move_to_end(key)
+    return _call_model(model, data_point, method)
+
+
+def _call_model(model, data_point, method="predict"):
+    if hasattr(model, method):
+        return getattr(model, method)(data_point)
+    raise PredictException(f"'{method}' attribute is missing")
+
+
+class InferenceExecutor:
+    """Run the CPU-bound ``predict`` call outside of the event loop."""
+
+    EXECUTOR_TYPES = ("inline", "thread", "process")
+
+    def __init__(self, executor_type: str = "thread", max_workers: int = 1):
+        if executor_type not in self.EXECUTOR_TYPES:
+            raise ValueError(
+                f"Unknown executor type '{executor_type}', "
+                f"expected one of {self.EXECUTOR_TYPES}")
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self.pool: Optional[Executor] = None
+
+    def start(self) -> None:
+        if self.executor_type == "thread":
+            self.pool = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="inference",
+            )
+        elif self.executor_type == "process":
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_load_worker_model,
+            )
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait)
+            self.pool = None
+
+    async def predict(self, data_point: np.ndarray, method: str = "predict",
+                      version: Optional["ModelVersion"] = None) -> Any:
+        INFERENCE_IN_FLIGHT.inc(executor=self.executor_type)
+        start_time = time.perf_counter()
+        if version is None:
+            call = functools.partial(_predict_in_worker, data_point, method)
+        elif self.executor_type == "process":
+            # Model objects stay in the parent, workers load versions by path
+            call = functools.partial(_predict_in_worker, data_point, method,
+                                     version.name, version.path,
+                                     version.generation)
+        else:
+            call = functools.partial(_call_model, version.model, data_point,
+                                     method)
+        try:
+            if self.pool is None:
+                return call()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, call)
+        finally:
+            INFERENCE_IN_FLIGHT.dec(executor=self.executor_type)
+            INFERENCE_SECONDS.observe(time.perf_counter() - start_time,
+                                      executor=self.executor_type)
+
+
+inference_executor: Optional[InferenceExecutor] = None
+
+
+def get_inference_executor() -> Optional[InferenceExecutor]:
+    return inference_executor
+
+
+def start_inference_executor() -> InferenceExecutor:
+    global inference_executor
+    inference_executor = InferenceExecutor(
+        executor_type=settings.model.executor_type,
+        max_workers=settings.model.executor_workers,
+    )
+    inference_executor.start()
+    logger.info(
+        f"Inference executor started: type={inference_executor.executor_type}, "
+        f"workers={inference_executor.max_workers}")
+    return inference_executor
+
+
+def stop_inference_executor() -> None:
+    global inference_executor
+    if inference_executor is not None:
+        inference_executor.shutdown()
+        inference_executor = None
+
+
+# Model registry---------------------------------------------------------------
+MODEL_VERSION_IN_FLIGHT = registry.gauge(
+    "model_version_in_flight", "Predictions running on a model version",
+    labelnames=("version",))
+MODEL_VERSION_REQUESTS_TOTAL = registry.counter(
+    "model_version_requests_total", "Predictions routed to a model version",
+    labelnames=("version",))
+MODEL_RELOADS_TOTAL = registry.counter(
+    "model_reloads_total", "Model versions loaded at runtime",
+    labelnames=("status",))
+
+
+def _file_fingerprint(path: str) -> str:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "-"
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+class ModelVersion:
+    def __init__(self, name: str, model: Any, path: str, generation: int = 0):
+        self.name = name
+        self.model = model
+        self.path = path
+        # Incremented every time a version is loaded under the same name
+        self.generation = generation
+        # Identifies the loaded model in shared caches: another generation
+        # or model file under the same name never reuses its entries
+        self.cache_key = f"{name}:{generation}:{_file_fingerprint(path)}"
+        self.loaded_at = time.time()
+        self.in_flight = 0
+        self.warmed_up = False
+        self.warmup_error: Optional[str] = None
+        MODEL_VERSION_IN_FLIGHT.set_function(lambda: self.in_flight,
+                                             version=name)
+
+    @contextmanager
+    def acquire(self, count: bool = True):
+        self.in_flight += 1
+        if count:
+            MODEL_VERSION_REQUESTS_TOTAL.inc(version=self.name)
+        try:
+            yield self
+        finally:
+            self.in_flight -= 1
+
+    async def wait_drained(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not self.in_flight
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "in_flight": self.in_flight,
+            "warmed_up": self.warmed_up,
+            "warmup_error": self.warmup_error,
+        }
+
+
+class ModelRegistry:
+    """Named model versions served side by side.
+
+    One version is active and receives all traffic unless a request names a
+    version explicitly or a canary version is configured, in which case the
+    canary gets ``canary_weight`` of the unnamed traffic. Swapping the active
+    version is a single reference assignment; the previous version is kept
+    until its in-flight predictions drain.
+    """
+
+    def __init__(self):
+        self.versions: Dict[str, ModelVersion] = {}
+        self.active: Optional[str] = None
+        self.canary: Optional[str] = None
+        self.canary_weight = 0.0
+        self._generations: Dict[str, int] = {}
+        self._lock = asyncio.Lock()
+        self._watcher: Optional["asyncio.Task[None]"] = None
+
+    def register(self, version: ModelVersion, activate: bool = True) -> None:
+        self.versions[version.name] = version
+        self._generations[version.name] = version.generation
+        if activate or self.active is None:
+            self._activate(version.name)
+
+    def resolve(self, name: Optional[str] = None) -> ModelVersion:
+        if name is not None:
+            version = self.versions.get(name)
+            if version is None:
+                raise ModelNotFoundError(f"Model version '{name}' not found")
+            return version
+        if self.canary is not None and random.random() < self.canary_weight:
+            return self.versions[self.canary]
+        if self.active is None:
+            raise ModelNotLoadedError("ML model is not loaded")
+        return self.versions[self.active]
+
+    async def load(self, name: str, path: str,
+                   activate: bool = False) -> ModelVersion:
+        """Load and warm up a version in the background, then register it."""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            try:
+                model = await loop.run_in_executor(
+                    None, load_model_with_report, path)
+                generation = self._generations.get(name, -1) + 1
+                version = ModelVersion(name, model, path, generation)
+                await warm_up(version)
+            except BaseException:
+                MODEL_RELOADS_TOTAL.inc(status="failed")
+                raise
+            MODEL_RELOADS_TOTAL.inc(status="loaded")
+            previous = self.versions.get(name)
+            self.register(version, activate=activate)
+            if previous is not None:
+                self._schedule_retire(previous)
+            return version
+
+    def activate(self, name: str) -> None:
+        if name not in self.versions:
+            raise ModelNotFoundError(f"Model version '{name}' not found")
+        self._activate(name)
+
+    def _activate(self, name: str) -> None:
+        previous, self.active = self.active, name
+        MachineLearningModelInference.model = self.versions[name].model
+        if self.canary == name:
+            self.set_canary(None)
+        logger.info(f"Model version '{name}' is active (was '{previous}')")
+
+    def set_canary(self, name: Optional[str], weight: float = 0.0) -> None:
+        if name is not None and name not in self.versions:
+            raise ModelNotFoundError(f"Model version '{name}' not found")
+        if not 0 <= weight <= 1:
+            raise ValueError("Canary weight must be between 0 and 1")
+        self.canary = name
+        self.canary_weight = weight if name is not None else 0.0
+
+    def unload(self, name: str) -> None:
+        if name == self.active:
+            raise ValueError("The active model version can not be unloaded")
+        version = self.versions.pop(name, None)
+        if self.canary == name:
+            self.set_canary(None)
+        if version is not None:
+            self._schedule_retire(version)
+
+    def _schedule_retire(self, version: ModelVersion) -> None:
+        try:
+            asyncio.get_running_loop().create_task(self._retire(version))
+        except RuntimeError:
+            version.model = None
+
+    async def _retire(self, version: ModelVersion) -> None:
+        drained = await version.wait_drained(settings.model.drain_timeout_s)
+        if not drained:
+            logger.warning(f"Model version '{version.name}' retired with "
+                           f"{version.in_flight} predictions still running")
+        version.model = None
+        logger.info(f"Model version '{version.name}' retired")
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "canary": self.canary,
+            "canary_weight": self.canary_weight,
+            "versions": [version.describe()
+                         for version in self.versions.values()],
+        }
+
+    def clear(self) -> None:
+        self.versions.clear()
+        self._generations.clear()
+        self.active = self.canary = None
+        self.canary_weight = 0.0
+
+    async def watch(self, path: str, interval: float) -> None:
+        """Load ``path`` as a new active version whenever its mtime changes."""
+        last_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        while True:
+            await asyncio.sleep(interval)
+            if not os.path.exists(path):
+                continue
+            mtime = os.path.getmtime(path)
+            if mtime == last_mtime:
+                continue
+            last_mtime = mtime
+            name = f"{settings.model.model_name}@{int(mtime)}"
+            logger.info(f"Model file {path} changed, loading '{name}'")
+            previous = self.active
+            try:
+                await self.load(name, path, activate=True)
+            except Exception as err:
+                logger.exception(f"Model reload from {path} failed: {err}")
+                continue
+            if previous not in (None, name, self.canary):
+                self.unload(previous)
+
+    def start_watcher(self, path: str, interval: float) -> None:
+        self._watcher = asyncio.get_running_loop().create_task(
+            self.watch(path, interval))
+
+    async def stop_watcher(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+
+model_registry = ModelRegistry()
+
+
+def resolve_model_path(path: str) -> str:
+    """Absolute path of a model file, which must be inside MODEL_PATH.
+
+    Loading a model unpickles it, so only files the deployment ships are
+    accepted. Relative paths are resolved against MODEL_PATH.
+    """
+    model_dir = os.path.realpath(settings.model.model_path)
+    resolved = os.path.realpath(os.path.join(model_dir, path))
+    if os.path.commonpath([model_dir, resolved]) != model_dir:
+        raise InvalidPayloadError(
+            f"Model path must be inside {settings.model.model_path}")
+    return resolved
+
+
+# Warm-up----------------------------------------------------------------------
+WARMUP_SECONDS = registry.histogram(
+    "model_warmup_seconds", "Latency of warm-up predictions",
+    labelnames=("batch_size",))
+
+
+def load_input_example() -> np.ndarray:
+    with open(settings.model.input_example, "r") as file:
+        return MachineLearningDataInput(**json.load(file)).get_np_array()
+
+
+async def _predict_version(data_point: np.ndarray, version: ModelVersion) -> Any:
+    if inference_executor is not None:
+        return await inference_executor.predict(data_point, version=version)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _call_model, version.model,
+                                      data_point)
+
+
+async def warm_up(version: ModelVersion) -> Dict[int, List[float]]:
+    """Run ``settings.model.warmup_iterations`` predictions per batch size.
+
+    Lazy initialisation inside the model (BLAS thread pools, caches, JIT
+    kernels) happens here instead of on user traffic. Every executor worker
+    gets a prediction per iteration, so process pools are warmed too. A
+    failure is kept in ``version.warmup_error`` and raised.
+    """
+    version.warmup_error = None
+    parallel = inference_executor.max_workers if inference_executor else 1
+    latencies: Dict[int, List[float]] = {}
+    try:
+        example = load_input_example()
+        for batch_size in settings.model.warmup_batch_sizes:
+            batch = np.repeat(example, batch_size, axis=0)
+            latencies[batch_size] = []
+            for _ in range(settings.model.warmup_iterations):
+                start_time = time.perf_counter()
+                await asyncio.gather(*(_predict_version(batch, version)
+                                       for _ in range(parallel)))
+                elapsed = time.perf_counter() - start_time
+                WARMUP_SECONDS.observe(elapsed, batch_size=str(batch_size))
+                latencies[batch_size].append(elapsed)
+    except _NOT_MODEL_ERRORS:
+        raise
+    except BaseException as e:
+        version.warmup_error = str(e) or type(e).__name__
+        raise
+    version.warmed_up = True
+    report = ", ".join(
+        f"batch_size={size}: first={timings[0] * 1000:.1f}ms "
+        f"last={timings[-1] * 1000:.1f}ms"
+        for size, timings in latencies.items() if timings)
+    logger.info(f"Model version '{version.name}' warmed up ({report or 'skipped'})")
+    return latencies
+
+
+def model_not_ready_reason() -> Optional[str]:
+    """Why the active version can not serve yet, None once it is warmed up."""
+    version = model_registry.versions.get(model_registry.active)
+    if version is None:
+        return "Model is not loaded"
+    if version.warmup_error is not None:
+        return f"Model warm-up failed: {version.warmup_error}"
+    if not version.warmed_up:
+        return "Model is warming up"
+    return None
+
+
+# Prediction cache-------------------------------------------------------------
+PREDICTION_CACHE_REQUESTS_TOTAL = registry.counter(
+    "model_prediction_cache_requests_total", "Prediction cache lookups",
+    labelnames=("version", "result"))
+PREDICTION_CACHE_EVICTIONS_TOTAL = registry.counter(
+    "model_prediction_cache_evictions_total",
+    "Predictions evicted to keep the cache bounded")
+
+
+class PredictionCache:
+    """Predictions stored through ``app.core.cache`` by feature vector.
+
+    Keys hash the canonical float64 bytes and shape of the input together
+    with the version's ``cache_key`` (name, generation and model file), so
+    a new or reloaded version never serves stale results.
+    The number of keys written by this worker is capped at ``max_size``,
+    the least recently used ones are deleted first.
+    """
+
+    def __init__(self, ttl: int = 300, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._keys: "OrderedDict[str, None]" = OrderedDict()
+
+    @staticmethod
+    def make_key(data_point: np.ndarray, version_key: str) -> str:
+        array = np.ascontiguousarray(data_point, dtype=np.float64)
+        digest = hashlib.blake2b(array.tobytes(), digest_size=16)
+        digest.update(str(array.shape).encode())
+        return f"prediction:{version_key}:{digest.hexdigest()}"
+
+    async def get(self, key: str, version_name: str) -> Any:
+        from app.core.cache import get_cached
+
+        value = await get_cached(key)
+        result = "miss" if value is None else "hit"
+        PREDICTION_CACHE_REQUESTS_TOTAL.inc(version=version_name, result=result)
+        if value is not None and key in self._keys:
+            self._keys.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        from app.core.cache import delete_cached, set_cached
+
+        await set_cached(key, value, ttl=self.ttl)
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.max_size:
+            evicted, _ = self._keys.popitem(last=False)
+            PREDICTION_CACHE_EVICTIONS_TOTAL.inc()
+            await delete_cached(evicted)
+
+
+prediction_cache: Optional[PredictionCache] = None
+
+
+async def start_prediction_cache() -> None:
+    global prediction_cache
+    from app.core.cache import setup_cache
+
+    await setup_cache()
+    prediction_cache = PredictionCache(
+        ttl=settings.model.prediction_cache_ttl,
+        max_size=settings.model.prediction_cache_max_size,
+    )
+    logger.info(
+        f"Prediction cache enabled: backend={settings.cache.backend}, "
+        f"ttl={prediction_cache.ttl}, max_size={prediction_cache.max_size}")
+
+
+async def stop_prediction_cache() -> None:
+    global prediction_cache
+    from app.core.cache import close_cache
+
+    if prediction_cache is not None:
+        await close_cache()
+        prediction_cache = None
+
+
+async def predict_active(inputs: np.ndarray) -> Any:
+    version = model_registry.resolve(model_registry.active)
+    # Requests in the batch were counted by run_inference
+    with version.acquire(count=False):
+        return await inference_executor.predict(inputs, version=version)
+
+
+async def _run_inference(data_point: np.ndarray, allow_batching: bool,
+                         version: ModelVersion) -> Any:
+    if (batcher is not None and allow_batching
+            and version.name == model_registry.active):
+        return await batcher.submit(data_point)
+    if inference_executor is not None:
+        return await inference_executor.predict(data_point, version=version)
+    return _call_model(version.model, data_point)
+
+
+async def run_inference(data_point: np.ndarray, allow_batching: bool = True,
+                        version: Optional[ModelVersion] = None,
+                        use_cache: bool = False) -> Any:
+    """Predict through the batcher or the executor, whichever is running.
+
+    Inputs that are already batches should pass ``allow_batching=False`` to
+    go straight to the executor as a single vectorised call. Only the active
+    model version is micro-batched. With ``use_cache`` a running prediction
+    cache is consulted first and hits never reach the model.
+    """
+    if version is None:
+        version = model_registry.resolve()
+    # Held across the cache lookup too, so the version is not retired
+    # before the prediction runs
+    with version.acquire():
+        if not use_cache or prediction_cache is None:
+            return await _run_inference(data_point, allow_batching, version)
+        key = prediction_cache.make_key(data_point, version.cache_key)
+        prediction = await prediction_cache.get(key, version.name)
+        if prediction is None:
+            prediction = await _run_inference(data_point, allow_batching, version)
+            await prediction_cache.set(key, prediction)
+        return prediction
@@ -0,0 +1,83 @@
+"""Compare cache serializers: encode/decode time and bytes on the wire.
+
+Usage:
+    PYTHONPATH=.:app python benchmarks/cache_serializers.py --repeat 200
+"""
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from app.core.serializers import get_serializer
+from app.schemas.schemas import MachineLearningResponse
+
+
+CANDIDATES = [
+    ("pickle", "none"),
+    ("orjson", "none"),
+    ("msgpack", "none"),
+    ("pickle", "zstd"),
+    ("msgpack", "zstd"),
+    ("msgpack", "lz4"),
+]
+
+
+def build_payloads() -> Dict[str, Any]:
+    rng = np.random.default_rng(0)
+    return {
+        "small dict": {"prediction": 0.42, "model_version": "v1", "ok": True},
+        "float64[10000]": rng.random(10_000),
+        "float32[1000x32]": rng.random((1_000, 32), dtype=np.float32),
+        "responses[1000]": [
+            MachineLearningResponse(prediction=float(value), model_version="v1")
+            for value in rng.random(1_000)
+        ],
+    }
+
+
+def measure(function: Callable[[], Any], repeat: int) -> float:
+    """Best-of-``repeat`` wall time in microseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6
+
+
+def run(repeat: int, threshold: int) -> List[str]:
+    rows = [f"{'payload':<18} {'serializer':<16} {'encode, us':>11} "
+            f"{'decode, us':>11} {'bytes':>10}"]
+    for payload_name, payload in build_payloads().items():
+        for name, compression in CANDIDATES:
+            label = name if compression == "none" else f"{name}+{compression}"
+            try:
+                serializer = get_serializer(name, compression, threshold)
+                data = serializer.dumps(payload)
+            except ImportError as err:
+                rows.append(f"{payload_name:<18} {label:<16} skipped ({err.name})")
+                continue
+            except TypeError:
+                rows.append(f"{payload_name:<18} {label:<16} unsupported")
+                continue
+            encode = measure(lambda serializer=serializer, payload=payload:
+                             serializer.dumps(payload), repeat)
+            decode = measure(lambda serializer=serializer, data=data:
+                             serializer.loads(data), repeat)
+            rows.append(f"{payload_name:<18} {label:<16} {encode:>11.1f} "
+                        f"{decode:>11.1f} {len(data):>10}")
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--threshold", type=int, default=1024,
+                        help="compression threshold in bytes")
+    args = parser.parse_args()
+    print("\n".join(run(args.repeat, args.threshold)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Measure message queue throughput and latency on the in-memory backend.
+
+Every combination of codec, batch size and consumer concurrency publishes
+and consumes ``--messages`` messages at the same time. A batch size of 0
+publishes with ``publish`` and consumes one message at a time, otherwise
+messages go through a ``BufferedPublisher`` and ``consume_batches``.
+Latency is measured from ``publish`` to the handler.
+
+Usage:
+    PYTHONPATH=.:app python benchmarks/message_queue.py --messages 20000 --size 512
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.core.message_queue import InMemoryQueue
+
+
+async def run_one(codec: str, batch_size: int, concurrency: int, messages: int,
+                  size: int, work: float, maxsize: int) -> Dict[str, Any]:
+    queue = InMemoryQueue(maxsize=maxsize, codec=codec)
+    latencies: List[float] = []
+    done = asyncio.Event()
+    payload = "x" * size
+
+    async def handle(message: Dict[str, Any]):
+        latencies.append(time.perf_counter() - message["sent_at"])
+        if work:
+            await asyncio.sleep(work)
+        if len(latencies) == messages:
+            done.set()
+
+    async def handle_batch(batch: List[Dict[str, Any]]):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def handle_one(message: Dict[str, Any]):
+            async with semaphore:
+                await handle(message)
+
+        await asyncio.gather(*(handle_one(message) for message in batch))
+
+    if batch_size:
+        consuming = asyncio.ensure_future(queue.consume_batches(
+            ["bench"], handle_batch, batch_size=batch_size, batch_timeout=0.005))
+    else:
+        consuming = asyncio.ensure_future(
+            queue.consume(["bench"], handle, concurrency=concurrency))
+
+    started = time.perf_counter()
+    if batch_size:
+        async with queue.buffered(batch_size=batch_size, max_buffer=maxsize) as publisher:
+            for i in range(messages):
+                await publisher.publish("bench", {"id": i, "sent_at": time.perf_counter(),
+                                                  "payload": payload})
+    else:
+        for i in range(messages):
+            await queue.publish("bench", {"id": i, "sent_at": time.perf_counter(),
+                                          "payload": payload})
+    published = time.perf_counter()
+    await done.wait()
+    finished = time.perf_counter()
+    await queue.stop_consuming()
+    await consuming
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "publish": messages / (published - started),
+        "end_to_end": messages / (finished - started),
+        "p50": p50, "p95": p95, "p99": p99,
+    }
+
+
+def run(args: argparse.Namespace) -> List[str]:
+    rows = [f"{'codec':<8} {'batch':>6} {'conc':>5} {'publish/s':>11} "
+            f"{'e2e/s':>11} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9}"]
+    for codec in args.codecs:
+        for batch_size in args.batch_sizes:
+            for concurrency in args.concurrency:
+                label = f"{codec:<8} {batch_size:>6} {concurrency:>5}"
+                try:
+                    result = asyncio.run(run_one(
+                        codec, batch_size, concurrency, args.messages, args.size,
+                        args.work_ms / 1000, args.maxsize))
+                except ImportError as err:
+                    rows.append(f"{label} skipped ({err.name})")
+                    continue
+                rows.append(f"{label} {result['publish']:>11.0f} "
+                            f"{result['end_to_end']:>11.0f} {result['p50']:>9.2f} "
+                            f"{result['p95']:>9.2f} {result['p99']:>9.2f}")
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--size", type=int, default=256,
+                        help="payload size in bytes")
+    parser.add_argument("--codecs", nargs="+", default=["json", "orjson", "msgpack"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[0, 100],
+                        help="0 publishes and consumes message by message")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 16])
+    parser.add_argument("--work-ms", type=float, default=0.0,
+                        help="simulated handler time per message")
+    parser.add_argument("--maxsize", type=int, default=10_000,
+                        help="messages a topic holds before publishers wait")
+    args = parser.parse_args()
+    print("\n".join(run(args)))
+
+
+if __name__ == "__main__":
+    main()
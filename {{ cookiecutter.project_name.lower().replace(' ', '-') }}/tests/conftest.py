@@ -1,6 +1,8 @@
+from contextlib import asynccontextmanager
+
 import pytest
+from aiohttp import web
 from fastapi.testclient import TestClient
-from main import app
 
 
 @pytest.fixture(scope="function")
@@ -10,11 +12,14 @@ def auth_header():
 
 @pytest.fixture(scope="function")
 def api_client():
+    # Imported here so unit tests do not need the whole application
+    from main import app
     return TestClient(app)
 
 
 @pytest.fixture(scope="function")
 def api_client_authenticated(auth_header):
+    from main import app
     client = TestClient(app)
     client.headers["X-Auth"] = auth_header
     return client
@@ -29,3 +34,32 @@ def data_example_2_ids():
                      {'header': ['sum', 'date_work'], 'id': 1557, 'name': 'Не удавшиеся звонки',
                       'rows': [['86470', '2019-11-01T00:00:00Z'], ['71076', '2019-11-02T00:00:00Z'],
                                ['50562', '2019-11-03T00:00:00Z'], ['74052', '2019-11-04T00:00:00Z']]}]}
+
+
+@pytest.fixture(scope="function")
+def http_server():
+    """Serve aiohttp handlers on a free local port.
+
+    ``async with http_server({"/items": handler}) as base_url`` runs the
+    server for the block, then closes the shared HTTP session (unless
+    ``close_session=False``) and the server.
+    """
+    from app.gateways.http_client import close_http_session
+
+    @asynccontextmanager
+    async def serve(routes, close_session=True):
+        app = web.Application()
+        for path, handler in routes.items():
+            app.router.add_route("*", path, handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        try:
+            yield f"http://127.0.0.1:{runner.addresses[0][1]}"
+        finally:
+            if close_session:
+                await close_http_session()
+            await runner.cleanup()
+
+    return serve
@@ -0,0 +1,48 @@
+import pytest
+from pydantic import ValidationError
+
+from schemas.schemas import MachineLearningBatchDataInput
+
+"""
+In order to test behavior of MachineLearningBatchDataInput
+"""
+
+
+def test_rows_and_columns_build_the_same_matrix():
+    rows = MachineLearningBatchDataInput(rows=[[1, 2, 3, 4, 5], [6, 7, 8, 9, 10]])
+    columns = MachineLearningBatchDataInput(columns={
+        "feature1": [1, 6], "feature2": [2, 7], "feature3": [3, 8],
+        "feature4": [4, 9], "feature5": [5, 10],
+    })
+
+    assert rows.get_np_array().shape == (2, 5)
+    assert rows.get_np_array().tolist() == columns.get_np_array().tolist()
+    assert len(rows) == len(columns) == 2
+
+
+def test_empty_batch_has_five_columns():
+    assert MachineLearningBatchDataInput(rows=[]).get_np_array().shape == (0, 5)
+
+
+def test_exactly_one_form_is_required():
+    with pytest.raises(ValidationError):
+        MachineLearningBatchDataInput()
+    with pytest.raises(ValidationError):
+        MachineLearningBatchDataInput(
+            rows=[[1, 2, 3, 4, 5]],
+            columns={name: [1] for name in
+                     ("feature1", "feature2", "feature3", "feature4", "feature5")},
+        )
+
+
+def test_row_width_is_validated():
+    with pytest.raises(ValidationError, match="5 features"):
+        MachineLearningBatchDataInput(rows=[[1, 2, 3]])
+
+
+def test_column_lengths_are_validated():
+    with pytest.raises(ValidationError, match="same length"):
+        MachineLearningBatchDataInput(columns={
+            "feature1": [1, 2], "feature2": [1], "feature3": [1],
+            "feature4": [1], "feature5": [1],
+        })
@@ -0,0 +1,79 @@
+import io
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from core import binary_formats
+
+"""
+In order to test behavior of binary request/response formats
+"""
+
+FEATURES = ("feature1", "feature2", "feature3", "feature4", "feature5")
+
+
+def test_raw_float32_is_decoded_without_copy():
+    matrix = np.arange(10, dtype="<f4").reshape(2, 5)
+    body = matrix.tobytes()
+
+    decoded = binary_formats.decode_matrix(body, "application/octet-stream", FEATURES)
+
+    assert decoded.tolist() == matrix.tolist()
+    assert not decoded.flags.owndata
+
+
+def test_npy_round_trip():
+    matrix = np.random.rand(3, 5)
+    buffer = io.BytesIO()
+    np.save(buffer, matrix)
+
+    decoded = binary_formats.decode_matrix(buffer.getvalue(), "application/x-npy", FEATURES)
+
+    assert np.array_equal(decoded, matrix)
+
+
+def npy(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("body", [
+    # Header promising more rows than the body holds
+    npy(np.zeros((4, 5)))[:-8],
+    npy(np.zeros((4, 5))) + b"\x00" * 8,
+    npy(np.array([["a"] * 5])),
+    npy(np.array(["2020-01-01"] * 5, dtype="datetime64[D]")),
+])
+def test_malformed_npy_is_rejected(body):
+    with pytest.raises(HTTPException) as exc_info:
+        binary_formats.decode_matrix(body, "application/x-npy", FEATURES)
+    assert exc_info.value.status_code == 400
+
+
+def test_wrong_number_of_features_is_rejected():
+    with pytest.raises(HTTPException) as exc_info:
+        binary_formats.decode_matrix(b"\x00" * 12, "application/octet-stream", FEATURES)
+    assert exc_info.value.status_code == 400
+
+
+def test_unknown_content_type_is_rejected():
+    with pytest.raises(HTTPException) as exc_info:
+        binary_formats.decode_matrix(b"", "text/csv", FEATURES)
+    assert exc_info.value.status_code == 415
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "application/json"),
+    ("*/*", "application/json"),
+    ("application/x-npy;q=0.9, application/json", "application/x-npy"),
+])
+def test_negotiate(accept, expected):
+    assert binary_formats.negotiate(accept) == expected
+
+
+def test_float32_predictions_encoding():
+    encoded = binary_formats.encode_predictions([1.5, 2.5], "application/octet-stream")
+
+    assert np.frombuffer(encoded, dtype="<f4").tolist() == [1.5, 2.5]
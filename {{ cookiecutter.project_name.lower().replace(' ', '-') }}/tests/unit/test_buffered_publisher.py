@@ -0,0 +1,72 @@
+import asyncio
+
+from core.message_queue import BufferedPublisher, MessageQueue
+
+"""
+In order to test behavior of the buffered publisher
+"""
+
+
+class RecordingQueue(MessageQueue):
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.delay = delay
+        self.batches = []
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def publish(self, topic, message):
+        await self.publish_many(topic, [message])
+
+    async def publish_many(self, topic, messages):
+        await asyncio.sleep(self.delay)
+        self.batches.append((topic, list(messages)))
+
+    async def consume(self, topics, callback, concurrency=1):
+        pass
+
+    async def consume_batches(self, topics, callback, batch_size=100,
+                              batch_timeout=1.0):
+        pass
+
+
+def test_messages_are_batched_per_topic_and_flushed_on_stop():
+    queue = RecordingQueue()
+
+    async def scenario():
+        async with queue.buffered(batch_size=10, linger=0.01) as publisher:
+            for i in range(25):
+                await publisher.publish("a" if i % 2 else "b", {"i": i})
+
+    asyncio.run(scenario())
+
+    published = [m["i"] for _, messages in queue.batches for m in messages]
+    assert sorted(published) == list(range(25))
+    assert all(len(messages) <= 10 for _, messages in queue.batches)
+    assert len(queue.batches) < 25
+    assert {topic for topic, _ in queue.batches} == {"a", "b"}
+
+
+def test_full_buffer_applies_backpressure():
+    queue = RecordingQueue(delay=0.05)
+
+    async def scenario():
+        publisher = await BufferedPublisher(queue, max_buffer=2, batch_size=1,
+                                            linger=0).start()
+        await publisher.publish("t", {"i": 0})
+        await asyncio.sleep(0.01)
+        await publisher.publish("t", {"i": 1})
+        await publisher.publish("t", {"i": 2})
+        blocked = asyncio.ensure_future(publisher.publish("t", {"i": 3}))
+        await asyncio.sleep(0.01)
+        was_blocked = not blocked.done()
+        await blocked
+        await publisher.stop()
+        return was_blocked
+
+    assert asyncio.run(scenario())
+    assert [m["i"] for _, messages in queue.batches for m in messages] == [0, 1, 2, 3]
@@ -0,0 +1,115 @@
+import asyncio
+
+from aiocache import Cache
+
+from core.cache import (
+    LocalLRUCache,
+    TieredCache,
+    cached_batch,
+    delete_many,
+    get_many,
+    set_many,
+)
+
+"""
+In order to test behavior of the bulk cache helpers
+"""
+
+
+class RecordingInvalidator:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, *keys):
+        self.published.append(keys)
+
+
+def test_get_set_delete_many():
+    async def scenario():
+        await set_many({"bulk:a": 1, "bulk:b": 2}, ttl=60)
+        before = await get_many(["bulk:a", "bulk:missing", "bulk:b"])
+        await delete_many(["bulk:a", "bulk:b"])
+        after = await get_many(["bulk:a", "bulk:b"])
+        return before, after
+
+    assert asyncio.run(scenario()) == ([1, None, 2], [None, None])
+
+
+def test_cached_batch_computes_only_misses_in_one_call():
+    calls = []
+
+    @cached_batch(ttl=60, key_builder=lambda x, offset: f"batch:{x}:{offset}")
+    async def add(xs, offset):
+        calls.append(list(xs))
+        return [x + offset for x in xs]
+
+    async def scenario():
+        first = await add([1, 2], 10)
+        second = await add([2, 3, 3, 1], 10)
+        return first, second
+
+    assert asyncio.run(scenario()) == ([11, 12], [12, 13, 13, 11])
+    assert calls == [[1, 2], [3]]
+
+
+def test_cached_batch_caches_none_results():
+    calls = []
+
+    @cached_batch(ttl=60, key_builder=lambda x: f"batch-none:{x}")
+    async def lookup(xs):
+        calls.append(list(xs))
+        return [None for _ in xs]
+
+    async def scenario():
+        await lookup(["a"])
+        return await lookup(["a"])
+
+    assert asyncio.run(scenario()) == [None]
+    assert calls == [["a"]]
+
+
+def test_tiered_cache_multi_get_fills_local_tier():
+    remote = Cache(Cache.MEMORY, namespace="tiered-bulk-test")
+    local = LocalLRUCache()
+    invalidator = RecordingInvalidator()
+    tiered = TieredCache(remote, local, invalidator)
+
+    async def scenario():
+        await remote.set("remote-only", "r")
+        await tiered.multi_set([("a", 1), ("b", 2)])
+        return await tiered.multi_get(["a", "remote-only", "missing"])
+
+    assert asyncio.run(scenario()) == [1, "r", None]
+    assert local.get("remote-only") == "r"
+    assert invalidator.published == [("a", "b")]
+
+
+class FakeRedisBackend:
+    NAME = "redis"
+
+    def __init__(self):
+        self.commands = []
+
+    def build_key(self, key):
+        return f"ns:{key}"
+
+    async def raw(self, command, *args):
+        self.commands.append((command,) + args)
+        return len(args)
+
+    async def delete(self, key):
+        raise AssertionError("keys must be deleted in one command")
+
+
+def test_tiered_cache_delete_many_sends_one_command_and_one_invalidation():
+    remote = FakeRedisBackend()
+    local = LocalLRUCache()
+    invalidator = RecordingInvalidator()
+    tiered = TieredCache(remote, local, invalidator)
+    local.set("a", 1)
+    local.set("b", 2)
+
+    assert asyncio.run(tiered.delete_many(["a", "b"])) == 2
+    assert remote.commands == [("delete", "ns:a", "ns:b")]
+    assert invalidator.published == [("a", "b")]
+    assert local.get("a") is None and local.get("b") is None
@@ -0,0 +1,75 @@
+import asyncio
+
+from aiocache import Cache
+
+from core.cache import (
+    CACHE_ERRORS_TOTAL,
+    CACHE_OPERATION_SECONDS,
+    CACHE_PAYLOAD_BYTES,
+    CACHE_REQUESTS_TOTAL,
+    CACHED_FUNCTION_CALLS_TOTAL,
+    InstrumentedCache,
+    cached,
+    get_cache_stats,
+)
+
+"""
+In order to test behavior of the cache instrumentation
+"""
+
+
+class FailingCache:
+    async def get(self, key, **kwargs):
+        raise ConnectionError("down")
+
+
+def test_instrumented_cache_counts_hits_misses_and_sizes():
+    instrumented = InstrumentedCache(Cache(Cache.MEMORY), "metrics-test")
+
+    async def scenario():
+        await instrumented.set("key", b"x" * 100)
+        await instrumented.get("key")
+        await instrumented.get("missing")
+        await instrumented.multi_get(["key", "missing", "other"])
+
+    asyncio.run(scenario())
+
+    assert CACHE_REQUESTS_TOTAL.get(namespace="metrics-test", result="hit") == 2
+    assert CACHE_REQUESTS_TOTAL.get(namespace="metrics-test", result="miss") == 3
+    assert CACHE_OPERATION_SECONDS.count(namespace="metrics-test", operation="get") == 2
+    assert CACHE_PAYLOAD_BYTES.sum(namespace="metrics-test") == 100
+
+
+def test_instrumented_cache_counts_errors():
+    instrumented = InstrumentedCache(FailingCache(), "metrics-error-test")
+
+    async def scenario():
+        try:
+            await instrumented.get("key")
+        except ConnectionError:
+            pass
+
+    asyncio.run(scenario())
+
+    assert CACHE_ERRORS_TOTAL.get(namespace="metrics-error-test", operation="get") == 1
+
+
+def test_cached_function_calls_are_counted_and_reported():
+    @cached(ttl=60, key_builder=lambda x: f"metrics-function:{x}")
+    async def double(x):
+        return 2 * x
+
+    async def scenario():
+        await double(1)
+        await double(1)
+        await double(1)
+        return await get_cache_stats()
+
+    stats = asyncio.run(scenario())
+    name = f"{double.__module__}.{double.__qualname__}"
+
+    assert CACHED_FUNCTION_CALLS_TOTAL.get(function=name, result="miss") == 1
+    assert CACHED_FUNCTION_CALLS_TOTAL.get(function=name, result="hit") == 2
+    assert stats["functions"][name]["hit_ratio"] == 2 / 3
+    assert stats["backend"] == "memory"
+    assert stats["server"] is None
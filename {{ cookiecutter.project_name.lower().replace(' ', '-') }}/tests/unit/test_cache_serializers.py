@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from core.serializers import (
+    CompressedSerializer,
+    MsgpackSerializer,
+    OrjsonSerializer,
+    get_serializer,
+)
+from schemas.schemas import MachineLearningResponse
+
+"""
+In order to test behavior of the cache serializers
+"""
+
+
+def test_msgpack_round_trips_numpy_arrays():
+    serializer = MsgpackSerializer()
+    array = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+    restored = serializer.loads(serializer.dumps({"x": array, "n": np.int64(3)}))
+
+    assert restored["n"] == 3
+    assert restored["x"].dtype == np.float32
+    np.testing.assert_array_equal(restored["x"], array)
+
+
+def test_orjson_serializes_pydantic_models_and_numpy():
+    serializer = OrjsonSerializer()
+    value = [MachineLearningResponse(prediction=0.5), np.array([1.0, 2.0])]
+
+    assert serializer.loads(serializer.dumps(value)) == [
+        {"prediction": 0.5, "model_version": None}, [1.0, 2.0]]
+
+
+def test_serializers_pass_through_missing_values():
+    for name in ("pickle", "orjson", "msgpack"):
+        assert get_serializer(name).loads(None) is None
+
+
+def test_compression_only_applies_above_threshold():
+    pytest.importorskip("zstandard")
+    serializer = CompressedSerializer(MsgpackSerializer(), "zstd", threshold=64)
+    small, large = [1, 2], list(range(1000))
+
+    assert serializer.dumps(small)[:1] == b"\x00"
+    assert serializer.dumps(large)[:1] == b"\x01"
+    assert serializer.loads(serializer.dumps(large)) == large
+
+
+def test_unknown_serializer_is_rejected():
+    with pytest.raises(ValueError):
+        get_serializer("yaml")
@@ -0,0 +1,96 @@
+import asyncio
+
+from core.cache import cached
+
+"""
+In order to test behavior of the cached decorator
+"""
+
+
+def test_concurrent_misses_call_function_once():
+    calls = []
+
+    @cached(ttl=60, key_builder=lambda x: f"single-flight:{x}")
+    async def slow_square(x):
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        return x * x
+
+    async def scenario():
+        return await asyncio.gather(*(slow_square(3) for _ in range(20)))
+
+    assert asyncio.run(scenario()) == [9] * 20
+    assert calls == [3]
+
+
+def test_errors_are_shared_and_not_cached():
+    calls = []
+
+    @cached(ttl=60, key_builder=lambda: "single-flight:error")
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        return await asyncio.gather(*(failing() for _ in range(5)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert calls == [1]
+
+
+def test_stale_value_is_served_while_revalidating():
+    values = iter([1, 2])
+
+    @cached(ttl=0.05, stale_ttl=5, key_builder=lambda: "single-flight:stale")
+    async def next_value():
+        return next(values)
+
+    async def scenario():
+        first = await next_value()
+        await asyncio.sleep(0.1)
+        stale = await next_value()
+        await asyncio.sleep(0.05)
+        fresh = await next_value()
+        return first, stale, fresh
+
+    assert asyncio.run(scenario()) == (1, 1, 2)
+
+
+def test_default_key_uses_function_arguments():
+    calls = []
+
+    @cached(ttl=60)
+    async def identity(x):
+        calls.append(x)
+        return x
+
+    async def scenario():
+        return [await identity(1), await identity(1), await identity(2)]
+
+    assert asyncio.run(scenario()) == [1, 1, 2]
+    assert calls == [1, 2]
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    calls = []
+
+    @cached(ttl=60, key_builder=lambda: "single-flight:cancel")
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def scenario():
+        leader = asyncio.ensure_future(slow())
+        await asyncio.sleep(0.01)
+        followers = [asyncio.ensure_future(slow()) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        return leader.cancelled(), results
+
+    assert asyncio.run(scenario()) == (True, [42, 42, 42])
+    assert calls == [1]
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from aiocache import Cache
+from aiohttp import web
+
+from app.gateways.example_gateways import CachedGateway, RequestError
+
+"""
+In order to test behavior of CachedGateway
+"""
+
+
+class CachingServer:
+    def __init__(self, cache_control="max-age=60"):
+        self.cache_control = cache_control
+        self.calls = []
+
+    async def handler(self, request):
+        self.calls.append(request.headers.get("If-None-Match"))
+        await asyncio.sleep(0.02)
+        if request.path == "/missing":
+            return web.Response(status=404, text="not found")
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304, headers={"ETag": '"v1"'})
+        return web.json_response([], headers={"ETag": '"v1"',
+                                              "Cache-Control": self.cache_control})
+
+
+def test_cache_key_is_canonical():
+    gateway = CachedGateway("http://upstream", Cache(Cache.MEMORY))
+
+    assert gateway.cache_key("get", "/items?b=2", params={"a": 1}) == \
+        gateway.cache_key("GET", "/items", params={"b": "2", "a": "1"})
+    assert gateway.cache_key("GET", "/items", headers={"Authorization": "x"}) != \
+        gateway.cache_key("GET", "/items", headers={"Authorization": "y"})
+    assert gateway.cache_key("GET", "/items", headers={"X-Request-Id": "1"}) == \
+        gateway.cache_key("GET", "/items")
+
+
+def test_concurrent_gets_are_coalesced_and_empty_bodies_cached(http_server):
+    server = CachingServer()
+
+    async def scenario():
+        async with http_server({"/{tail:.*}": server.handler}) as base_url:
+            gateway = CachedGateway(base_url, Cache(Cache.MEMORY))
+            results = await asyncio.gather(
+                *(gateway.request("GET", "/items") for _ in range(10)))
+            results.append(await gateway.request("GET", "/items"))
+            return results
+
+    assert asyncio.run(scenario()) == [[]] * 11
+    assert server.calls == [None]
+
+
+def test_stale_entries_are_revalidated_with_etag(http_server):
+    server = CachingServer(cache_control="no-cache")
+
+    async def scenario():
+        async with http_server({"/{tail:.*}": server.handler}) as base_url:
+            gateway = CachedGateway(base_url, Cache(Cache.MEMORY))
+            first = await gateway.request("GET", "/items")
+            second = await gateway.request("GET", "/items")
+            return first, second
+
+    assert asyncio.run(scenario()) == ([], [])
+    assert server.calls == [None, '"v1"']
+
+
+def test_not_found_is_cached_negatively(http_server):
+    server = CachingServer()
+
+    async def scenario():
+        async with http_server({"/{tail:.*}": server.handler}) as base_url:
+            gateway = CachedGateway(base_url, Cache(Cache.MEMORY), negative_ttl=60)
+            for _ in range(2):
+                with pytest.raises(RequestError) as error:
+                    await gateway.request("GET", "/missing")
+                assert error.value.status_code == 404
+
+    asyncio.run(scenario())
+    assert len(server.calls) == 1
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+
+from core.consumer_runner import ConsumerRunner, run_processor
+from core.message_queue import MessageProcessor, MessageQueue
+
+"""
+In order to test behavior of the multi-process consumer runner
+"""
+
+
+class LoopingQueue(MessageQueue):
+    """Delivers a message every few milliseconds until stopped."""
+
+    def __init__(self, marker_dir=None):
+        super().__init__()
+        self.marker_dir = marker_dir
+        self.closed = False
+
+    def mark(self, name):
+        if self.marker_dir:
+            Path(self.marker_dir, f"{os.getpid()}-{name}").touch()
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+        self.mark("closed")
+
+    async def publish(self, topic, message):
+        pass
+
+    async def consume(self, topics, callback, concurrency=1):
+        self.mark("started")
+        i = 0
+        while not self.stopping:
+            await callback({"id": i})
+            i += 1
+
+    async def consume_batches(self, topics, callback, batch_size=100,
+                              batch_timeout=1.0):
+        pass
+
+
+class SlowProcessor(MessageProcessor):
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.handled = []
+
+    async def handle_message(self, message):
+        await asyncio.sleep(0.02)
+        self.handled.append(message["id"])
+
+
+def build_processor():
+    return SlowProcessor(LoopingQueue(os.environ["CONSUMER_RUNNER_DIR"]))
+
+
+def build_failing_processor():
+    Path(os.environ["CONSUMER_RUNNER_DIR"], f"{os.getpid()}-started").touch()
+    raise RuntimeError("broker unavailable")
+
+
+def markers(directory, name):
+    return [path for path in Path(directory).iterdir() if path.name.endswith(name)]
+
+
+def test_run_processor_drains_in_flight_message_on_sigterm():
+    processor = SlowProcessor(LoopingQueue())
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.1, os.kill, os.getpid(), signal.SIGTERM)
+        await run_processor(processor, ["events"], shutdown_timeout=5)
+
+    asyncio.run(scenario())
+
+    assert processor.queue.closed
+    # The message being handled when the signal arrived was finished
+    assert processor.handled == list(range(len(processor.handled)))
+    assert len(processor.handled) >= 2
+
+
+def test_runner_stops_workers_gracefully(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONSUMER_RUNNER_DIR", str(tmp_path))
+    runner = ConsumerRunner("test_consumer_runner:build_processor", ["events"],
+                            processes=2, shutdown_timeout=5)
+
+    def stop_when_started():
+        deadline = time.monotonic() + 30
+        while len(markers(tmp_path, "started")) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        runner.stop()
+
+    threading.Thread(target=stop_when_started, daemon=True).start()
+
+    assert runner.run() == 0
+    assert len(markers(tmp_path, "closed")) == 2
+    assert runner.restarts == 0
+
+
+def test_runner_restarts_failed_workers(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONSUMER_RUNNER_DIR", str(tmp_path))
+    runner = ConsumerRunner("test_consumer_runner:build_failing_processor", ["events"],
+                            processes=1, restart_backoff=0.01, max_restart_backoff=60)
+
+    def stop_after_restarts():
+        deadline = time.monotonic() + 30
+        while len(markers(tmp_path, "started")) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        runner.stop()
+
+    threading.Thread(target=stop_after_restarts, daemon=True).start()
+    runner.run()
+
+    assert len(markers(tmp_path, "started")) >= 3
+    assert runner.restarts >= 2
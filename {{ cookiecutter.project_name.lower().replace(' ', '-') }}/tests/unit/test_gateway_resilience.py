@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from app.gateways.example_gateways import AsyncGateway, RequestError
+from app.gateways.resilience import (
+    GATEWAY_HEDGES_TOTAL,
+    GATEWAY_RETRIES_TOTAL,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+)
+
+"""
+In order to test behavior of gateway retries, circuit breaker and hedging
+"""
+
+
+class FlakyServer:
+    def __init__(self, failures=0, slow_first=0.0):
+        self.failures = failures
+        self.slow_first = slow_first
+        self.calls = 0
+
+    async def handler(self, request):
+        self.calls += 1
+        if self.calls == 1 and self.slow_first:
+            await asyncio.sleep(self.slow_first)
+            return web.json_response({"call": "slow"})
+        if self.calls <= self.failures:
+            return web.Response(status=503, text="unavailable")
+        return web.json_response({"call": self.calls})
+
+
+def fast_retry(attempts):
+    return RetryPolicy(max_attempts=attempts, backoff_base=0.001, backoff_max=0.01)
+
+
+def test_idempotent_requests_are_retried(http_server):
+    server = FlakyServer(failures=2)
+
+    async def scenario():
+        async with http_server({"/resource": server.handler}) as base_url:
+            gateway = AsyncGateway(base_url, name="retry-test", retry=fast_retry(3))
+            return await gateway.request("GET", "/resource")
+
+    assert asyncio.run(scenario()) == {"call": 3}
+    assert GATEWAY_RETRIES_TOTAL.get(gateway="retry-test", reason="status_503") == 2
+
+
+def test_non_idempotent_requests_are_not_retried(http_server):
+    server = FlakyServer(failures=1)
+
+    async def scenario():
+        async with http_server({"/resource": server.handler}) as base_url:
+            gateway = AsyncGateway(base_url, retry=fast_retry(3))
+            with pytest.raises(RequestError):
+                await gateway.request("POST", "/resource")
+
+    asyncio.run(scenario())
+    assert server.calls == 1
+
+
+def test_open_circuit_fails_fast_and_recovers(http_server):
+    server = FlakyServer(failures=2)
+    breaker = CircuitBreaker("breaker-test", failure_threshold=2,
+                             recovery_timeout=0.05)
+
+    async def scenario():
+        async with http_server({"/resource": server.handler}) as base_url:
+            gateway = AsyncGateway(base_url, retry=fast_retry(1),
+                                   circuit_breaker=breaker)
+            for _ in range(2):
+                with pytest.raises(RequestError):
+                    await gateway.request("GET", "/resource")
+            with pytest.raises(CircuitOpenError):
+                await gateway.request("GET", "/resource")
+            calls_while_open = server.calls
+            await asyncio.sleep(0.06)
+            result = await gateway.request("GET", "/resource")
+            return calls_while_open, result
+
+    assert asyncio.run(scenario()) == (2, {"call": 3})
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_slow_get_is_hedged(http_server):
+    server = FlakyServer(slow_first=0.5)
+
+    async def scenario():
+        async with http_server({"/resource": server.handler}) as base_url:
+            gateway = AsyncGateway(base_url, name="hedge-test", hedge_after=0.05)
+            start = time.monotonic()
+            result = await gateway.request("GET", "/resource")
+            return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(scenario())
+
+    assert result == {"call": 2}
+    assert elapsed < 0.4
+    assert GATEWAY_HEDGES_TOTAL.get(gateway="hedge-test", outcome="won") == 1
+
+
+
+@pytest.mark.parametrize("hedge_after, attempts", [(10, 1), (0.01, 2)])
+def test_cancelled_hedged_request_cancels_its_attempts(hedge_after, attempts):
+    gateway = AsyncGateway("http://upstream", hedge_after=hedge_after)
+    started = []
+
+    async def send(method, url, **kwargs):
+        started.append(asyncio.current_task())
+        await asyncio.sleep(10)
+
+    async def scenario():
+        request = asyncio.ensure_future(
+            gateway._send_hedged(send, "GET", "http://upstream/resource"))
+        await asyncio.sleep(0.05)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        # Checked before asyncio.run cancels whatever is left
+        return [task.cancelled() for task in started]
+
+    assert asyncio.run(scenario()) == [True] * attempts
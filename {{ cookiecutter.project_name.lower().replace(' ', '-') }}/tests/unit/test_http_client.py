@@ -0,0 +1,90 @@
+import asyncio
+
+from aiohttp import web
+
+from app.gateways.example_gateways import AsyncGateway
+from app.gateways.http_client import (
+    HTTP_CONNECTIONS_TOTAL,
+    HTTP_POOL_CONNECTIONS,
+    close_http_session,
+    get_http_session,
+)
+
+"""
+In order to test behavior of the shared HTTP client pool
+"""
+
+
+async def handler(request):
+    return web.json_response({"path": request.path})
+
+
+def test_gateways_reuse_pooled_connections(http_server):
+    async def scenario():
+        created = HTTP_CONNECTIONS_TOTAL.get(event="created")
+        reused = HTTP_CONNECTIONS_TOTAL.get(event="reused")
+        async with http_server({"/{tail:.*}": handler}) as base_url:
+            first, second = AsyncGateway(base_url), AsyncGateway(base_url)
+            results = [await gateway.request("GET", f"/items/{i}")
+                       for i, gateway in enumerate([first, second] * 3)]
+            assert first.session is second.session
+        return (results,
+                HTTP_CONNECTIONS_TOTAL.get(event="created") - created,
+                HTTP_CONNECTIONS_TOTAL.get(event="reused") - reused)
+
+    results, created, reused = asyncio.run(scenario())
+
+    assert results[5] == {"path": "/items/5"}
+    assert created == 1
+    assert reused == 5
+
+
+def test_closed_session_is_recreated_on_demand():
+    async def scenario():
+        session = get_http_session()
+        await close_http_session()
+        recreated = get_http_session()
+        await close_http_session()
+        return session, recreated
+
+    session, recreated = asyncio.run(scenario())
+
+    assert session.closed
+    assert recreated is not session
+
+
+def test_session_follows_the_running_event_loop(http_server):
+    async def scenario():
+        # The session is left open for the next event loop to find
+        async with http_server({"/{tail:.*}": handler}, close_session=False) as base_url:
+            result = await AsyncGateway(base_url).request("GET", "/items/1")
+            return result, get_http_session()
+
+    # Two separate asyncio.run calls, as scripts and Celery tasks do
+    first_result, first_session = asyncio.run(scenario())
+    second_result, second_session = asyncio.run(scenario())
+
+    async def cleanup():
+        await close_http_session()
+
+    asyncio.run(cleanup())
+
+    assert first_result == second_result == {"path": "/items/1"}
+    assert second_session is not first_session
+    assert first_session.closed
+
+
+def test_pool_gauges_survive_connector_internals_changing():
+    async def scenario():
+        connector = get_http_session().connector
+        usage = (HTTP_POOL_CONNECTIONS.get(state="in_use"),
+                 HTTP_POOL_CONNECTIONS.get(state="idle"))
+        # As if a new aiohttp release renamed or retyped them
+        connector._acquired, connector._conns = None, []
+        changed = (HTTP_POOL_CONNECTIONS.get(state="in_use"),
+                   HTTP_POOL_CONNECTIONS.get(state="idle"))
+        connector._acquired, connector._conns = set(), {}
+        await close_http_session()
+        return usage, changed
+
+    assert asyncio.run(scenario()) == ((0, 0), (0, 0))
@@ -0,0 +1,90 @@
+import asyncio
+
+from core.message_queue import InMemoryQueue, MessageProcessor
+
+"""
+In order to test behavior of the in-memory message queue
+"""
+
+
+def test_consume_delivers_every_message_with_bounded_concurrency():
+    queue = InMemoryQueue(codec="orjson", topic_codecs={"b": "msgpack"})
+    state = {"in_flight": 0, "max_in_flight": 0, "received": []}
+
+    async def callback(message):
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await asyncio.sleep(0.001)
+        state["in_flight"] -= 1
+        state["received"].append(message["id"])
+        if len(state["received"]) == 40:
+            await queue.stop_consuming()
+
+    async def scenario():
+        await queue.publish_many("a", [{"id": i} for i in range(20)])
+        await queue.publish_many("b", [{"id": i} for i in range(20, 40)])
+        await queue.consume(["a", "b"], callback, concurrency=4)
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert sorted(state["received"]) == list(range(40))
+    assert state["max_in_flight"] == 4
+    assert state["in_flight"] == 0
+
+
+def test_failed_messages_are_dropped():
+    queue = InMemoryQueue()
+    received = []
+
+    class Processor(MessageProcessor):
+        async def handle_message(self, message):
+            if message["id"] == 1:
+                raise ValueError("bad message")
+            received.append(message["id"])
+            if message["id"] == 2:
+                await self.stop()
+
+    async def scenario():
+        for i in range(3):
+            await queue.publish("events", {"id": i})
+        await Processor(queue).process_messages(["events"])
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert received == [0, 2]
+
+
+def test_batches_are_flushed_when_full_and_on_stop():
+    queue = InMemoryQueue()
+    batches = []
+
+    async def callback(messages):
+        batches.append([message["id"] for message in messages])
+
+    async def scenario():
+        await queue.publish_many("events", [{"id": i} for i in range(25)])
+        consuming = asyncio.ensure_future(
+            queue.consume_batches(["events"], callback, batch_size=10,
+                                  batch_timeout=60))
+        await asyncio.sleep(0.05)
+        await queue.stop_consuming()
+        await consuming
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert batches == [list(range(10)), list(range(10, 20)), list(range(20, 25))]
+
+
+def test_full_topic_blocks_publishers():
+    queue = InMemoryQueue(maxsize=2)
+
+    async def scenario():
+        await queue.publish_many("events", [{"id": 0}, {"id": 1}])
+        blocked = asyncio.ensure_future(queue.publish("events", {"id": 2}))
+        await asyncio.sleep(0.01)
+        was_blocked = not blocked.done()
+        await queue.topics["events"].get()
+        await blocked
+        return was_blocked
+
+    assert asyncio.run(scenario())
@@ -0,0 +1,78 @@
+import asyncio
+
+import joblib
+import numpy as np
+import pytest
+
+from services import predict
+from services.predict import (InferenceExecutor, MachineLearningModelInference,
+                              ModelVersion)
+
+"""
+In order to test behavior of InferenceExecutor
+"""
+
+
+class DoublingModel:
+    def predict(self, inputs):
+        return inputs * 2
+
+
+class TriplingModel:
+    def predict(self, inputs):
+        return inputs * 3
+
+
+@pytest.fixture
+def loaded_model():
+    MachineLearningModelInference.model = DoublingModel()
+    yield
+    MachineLearningModelInference.model = None
+
+
+@pytest.mark.parametrize("executor_type", ["inline", "thread"])
+def test_executor_runs_loaded_model(loaded_model, executor_type):
+    executor = InferenceExecutor(executor_type=executor_type, max_workers=2)
+    executor.start()
+    try:
+        result = asyncio.run(executor.predict(np.ones((2, 5))))
+    finally:
+        executor.shutdown()
+
+    assert result.tolist() == np.full((2, 5), 2.0).tolist()
+
+
+def test_process_executor_loads_models_in_workers(monkeypatch, tmp_path):
+    joblib.dump(DoublingModel(), tmp_path / "doubling.joblib")
+    joblib.dump(TriplingModel(), tmp_path / "tripling.joblib")
+    monkeypatch.setattr(predict.settings.model, "model_path", str(tmp_path))
+    monkeypatch.setattr(predict.settings.model, "model_name", "doubling.joblib")
+    monkeypatch.setattr(predict.settings.model, "mmap_mode", None)
+    doubling_path = str(tmp_path / "doubling.joblib")
+    tripling_path = str(tmp_path / "tripling.joblib")
+
+    async def scenario(executor):
+        data = np.ones((1, 2))
+        default = await executor.predict(data)
+        first = await executor.predict(
+            data, version=ModelVersion("v", None, doubling_path, generation=0))
+        # Same name and generation: the worker keeps serving the model it loaded
+        cached = await executor.predict(
+            data, version=ModelVersion("v", None, tripling_path, generation=0))
+        reloaded = await executor.predict(
+            data, version=ModelVersion("v", None, tripling_path, generation=1))
+        return [result.tolist() for result in (default, first, cached, reloaded)]
+
+    executor = InferenceExecutor(executor_type="process", max_workers=1)
+    executor.start()
+    try:
+        results = asyncio.run(scenario(executor))
+    finally:
+        executor.shutdown()
+
+    assert results == [[[2.0, 2.0]], [[2.0, 2.0]], [[2.0, 2.0]], [[3.0, 3.0]]]
+
+
+def test_unknown_executor_type_is_rejected():
+    with pytest.raises(ValueError, match="Unknown executor type"):
+        InferenceExecutor(executor_type="gpu")
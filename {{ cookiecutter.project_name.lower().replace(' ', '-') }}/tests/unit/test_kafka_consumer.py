@@ -0,0 +1,243 @@
+import asyncio
+import json
+from collections import namedtuple
+
+import pytest
+from aiokafka import TopicPartition
+
+from core.message_queue import (
+    KAFKA_CONSUMER_LAG,
+    MESSAGES_CONSUMED_TOTAL,
+    KafkaQueue,
+    _RebalanceListener,
+)
+
+"""
+In order to test behavior of partition-parallel Kafka consumption
+"""
+
+
+Record = namedtuple("Record", ["topic", "partition", "offset", "value", "headers"])
+
+P0, P1 = TopicPartition("events", 0), TopicPartition("events", 1)
+
+
+def records(partition, offsets):
+    return [Record(partition.topic, partition.partition, offset,
+                   json.dumps({"p": partition.partition, "o": offset}).encode(), None)
+            for offset in offsets]
+
+
+class FakeConsumer:
+    def __init__(self, polls, highwater, on_idle):
+        self.polls = list(polls)
+        self._highwater = highwater
+        self.on_idle = on_idle
+        self.commits = []
+        self.paused = []
+        self.stopped = False
+
+    async def getmany(self, timeout_ms=0, max_records=None):
+        if self.polls:
+            return self.polls.pop(0)
+        await asyncio.sleep(0.01)
+        await self.on_idle()
+        return {}
+
+    def highwater(self, partition):
+        return self._highwater[partition]
+
+    def pause(self, *partitions):
+        self.paused.extend(partitions)
+
+    def resume(self, *partitions):
+        pass
+
+    async def commit(self, offsets=None):
+        # Without offsets everything consumed so far is committed
+        self.commits.append(dict(offsets) if offsets is not None else "consumed")
+
+    async def stop(self):
+        self.stopped = True
+
+
+def make_queue(polls, highwater, on_idle):
+    queue = KafkaQueue("localhost:9092", group_id="test-group", commit_interval=0.01)
+    consumer = FakeConsumer(polls, highwater, on_idle)
+
+    async def start_consumer(topics):
+        queue.consumer = consumer
+
+    queue._start_consumer = start_consumer
+    return queue, consumer
+
+
+def lag(partition):
+    return KAFKA_CONSUMER_LAG.get(group="test-group", topic=partition.topic,
+                                  partition=str(partition.partition))
+
+
+def test_partitions_run_concurrently_in_order_and_commit_processed_offsets():
+    handled = []
+    lags = {}
+    processed_before = MESSAGES_CONSUMED_TOTAL.get(topic="events", result="success")
+
+    async def callback(message):
+        # Partition 0 is slow, partition 1 must not wait for it
+        await asyncio.sleep(0.02 if message["p"] == 0 else 0)
+        handled.append((message["p"], message["o"]))
+
+    async def on_idle():
+        if len(handled) == 10 and not queue.stopping:
+            lags.update({P0: lag(P0), P1: lag(P1)})
+            await queue.stop_consuming()
+
+    queue, consumer = make_queue(
+        [{P0: records(P0, range(3)), P1: records(P1, range(10, 13))},
+         {P0: records(P0, range(3, 5)), P1: records(P1, range(13, 15))}],
+        {P0: 8, P1: 15}, on_idle)
+
+    asyncio.run(queue.consume(["events"], callback, concurrency=4))
+
+    assert [o for p, o in handled if p == 0] == [0, 1, 2, 3, 4]
+    assert [o for p, o in handled if p == 1] == [10, 11, 12, 13, 14]
+    assert handled.index((1, 14)) < handled.index((0, 2))
+    assert lags == {P0: 3, P1: 0}
+    committed = {}
+    for offsets in consumer.commits:
+        committed.update(offsets)
+    assert committed == {P0: 5, P1: 15}
+    assert consumer.stopped
+    assert lag(P0) == 0 and not queue._workers
+    assert MESSAGES_CONSUMED_TOTAL.get(topic="events", result="success") == \
+        processed_before + 10
+
+
+def test_failed_record_stops_consumption_and_commits_only_processed_offsets():
+    async def callback(message):
+        if message["o"] == 2:
+            raise RuntimeError("bad message")
+
+    async def on_idle():
+        pass
+
+    queue, consumer = make_queue([{P0: records(P0, range(5))}], {P0: 5}, on_idle)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(queue.consume(["events"], callback))
+
+    assert consumer.commits[-1] == {P0: 2}
+    assert consumer.stopped
+
+
+def test_revoked_partitions_are_drained_and_committed():
+    handled = []
+    state = {}
+
+    async def callback(message):
+        await asyncio.sleep(0.01)
+        handled.append((message["p"], message["o"]))
+
+    async def on_idle():
+        if "revoked" not in state:
+            state["revoked"] = True
+            await _RebalanceListener(queue).on_partitions_revoked([P0])
+            state["handled"] = list(handled)
+            state["commits"] = list(consumer.commits)
+            await queue.stop_consuming()
+
+    queue, consumer = make_queue([{P0: records(P0, range(4))}], {P0: 4}, on_idle)
+    queue.commit_interval = 60
+
+    asyncio.run(queue.consume(["events"], callback))
+
+    assert state["handled"] == [(0, 0), (0, 1), (0, 2), (0, 3)]
+    assert state["commits"] == [{P0: 4}]
+
+
+class FakeProducer:
+    def __init__(self):
+        self.sent = []
+
+    async def send_and_wait(self, topic, value, key=None, headers=None):
+        self.sent.append((topic, value, dict(headers)))
+
+
+def test_poison_records_are_dead_lettered_and_consumption_goes_on():
+    handled = []
+    polls = [{P0: records(P0, range(4))}]
+    # Offset 1 is not JSON, offset 2 fails in the callback
+    polls[0][P0][1] = polls[0][P0][1]._replace(value=b"not json")
+
+    async def callback(message):
+        if message["o"] == 2:
+            raise RuntimeError("bad message")
+        handled.append(message["o"])
+
+    async def on_idle():
+        if not queue.stopping:
+            await queue.stop_consuming()
+
+    queue, consumer = make_queue(polls, {P0: 4}, on_idle)
+    queue.dead_letter_topic = "events.dlt"
+    queue.producer = FakeProducer()
+
+    asyncio.run(queue.consume(["events"], callback))
+
+    assert handled == [0, 3]
+    assert [(topic, headers["x-original-offset"])
+            for topic, _, headers in queue.producer.sent] == \
+        [("events.dlt", b"1"), ("events.dlt", b"2")]
+    assert queue.producer.sent[0][1] == b"not json"
+    assert consumer.commits[-1] == {P0: 4}
+
+
+def test_undecodable_records_are_skipped_without_dead_letter_topic():
+    handled = []
+    polls = [{P0: records(P0, range(3))}]
+    polls[0][P0][1] = polls[0][P0][1]._replace(value=b"[1")
+
+    async def callback(message):
+        handled.append(message["o"])
+
+    async def on_idle():
+        if not queue.stopping:
+            await queue.stop_consuming()
+
+    queue, consumer = make_queue(polls, {P0: 3}, on_idle)
+
+    asyncio.run(queue.consume(["events"], callback))
+
+    assert handled == [0, 2]
+    assert consumer.commits[-1] == {P0: 3}
+
+
+def test_batches_are_committed_only_after_the_callback_succeeds():
+    events = []
+
+    async def callback(messages):
+        events.append([message["o"] for message in messages])
+        if any(message["o"] == 4 for message in messages):
+            raise RuntimeError("bad batch")
+
+    async def on_idle():
+        pass
+
+    queue, consumer = make_queue(
+        [{P0: records(P0, range(3))}, {}, {P0: records(P0, range(3, 5))}],
+        {P0: 5}, on_idle)
+    original_commit = consumer.commit
+
+    async def commit(offsets=None):
+        events.append("commit")
+        await original_commit(offsets)
+
+    consumer.commit = commit
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(queue.consume_batches(["events"], callback, batch_size=3,
+                                          batch_timeout=0.05))
+
+    assert events == [[0, 1, 2], "commit", [3, 4]]
+    assert consumer.commits == ["consumed"]
+    assert consumer.stopped
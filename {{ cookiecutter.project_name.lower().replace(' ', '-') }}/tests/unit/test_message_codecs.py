@@ -0,0 +1,100 @@
+from collections import namedtuple
+
+import numpy as np
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from core.message_codecs import (
+    JsonCodec,
+    MessageDecodeError,
+    MsgpackCodec,
+    decode_each,
+    decode_many,
+    get_codec,
+)
+from core.message_queue import KafkaQueue
+
+"""
+In order to test behavior of message codecs
+"""
+
+
+Record = namedtuple("Record", ["topic", "value", "headers"])
+
+
+class Event(BaseModel):
+    id: int
+    name: str
+
+
+@pytest.mark.parametrize("name", ["json", "orjson", "msgpack"])
+def test_codecs_round_trip_messages(name):
+    codec = get_codec(name)
+    message = {"id": 1, "values": [1.5, 2.5], "nested": {"ok": True}}
+
+    assert codec.decode(codec.encode(message)) == message
+    assert codec.decode_many([codec.encode(message)] * 3) == [message] * 3
+
+
+def test_msgpack_keeps_numpy_arrays():
+    codec = MsgpackCodec()
+    array = np.arange(6, dtype=np.float32).reshape(2, 3)
+
+    decoded = codec.decode(codec.encode({"features": array}))["features"]
+
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, array)
+
+
+def test_bulk_json_decoding_reports_malformed_bodies():
+    codec = JsonCodec()
+
+    with pytest.raises(ValueError):
+        codec.decode_many([b'{"id": 1}', b'{"id"'])
+    with pytest.raises(ValueError):
+        codec.decode_many([b"1", b"2, 3"])
+    # Bodies are never parsed together, so fragments can not be merged
+    with pytest.raises(ValueError):
+        codec.decode_many([b"[1", b"2]", b"3,4"])
+
+
+def test_decode_each_isolates_bad_bodies():
+    decoded = decode_each(
+        [b'{"id": 1, "name": "a"}', b"[1", b'{"id": "x", "name": "b"}',
+         b'{"id": 2, "name": "c"}'], "application/json", Event)
+
+    assert decoded[0] == Event(id=1, name="a")
+    assert isinstance(decoded[1], MessageDecodeError)
+    assert isinstance(decoded[2], MessageDecodeError)
+    assert decoded[3] == Event(id=2, name="c")
+    assert all(isinstance(message, MessageDecodeError)
+               for message in decode_each([b"1", b"2"], "text/plain"))
+
+
+def test_decoding_follows_content_type_and_validates_in_bulk():
+    assert decode_many([b'{"id": 1, "name": "a"}'], None, Event) == [Event(id=1, name="a")]
+    with pytest.raises(ValidationError):
+        decode_many([b'{"id": "x", "name": "a"}'], "application/json", Event)
+    with pytest.raises(ValueError):
+        decode_many([b"..."], "text/plain")
+
+
+def test_kafka_queue_tags_and_decodes_records_per_topic():
+    producer = KafkaQueue("localhost:9092", codec="json",
+                          topic_codecs={"events": "msgpack"})
+    consumer = KafkaQueue("localhost:9092", schemas={"events": Event})
+
+    events = [producer._record("events", {"id": i, "name": f"e{i}"}) for i in range(3)]
+    raw = producer._record("raw", {"id": 9})
+    records = [Record("events", body, headers) for body, headers in events[:2]]
+    records.append(Record("raw", raw[0], raw[1]))
+    records.append(Record("events", events[2][0], events[2][1]))
+    # Records published before codecs carry no content type header
+    records.append(Record("raw", b'{"legacy": true}', None))
+
+    assert events[0][1] == [("content-type", b"application/msgpack")]
+    assert raw[1] == [("content-type", b"application/json")]
+    assert consumer._decode(records) == [
+        Event(id=0, name="e0"), Event(id=1, name="e1"), {"id": 9},
+        Event(id=2, name="e2"), {"legacy": True},
+    ]
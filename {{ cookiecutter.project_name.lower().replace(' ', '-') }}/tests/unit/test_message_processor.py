@@ -0,0 +1,43 @@
+import asyncio
+
+from core.message_queue import BatchBuffer, MessageProcessor
+
+"""
+In order to test behavior of batched and concurrent message processing
+"""
+
+
+def test_batch_buffer_flushes_by_count_and_by_time():
+    batches = []
+
+    async def flush(items):
+        batches.append(items)
+
+    async def scenario():
+        buffer = BatchBuffer(flush, batch_size=3, batch_timeout=0.05)
+        for i in range(4):
+            await buffer.add(i)
+        full = list(batches)
+        await asyncio.sleep(0.1)
+        return full
+
+    assert asyncio.run(scenario()) == [[0, 1, 2]]
+    assert batches == [[0, 1, 2], [3]]
+
+
+def test_handle_batch_bounds_concurrency():
+    state = {"in_flight": 0, "max_in_flight": 0, "handled": []}
+
+    class Processor(MessageProcessor):
+        async def handle_message(self, message):
+            state["in_flight"] += 1
+            state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+            await asyncio.sleep(0.01)
+            state["in_flight"] -= 1
+            state["handled"].append(message["id"])
+
+    processor = Processor(queue=None, concurrency=3, batch_size=10)
+    asyncio.run(processor.handle_batch([{"id": i} for i in range(10)]))
+
+    assert sorted(state["handled"]) == list(range(10))
+    assert state["max_in_flight"] == 3
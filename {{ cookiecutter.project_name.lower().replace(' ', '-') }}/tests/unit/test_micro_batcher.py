@@ -0,0 +1,111 @@
+import asyncio
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.core.errors import PredictException
+from services.predict import MicroBatcher, _call_model
+
+"""
+In order to test behavior of MicroBatcher
+"""
+
+
+class RecordingModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, inputs):
+        self.calls.append(inputs.shape)
+        return inputs.sum(axis=1)
+
+
+def run_concurrently(batcher, data_points):
+    async def scenario():
+        await batcher.start()
+        try:
+            return await asyncio.gather(
+                *(batcher.submit(point) for point in data_points))
+        finally:
+            await batcher.stop()
+    return asyncio.run(scenario())
+
+
+def test_concurrent_requests_are_stacked_into_one_call():
+    model = RecordingModel()
+    batcher = MicroBatcher(model.predict, max_batch_size=8, max_wait_ms=50)
+    points = [np.full((1, 5), i, dtype=float) for i in range(4)]
+
+    results = run_concurrently(batcher, points)
+
+    assert model.calls == [(4, 5)]
+    assert [float(r[0]) for r in results] == [0.0, 5.0, 10.0, 15.0]
+
+
+def test_batches_are_capped_by_max_batch_size():
+    model = RecordingModel()
+    batcher = MicroBatcher(model.predict, max_batch_size=2, max_wait_ms=50)
+    points = [np.ones((1, 5)) for _ in range(5)]
+
+    results = run_concurrently(batcher, points)
+
+    assert model.calls == [(2, 5), (2, 5), (1, 5)]
+    assert len(results) == 5
+
+
+def test_model_error_is_propagated_to_every_waiter():
+    def failing_predict(inputs):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(failing_predict, max_batch_size=4, max_wait_ms=10)
+
+    with pytest.raises(ValueError, match="boom"):
+        run_concurrently(batcher, [np.ones((1, 5)), np.ones((1, 5))])
+
+
+def test_full_queue_rejects_requests():
+    async def scenario():
+        batcher = MicroBatcher(lambda x: x, max_queue_size=1)
+        await batcher.start()
+        batcher.queue.put_nowait((np.ones((1, 5)), asyncio.Future(), 0.0))
+        try:
+            await batcher.submit(np.ones((1, 5)))
+        finally:
+            await batcher.stop()
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(scenario())
+    assert exc_info.value.status_code == 503
+
+
+def test_batcher_awaits_async_predict_functions():
+    async def async_predict(inputs):
+        await asyncio.sleep(0)
+        return inputs[:, 0]
+
+    batcher = MicroBatcher(async_predict, max_batch_size=4, max_wait_ms=10)
+
+    results = run_concurrently(batcher, [np.full((1, 5), 3.0)])
+
+    assert float(results[0][0]) == 3.0
+
+
+def test_model_without_predict_fails_requests_but_not_the_batcher():
+    batcher = MicroBatcher(lambda inputs: _call_model(object(), inputs),
+                           max_batch_size=4, max_wait_ms=10)
+
+    async def scenario():
+        await batcher.start()
+        try:
+            results = await asyncio.gather(
+                *(batcher.submit(np.ones((1, 5))) for _ in range(3)),
+                return_exceptions=True)
+            return results, batcher.running
+        finally:
+            await batcher.stop()
+
+    results, running = asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert all(isinstance(result, PredictException) for result in results)
+    assert running
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+from pydantic import BaseModel
+
+from app.gateways.example_gateways import ModelGateway
+from app.gateways.json_stream import iter_json_array
+
+"""
+In order to test behavior of ModelGateway and the streaming JSON parser
+"""
+
+
+class Item(BaseModel):
+    id: int
+    name: str
+
+
+ITEMS = [{"id": i, "name": f"item-{i}"} for i in range(25)]
+
+
+class ChunkedReader:
+    def __init__(self, data, size):
+        self.data, self.size = data, size
+
+    async def read(self, n=-1):
+        chunk, self.data = self.data[:self.size], self.data[self.size:]
+        return chunk
+
+
+async def collect(reader):
+    return [item async for item in iter_json_array(reader, use_ijson=False)]
+
+
+def test_raw_decode_parser_handles_any_chunk_boundary():
+    payload = json.dumps([1, 23, "ü,]", {"a": [1, 2]}, 456, None]).encode()
+
+    for size in (1, 2, 3, 7, len(payload)):
+        assert asyncio.run(collect(ChunkedReader(payload, size))) == \
+            [1, 23, "ü,]", {"a": [1, 2]}, 456, None]
+
+
+def test_raw_decode_parser_rejects_truncated_arrays():
+    with pytest.raises(ValueError):
+        asyncio.run(collect(ChunkedReader(b'[{"id": 1}, {"id"', 4)))
+
+
+async def stream_items(request):
+    response = web.StreamResponse(headers={"Content-Type": "application/json"})
+    await response.prepare(request)
+    body = json.dumps(ITEMS).encode()
+    for start in range(0, len(body), 50):
+        await response.write(body[start:start + 50])
+    await response.write_eof()
+    return response
+
+
+def test_stream_yields_validated_chunks(http_server):
+    async def scenario():
+        async with http_server({"/items": stream_items}) as base_url:
+            gateway = ModelGateway(base_url, Item)
+            chunks = [chunk async for chunk in gateway.stream("GET", "/items",
+                                                              chunk_size=10)]
+            whole = await gateway.request("GET", "/items")
+        return chunks, whole
+
+    chunks, whole = asyncio.run(scenario())
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert chunks[2][-1] == Item(id=24, name="item-24")
+    assert whole == [Item(**item) for item in ITEMS]
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+
+from app.api import events
+from core import utils
+from services import predict
+
+"""
+In order to test behavior of memory-mapped model loading and memory reporting
+"""
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    path = tmp_path / "model.joblib"
+    joblib.dump({"weights": np.arange(100_000, dtype=np.float64)}, path)
+    return str(path)
+
+
+@pytest.mark.parametrize("mmap_mode, mapped", [("r", True), ("", False), (None, False)])
+def test_load_wrapper_maps_arrays_only_when_configured(model_file, mmap_mode, mapped,
+                                                       monkeypatch):
+    monkeypatch.setattr(predict.settings.model, "mmap_mode", mmap_mode)
+
+    model = predict.get_load_wrapper()(model_file)
+
+    assert isinstance(model["weights"], np.memmap) is mapped
+    assert model["weights"][-1] == 99_999
+
+
+def test_empty_mmap_mode_from_the_env_example_loads_the_model(model_file, monkeypatch):
+    monkeypatch.setattr(events.settings.model, "model_path", model_file)
+    monkeypatch.setattr(events.settings.model, "mmap_mode", "")
+
+    events.load_ml_model()
+    try:
+        assert not isinstance(events.get_ml_model()["weights"], np.memmap)
+    finally:
+        events.unload_ml_model()
+
+
+def test_process_memory_reports_resident_and_proportional_sizes():
+    memory = utils.get_process_memory()
+
+    if "rss" not in memory:
+        # No /proc, only the peak from getrusage
+        assert memory["max_rss"] > 0
+        return
+    assert memory["rss"] > 0
+    assert memory["anon"] + memory["file"] + memory["shmem"] == pytest.approx(
+        memory["rss"], rel=0.05)
+    if "pss" in memory:
+        assert 0 < memory["pss"] <= memory["rss"] * 1.05
+
+
+def test_process_memory_falls_back_to_peak_rss_without_proc(monkeypatch):
+    missing = Path("/nonexistent")
+    monkeypatch.setattr(utils, "Path", lambda path: missing / path.lstrip("/"))
+
+    memory = utils.get_process_memory()
+
+    assert list(memory) == ["max_rss"]
+    assert memory["max_rss"] > 0
@@ -0,0 +1,177 @@
+import asyncio
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app.core.errors import PredictException
+from services import predict
+from services.predict import ModelRegistry, ModelVersion
+
+"""
+In order to test behavior of ModelRegistry
+"""
+
+
+class ConstantModel:
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, inputs):
+        return np.full(len(inputs), self.value)
+
+
+@pytest.fixture
+def model_registry():
+    model_registry = ModelRegistry()
+    model_registry.register(ModelVersion("v1", ConstantModel(1), "v1.joblib"))
+    model_registry.register(ModelVersion("v2", ConstantModel(2), "v2.joblib"),
+                            activate=False)
+    return model_registry
+
+
+def test_first_registered_version_is_active(model_registry):
+    assert model_registry.active == "v1"
+    assert model_registry.resolve().name == "v1"
+    assert model_registry.resolve("v2").name == "v2"
+
+
+def test_unknown_version_is_not_found(model_registry):
+    with pytest.raises(HTTPException) as exc_info:
+        model_registry.resolve("v3")
+    assert exc_info.value.status_code == 404
+
+
+def test_canary_receives_its_share_of_traffic(model_registry):
+    model_registry.set_canary("v2", weight=1.0)
+    assert model_registry.resolve().name == "v2"
+
+    model_registry.set_canary(None)
+    assert model_registry.resolve().name == "v1"
+
+
+def test_active_version_can_not_be_unloaded(model_registry):
+    with pytest.raises(ValueError):
+        model_registry.unload("v1")
+
+
+def test_unloaded_version_is_kept_until_drained(model_registry):
+    async def scenario():
+        version = model_registry.resolve("v2")
+        with version.acquire():
+            model_registry.unload("v2")
+            await asyncio.sleep(0.1)
+            assert version.model is not None
+        await asyncio.sleep(0.1)
+        return version
+
+    version = asyncio.run(scenario())
+
+    assert "v2" not in model_registry.versions
+    assert version.model is None
+
+
+def test_reloading_a_name_bumps_its_generation(model_registry, monkeypatch):
+    async def no_warm_up(version):
+        version.warmed_up = True
+
+    monkeypatch.setattr(predict, "load_model_with_report", lambda path: ConstantModel(3))
+    monkeypatch.setattr(predict, "warm_up", no_warm_up)
+
+    version = asyncio.run(model_registry.load("v1", "v1.joblib"))
+
+    assert version.generation == 1
+    assert model_registry.resolve("v2").generation == 0
+
+
+def test_process_workers_do_not_serve_a_replaced_version(monkeypatch):
+    monkeypatch.setattr(predict.MachineLearningModelInference, "load",
+                        lambda load_wrapper, path: ConstantModel(2))
+    monkeypatch.setattr(predict, "_worker_models", OrderedDict())
+    predict._worker_models[("v1", 0)] = ConstantModel(1)
+    inputs = np.zeros((1, 2))
+
+    assert predict._predict_in_worker(inputs, "predict", "v1", "v1.joblib", 0)[0] == 1
+    assert predict._predict_in_worker(inputs, "predict", "v1", "v1.joblib", 1)[0] == 2
+
+
+def test_model_paths_must_be_inside_the_model_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(predict.settings.model, "model_path", str(tmp_path))
+
+    assert predict.resolve_model_path("v2.joblib") == str(tmp_path / "v2.joblib")
+    with pytest.raises(HTTPException) as exc_info:
+        predict.resolve_model_path("../outside.joblib")
+    assert exc_info.value.status_code == 400
+    with pytest.raises(HTTPException):
+        predict.resolve_model_path("/etc/passwd")
+
+
+def test_version_is_held_while_the_prediction_cache_is_read(model_registry, monkeypatch):
+    version = model_registry.resolve("v2")
+    seen = []
+
+    class Cache:
+        def make_key(self, data_point, version_name):
+            return version_name
+
+        async def get(self, key, version_name):
+            seen.append(version.in_flight)
+
+        async def set(self, key, value):
+            pass
+
+    monkeypatch.setattr(predict, "prediction_cache", Cache())
+    monkeypatch.setattr(predict, "inference_executor", None)
+    monkeypatch.setattr(predict, "batcher", None)
+
+    prediction = asyncio.run(predict.run_inference(
+        np.zeros((1, 2)), version=version, use_cache=True))
+
+    assert prediction[0] == 2
+    assert seen == [1]
+    assert version.in_flight == 0
+
+
+class BrokenModel:
+    def predict(self, inputs):
+        raise RuntimeError("model is broken")
+
+
+def test_readyz_waits_for_the_active_version_warm_up(model_registry, monkeypatch):
+    from app.api.system import readyz
+
+    monkeypatch.setattr(predict, "model_registry", model_registry)
+    monkeypatch.setattr(predict, "load_input_example", lambda: np.zeros((1, 5)))
+    monkeypatch.setattr(predict, "inference_executor", None)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(readyz())
+    assert exc_info.value.detail == "Model is warming up"
+
+    asyncio.run(predict.warm_up(model_registry.resolve()))
+
+    assert asyncio.run(readyz()).status is True
+
+
+@pytest.mark.parametrize("model, error, message", [
+    (BrokenModel(), RuntimeError, "model is broken"),
+    # PredictException is a BaseException
+    (object(), PredictException, "'predict' attribute is missing"),
+])
+def test_failed_warm_up_is_reported_by_readyz(model, error, message, monkeypatch):
+    from app.api.system import readyz
+
+    model_registry = ModelRegistry()
+    model_registry.register(ModelVersion("v1", model, "v1.joblib"))
+    monkeypatch.setattr(predict, "model_registry", model_registry)
+    monkeypatch.setattr(predict, "load_input_example", lambda: np.zeros((1, 5)))
+    monkeypatch.setattr(predict, "inference_executor", None)
+
+    with pytest.raises(error):
+        asyncio.run(predict.warm_up(model_registry.resolve()))
+
+    assert model_registry.resolve().describe()["warmup_error"] == message
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(readyz())
+    assert exc_info.value.detail == f"Model warm-up failed: {message}"
@@ -0,0 +1,77 @@
+import asyncio
+
+from aiohttp import web
+
+from app.gateways.example_gateways import PaginatedGateway
+
+"""
+In order to test behavior of PaginatedGateway
+"""
+
+TOTAL_ITEMS = 45
+
+
+class PagedServer:
+    def __init__(self, with_total):
+        self.with_total = with_total
+        self.requested_pages = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handler(self, request):
+        page, limit = int(request.query["page"]), int(request.query["limit"])
+        self.requested_pages.append(page)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        items = list(range(TOTAL_ITEMS))[(page - 1) * limit:page * limit]
+        if self.with_total:
+            return web.json_response({"items": items, "total": TOTAL_ITEMS})
+        return web.json_response(items)
+
+
+def test_concurrent_pages_with_total_are_fetched_exactly(http_server):
+    server = PagedServer(with_total=True)
+
+    async def scenario():
+        async with http_server({"/items": server.handler}) as base_url:
+            gateway = PaginatedGateway(base_url, page_size=5, concurrency=4)
+            return await gateway.paginated_request("GET", "/items")
+
+    assert asyncio.run(scenario()) == list(range(TOTAL_ITEMS))
+    assert sorted(server.requested_pages) == list(range(1, 10))
+    assert server.max_in_flight == 4
+
+
+def test_pages_without_total_are_fetched_until_empty(http_server):
+    server = PagedServer(with_total=False)
+    params = {"filter": "x"}
+
+    async def scenario():
+        async with http_server({"/items": server.handler}) as base_url:
+            gateway = PaginatedGateway(base_url, page_size=10, concurrency=3)
+            return await gateway.paginated_request("GET", "/items", params=params)
+
+    assert asyncio.run(scenario()) == list(range(TOTAL_ITEMS))
+    assert params == {"filter": "x"}
+    assert server.max_in_flight <= 3
+
+
+def test_streaming_stops_early_and_cancels_pending_pages(http_server):
+    server = PagedServer(with_total=True)
+
+    async def scenario():
+        async with http_server({"/items": server.handler}) as base_url:
+            gateway = PaginatedGateway(base_url, page_size=5, concurrency=2)
+            items = []
+            pages = gateway.iter_items("GET", "/items")
+            async for item in pages:
+                items.append(item)
+                if len(items) == 7:
+                    break
+            await pages.aclose()
+            return items
+
+    assert asyncio.run(scenario()) == list(range(7))
+    assert len(server.requested_pages) < 9
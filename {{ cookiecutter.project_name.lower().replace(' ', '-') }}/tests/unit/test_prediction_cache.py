@@ -0,0 +1,71 @@
+import asyncio
+
+import numpy as np
+
+from services import predict
+from services.predict import ModelRegistry, ModelVersion, PredictionCache
+
+"""
+In order to test behavior of PredictionCache
+"""
+
+
+def test_key_is_canonical_across_dtypes():
+    as_int = PredictionCache.make_key(np.array([[1, 2, 3, 4, 5]]), "v1")
+    as_float = PredictionCache.make_key(np.array([[1.0, 2.0, 3.0, 4.0, 5.0]]), "v1")
+
+    assert as_int == as_float
+
+
+def test_key_depends_on_version_and_shape():
+    data_point = np.arange(10, dtype=float)
+
+    assert (PredictionCache.make_key(data_point, "v1")
+            != PredictionCache.make_key(data_point, "v2"))
+    assert (PredictionCache.make_key(data_point.reshape(2, 5), "v1")
+            != PredictionCache.make_key(data_point.reshape(5, 2), "v1"))
+
+
+def test_cache_is_bounded():
+    prediction_cache = PredictionCache(ttl=60, max_size=2)
+
+    async def scenario():
+        for i in range(3):
+            await prediction_cache.set(f"key-{i}", i)
+        return [await prediction_cache.get(f"key-{i}", "v1") for i in range(3)]
+
+    assert asyncio.run(scenario()) == [None, 1, 2]
+
+
+class ConstantModel:
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, inputs):
+        return np.full(len(inputs), self.value)
+
+
+def test_reloaded_version_does_not_reuse_cached_predictions(tmp_path, monkeypatch):
+    from app.core import cache
+
+    async def no_warm_up(version):
+        version.warmed_up = True
+
+    model_registry = ModelRegistry()
+    model_registry.register(ModelVersion("v1", ConstantModel(1), str(tmp_path / "v1.joblib")))
+    monkeypatch.setattr(predict, "load_model_with_report", lambda path: ConstantModel(2))
+    monkeypatch.setattr(predict, "warm_up", no_warm_up)
+    monkeypatch.setattr(predict, "model_registry", model_registry)
+    monkeypatch.setattr(predict, "prediction_cache", PredictionCache(ttl=60))
+    monkeypatch.setattr(predict, "inference_executor", None)
+    monkeypatch.setattr(predict, "batcher", None)
+    data_point = np.full((1, 5), 7.0)
+
+    async def scenario():
+        await cache.clear_cache()
+        before = await predict.run_inference(data_point, use_cache=True)
+        await model_registry.load("v1", str(tmp_path / "v1.joblib"), activate=True)
+        after = await predict.run_inference(data_point, use_cache=True)
+        return before[0], after[0]
+
+    assert asyncio.run(scenario()) == (1, 2)
@@ -0,0 +1,145 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from core.message_queue import RabbitMQQueue
+
+"""
+In order to test behavior of RabbitMQ consumers
+"""
+
+
+class FakeMessage:
+    content_type = "application/json"
+
+    def __init__(self, body):
+        self.body = body
+        self.acked = False
+        self.rejected = False
+
+    async def ack(self):
+        self.acked = True
+
+    async def reject(self, requeue=False):
+        self.rejected = True
+
+    @asynccontextmanager
+    async def process(self):
+        try:
+            yield self
+        except Exception:
+            await self.reject()
+        else:
+            await self.ack()
+
+
+class FakeQueue:
+    def __init__(self):
+        self.callback = None
+
+    async def consume(self, callback):
+        self.callback = callback
+        return "consumer-tag"
+
+    async def cancel(self, consumer_tag):
+        self.callback = None
+
+    async def deliver(self, delivery):
+        await self.callback(delivery)
+
+
+class FakeChannel:
+    def __init__(self):
+        self.queues = {}
+        self.prefetch_count = None
+
+    async def set_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    async def declare_queue(self, name, durable=False):
+        return self.queues.setdefault(name, FakeQueue())
+
+
+def message(id):
+    return FakeMessage(json.dumps({"id": id}).encode())
+
+
+def test_batch_rejects_only_bad_messages():
+    queue = RabbitMQQueue("amqp://localhost/")
+    handled = []
+
+    async def callback(messages):
+        if any(message["id"] == 2 for message in messages):
+            raise RuntimeError("bad message")
+        handled.extend(message["id"] for message in messages)
+
+    messages = [message(0), FakeMessage(b"not json"), message(2), message(3)]
+
+    async def scenario():
+        queue.channel = FakeChannel()
+        await queue.consume_batches(["events"], callback, batch_size=4, batch_timeout=60)
+        for delivery in messages:
+            await queue.channel.queues["events"].deliver(delivery)
+        await queue.stop_consuming()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert queue.channel.prefetch_count == 100
+    assert sorted(handled) == [0, 3]
+    assert [delivery.acked for delivery in messages] == [True, False, False, True]
+    assert [delivery.rejected for delivery in messages] == [False, True, True, False]
+
+
+def test_consume_raises_prefetch_and_bounds_concurrency():
+    queue = RabbitMQQueue("amqp://localhost/", prefetch_count=2)
+    state = {"in_flight": 0, "max_in_flight": 0}
+
+    async def callback(message):
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        if message["id"] == 4:
+            raise RuntimeError("bad message")
+
+    messages = [message(i) for i in range(8)]
+
+    async def scenario():
+        queue.channel = FakeChannel()
+        await queue.consume(["events"], callback, concurrency=3)
+        # aio-pika runs every delivery in its own task
+        await asyncio.gather(*(queue.channel.queues["events"].deliver(delivery)
+                               for delivery in messages))
+        await queue.stop_consuming()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert queue.channel.prefetch_count == 3
+    assert state["max_in_flight"] == 3
+    assert [delivery.acked for delivery in messages] == [i != 4 for i in range(8)]
+    assert [delivery.rejected for delivery in messages] == [i == 4 for i in range(8)]
+
+
+def test_batch_is_acked_after_the_callback_and_flushed_on_stop():
+    queue = RabbitMQQueue("amqp://localhost/", prefetch_count=10)
+    acked_during_callback = []
+
+    async def callback(batch):
+        acked_during_callback.extend(delivery.acked for delivery in messages)
+
+    messages = [message(i) for i in range(3)]
+
+    async def scenario():
+        queue.channel = FakeChannel()
+        await queue.consume_batches(["events"], callback, batch_size=50, batch_timeout=60)
+        for delivery in messages:
+            await queue.channel.queues["events"].deliver(delivery)
+        # The batch is not full, stopping processes it
+        assert not any(delivery.acked for delivery in messages)
+        await queue.stop_consuming()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert queue.channel.prefetch_count == 50
+    assert acked_during_callback == [False, False, False]
+    assert all(delivery.acked for delivery in messages)
@@ -0,0 +1,96 @@
+import gc
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.gateways.example_gateways import SyncGateway
+
+"""
+In order to test behavior of SyncGateway
+"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.calls += 1
+            server.client_ports.add(self.client_address[1])
+            failing = server.calls <= server.failures
+        if self.path.startswith("/flaky") and failing:
+            self._reply(503, {"error": "unavailable"})
+            return
+        time.sleep(0.01)
+        self._reply(200, {"path": self.path})
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.lock = threading.Lock()
+    httpd.calls, httpd.failures, httpd.client_ports = 0, 0, set()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_map_returns_results_in_order_over_pooled_connections(server):
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    with SyncGateway(base_url, max_workers=4) as gateway:
+        results = gateway.map("GET", [f"/items/{i}" for i in range(40)])
+
+    assert results == [{"path": f"/items/{i}"} for i in range(40)]
+    assert len(server.client_ports) <= 4
+
+
+def test_idempotent_requests_are_retried(server):
+    server.failures = 2
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    with SyncGateway(base_url, max_retries=2) as gateway:
+        assert gateway.request("GET", "/flaky") == {"path": "/flaky"}
+
+    assert server.calls == 3
+
+
+def test_map_can_return_exceptions(server):
+    server.failures = 1
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    with SyncGateway(base_url, max_retries=0, max_workers=1) as gateway:
+        results = gateway.map("GET", ["/flaky", "/ok"], return_exceptions=True)
+
+    assert isinstance(results[0], requests.HTTPError)
+    assert results[1] == {"path": "/ok"}
+
+
+def test_sessions_of_finished_threads_are_released(server):
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    with SyncGateway(base_url) as gateway:
+        threads = [threading.Thread(target=gateway.request, args=("GET", "/items/1"))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gateway.request("GET", "/items/2")
+        gc.collect()
+
+        assert len(gateway._sessions) == 1
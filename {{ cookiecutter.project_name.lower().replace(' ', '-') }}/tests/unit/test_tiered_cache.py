@@ -0,0 +1,123 @@
+import asyncio
+
+from aiocache import Cache
+
+from core.cache import LocalLRUCache, RedisInvalidator, TieredCache
+
+"""
+In order to test behavior of the two-tier cache
+"""
+
+
+class RecordingInvalidator:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, key):
+        self.published.append(key)
+
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalLRUCache(max_items=2)
+    local.set("a", 1)
+    local.set("b", 2)
+    local.get("a")
+    local.set("c", 3)
+
+    assert local.get("a") == 1
+    assert local.get("b") is None
+    assert local.get("c") == 3
+
+
+def test_local_cache_is_bounded_by_bytes():
+    local = LocalLRUCache(max_bytes=10)
+    local.set("a", b"12345")
+    local.set("b", b"12345")
+    local.set("c", b"12345")
+
+    assert local.current_bytes == 10
+    assert local.get("a") is None
+    local.set("too-big", b"x" * 11)
+    assert local.get("too-big") is None
+
+
+def test_local_cache_entries_expire():
+    local = LocalLRUCache(ttl=0.01)
+    local.set("a", 1)
+
+    asyncio.run(asyncio.sleep(0.02))
+
+    assert local.get("a") is None
+    assert len(local) == 0
+
+
+def test_tiered_cache_reads_through_and_invalidates():
+    remote = Cache(Cache.MEMORY, namespace="tiered-test")
+    local = LocalLRUCache()
+    invalidator = RecordingInvalidator()
+    tiered = TieredCache(remote, local, invalidator)
+
+    async def scenario():
+        await remote.set("key", "remote-value")
+        first = await tiered.get("key")
+        await remote.set("key", "changed-behind-our-back")
+        second = await tiered.get("key")
+        await tiered.delete("key")
+        third = await tiered.get("key")
+        return first, second, third
+
+    assert asyncio.run(scenario()) == ("remote-value", "remote-value", None)
+    assert invalidator.published == ["key"]
+
+
+class FakePubSub:
+    def __init__(self, messages, fail):
+        self.messages = messages
+        self.fail = fail
+        self.closed = False
+
+    async def listen(self):
+        for message in self.messages:
+            yield {"data": message}
+        if self.fail:
+            raise ConnectionError("connection reset")
+        await asyncio.Event().wait()
+
+    async def close(self):
+        self.closed = True
+
+
+def test_invalidator_reconnects_and_clears_local_tier():
+    local = LocalLRUCache()
+    invalidator = RedisInvalidator(local, "localhost", 6379, "test:invalidate",
+                                   reconnect_base=0.001, reconnect_max=0.001)
+    subscriptions = [FakePubSub([b"other:a"], fail=True),
+                     FakePubSub([b"other:c"], fail=False)]
+    pending = list(subscriptions)
+    failed_reconnects = []
+
+    async def subscribe():
+        if len(pending) == 1 and not failed_reconnects:
+            failed_reconnects.append(True)
+            raise ConnectionError("redis is down")
+        return pending.pop(0)
+
+    invalidator._subscribe = subscribe
+
+    async def scenario():
+        for key in "abc":
+            local.set(key, key)
+        await invalidator.start()
+        for _ in range(100):
+            await asyncio.sleep(0.005)
+            if not pending and local.get("c") is None:
+                break
+        stale = local.get("b")
+        local.set("d", "d")
+        await invalidator.close()
+        return stale
+
+    assert asyncio.run(scenario()) is None
+    assert failed_reconnects == [True]
+    assert [pubsub.closed for pubsub in subscriptions] == [True, True]
+    assert local.get("d") == "d"